@@ -0,0 +1,462 @@
+import asyncio
+import time
+
+from asyncmqtt import MQTTException
+from asyncmqtt.packet import MQTTFixedHeader, MQTTPacket, CONNECT, PUBLISH, PUBACK, PUBREC, PUBREL, PUBCOMP, SUBSCRIBE, UNSUBSCRIBE, PINGREQ, DISCONNECT
+from asyncmqtt.packet_connect import ConnectPacket
+from asyncmqtt.packet_connack import ConnackPacket, CONNECTION_ACCEPTED, UNACCEPTABLE_PROTOCOL_VERSION, NOT_AUTHORIZED
+from asyncmqtt.packet_subscribe import SubscribePacket
+from asyncmqtt.packet_suback import SubackPacket
+from asyncmqtt.packet_unsubscribe import UnsubscribePacket
+from asyncmqtt.packet_publish import PublishPacket, SharedPublish
+from asyncmqtt.packet_ack import PubackPacket, PubrecPacket, PubrelPacket, PubcompPacket
+from asyncmqtt.packet_ping import PingReqPacket
+from asyncmqtt.packet_template import PINGRESP_BYTES, puback, pubrec, pubrel, pubcomp, unsuback
+from asyncmqtt.packet_id import PacketIDAllocator
+from asyncmqtt.inflight import InflightMessage, InflightWindow, AWAITING_PUBREC, AWAITING_PUBCOMP
+from asyncmqtt.router import Subscription, TopicMatchCache, validate_filter
+from asyncmqtt.retained import RetainedStore
+from asyncmqtt.writer import OutboundWriter
+from asyncmqtt.decoder import FrameDecoder
+
+
+# Packets a client sends.  DISCONNECT carries nothing, so it decodes as a bare MQTTPacket.
+PACKET_TYPES = {
+    CONNECT: ConnectPacket,
+    PUBLISH: PublishPacket,
+    PUBACK: PubackPacket,
+    PUBREC: PubrecPacket,
+    PUBREL: PubrelPacket,
+    PUBCOMP: PubcompPacket,
+    SUBSCRIBE: SubscribePacket,
+    UNSUBSCRIBE: UnsubscribePacket,
+    PINGREQ: PingReqPacket,
+    DISCONNECT: MQTTPacket,
+}
+
+PROTOCOL_LEVELS = {'MQTT': 4, 'MQIsdp': 3}
+
+
+class BrokerSession:
+    """
+    What the broker keeps for a client identifier: its subscriptions, the QoS 1/2 messages
+    on their way to it and the QoS 2 identifiers it sent.  A session which is not clean
+    outlives the connection, and queues QoS 1/2 messages until the client is back.
+    """
+    def __init__(self, client_id: str, clean_session: bool=True, max_inflight: int=1024,
+                 max_queued: int=1000):
+        self.client_id = client_id
+        self.clean_session = clean_session
+        self.packet_ids = PacketIDAllocator()
+        self.window = InflightWindow(self.packet_ids, max_inflight)
+        self.max_queued = max_queued
+        self.incoming_qos2 = set()
+        self.subscriptions = {}
+        self.protocol = None
+        self.dropped = 0
+
+    def __repr__(self):
+        return type(self).__name__ + '(client_id={0!r}, clean_session={1}, subscriptions={2}, connected={3})'.format(
+            self.client_id, self.clean_session, len(self.subscriptions), self.protocol is not None)
+
+    def deliver(self, shared: SharedPublish, qos: int, retain: bool=False):
+        """Send a copy of shared at qos, or queue it while disconnected or the window is full."""
+        protocol = self.protocol
+        if not qos:
+            if protocol is None or protocol.writer.bulk_size >= protocol.max_buffered:
+                # QoS 0 may be lost; a slow subscriber must not hold the broker's memory.
+                self.dropped += 1
+                return
+            protocol.writer.write(shared.buffers(retain), bulk=True)
+            return
+
+        message = InflightMessage(shared.copy(qos, retain=retain), None)
+        if protocol is None or self.window.full:
+            pending = self.window.pending
+            if len(pending) >= self.max_queued:
+                pending.popleft()
+                self.dropped += 1
+            pending.append(message)
+        else:
+            protocol.send_inflight(message)
+
+
+class MQTTServerProtocol(FrameDecoder, asyncio.Protocol):
+    """
+    The broker's side of one client connection.  The first packet must be CONNECT; after
+    CONNACK, PUBLISH packets are acknowledged and handed to the broker, which fans them out
+    to the matching sessions.  Outgoing packets are coalesced by an OutboundWriter.
+
+    A client silent for one and a half keep alive intervals is disconnected, and its will, if
+    any, is published whenever the connection ends without DISCONNECT.
+    """
+    PACKET_TYPES = PACKET_TYPES
+
+    def __init__(self, broker, max_packet_size: int=None, max_buffered: int=8388608,
+                 write_max_bytes: int=65536, write_max_delay: float=None):
+        """
+        :param max_packet_size: frames larger than this are rejected and the connection closed.
+        :param max_buffered: QoS 0 messages for this client are dropped while this many bytes
+            of PUBLISH packets are waiting to be written to it.
+        """
+        self.broker = broker
+        self.max_packet_size = max_packet_size
+        self.max_buffered = max_buffered
+        self.buffer = bytearray()
+        self.offset = 0
+        self.pending_header = None
+        self.transport = None
+        self.writer = OutboundWriter(None, write_max_bytes, write_max_delay)
+        self.session = None
+        self.will = None
+        self.keep_alive = 0
+        self.keepalive_handle = None
+        self.last_received = time.monotonic()
+        self.closed = False
+        self.exception = None
+        self.dispatch = {
+            CONNECT: self.connect_received,
+            PUBLISH: self.publish_received,
+            PUBACK: self.puback_received,
+            PUBREC: self.pubrec_received,
+            PUBREL: self.pubrel_received,
+            PUBCOMP: self.pubcomp_received,
+            SUBSCRIBE: self.subscribe_received,
+            UNSUBSCRIBE: self.unsubscribe_received,
+            PINGREQ: self.pingreq_received,
+            DISCONNECT: self.disconnect_received,
+        }
+
+    def __repr__(self):
+        return type(self).__name__ + '(client_id={0!r}, closed={1})'.format(
+            self.session.client_id if self.session is not None else None, self.closed)
+
+    def connection_made(self, transport):
+        self.transport = transport
+        self.writer.transport = transport
+        self.broker.protocols.add(self)
+
+    def connection_lost(self, exc):
+        self.closed = True
+        self.writer.clear()
+        if self.keepalive_handle is not None:
+            self.keepalive_handle.cancel()
+            self.keepalive_handle = None
+        self.broker.protocols.discard(self)
+        if self.session is not None:
+            self.broker.detach(self)
+        if self.will is not None:
+            topic, message, qos, retain = self.will
+            self.will = None
+            self.broker.publish(topic, message, qos, retain)
+
+    def pause_writing(self):
+        self.writer.pause()
+
+    def resume_writing(self):
+        self.writer.resume()
+
+    def protocol_error(self, exc: MQTTException):
+        self.exception = exc
+        self.closed = True
+        self.transport.close()
+
+    def data_received(self, data):
+        if self.closed:
+            return
+        self.last_received = time.monotonic()
+        self.buffer.extend(data)
+        self.decode_buffer()
+
+    def packet_class(self, fixed: MQTTFixedHeader):
+        if (self.session is None) != (fixed.packet_type == CONNECT):
+            # [MQTT-3.1.0-1], [MQTT-3.1.0-2]
+            raise MQTTException('unexpected packet type %x' % fixed.packet_type)
+        return super().packet_class(fixed)
+
+    def packet_received(self, packet):
+        self.dispatch[packet.fixed_header.packet_type](packet)
+
+    def send_packet(self, packet):
+        self.writer.write(packet.to_buffers(), bulk=True)
+
+    def send_inflight(self, message: InflightMessage):
+        self.session.window.add(message)
+        self.send_packet(message.packet)
+
+    def send_pending(self):
+        window = self.session.window
+        pending = window.pending
+        while pending and not window.full:
+            self.send_inflight(pending.popleft())
+
+    def connect_received(self, packet: ConnectPacket):
+        if PROTOCOL_LEVELS.get(packet.proto_name) != packet.proto_level:
+            self.refuse(UNACCEPTABLE_PROTOCOL_VERSION)
+            return
+        if packet.reserved_flag:
+            self.protocol_error(MQTTException('[MQTT-3.1.2-3] reserved flag set in CONNECT'))
+            return
+        authenticate = self.broker.authenticate
+        if authenticate is not None and not authenticate(packet.client_id, packet.username, packet.password):
+            self.refuse(NOT_AUTHORIZED)
+            return
+
+        if packet.will_flag:
+            self.will = (packet.will_topic, packet.will_message, packet.will_qos, packet.will_retain_flag)
+        self.keep_alive = packet.keep_alive
+        if self.keep_alive:
+            self.keepalive_handle = asyncio.get_event_loop().call_later(self.keep_alive * 1.5, self.check_alive)
+
+        session_present = self.broker.attach(self, packet.client_id, packet.clean_session_flag)
+        self.writer.write([ConnackPacket.build(CONNECTION_ACCEPTED, session_present).to_bytes()])
+        self.replay()
+
+    def refuse(self, return_code: int):
+        self.writer.write([ConnackPacket.build(return_code).to_bytes()])
+        self.writer.flush_all()
+        self.closed = True
+        self.transport.close()
+
+    def replay(self):
+        """Re-send what a resumed session left unacknowledged, then what it queued."""
+        for message in self.session.window.messages():
+            if message.state == AWAITING_PUBCOMP:
+                self.writer.write([pubrel(message.packet.packet_id)])
+            else:
+                message.packet.dup_flag = True
+                self.send_packet(message.packet)
+        self.send_pending()
+
+    def check_alive(self):
+        # [MQTT-3.1.2-24]
+        self.keepalive_handle = None
+        idle = time.monotonic() - self.last_received
+        limit = self.keep_alive * 1.5
+        if idle >= limit:
+            self.exception = MQTTException('no packet received for %.1f seconds' % idle)
+            self.transport.abort()
+        else:
+            self.keepalive_handle = asyncio.get_event_loop().call_later(limit - idle, self.check_alive)
+
+    def publish_received(self, packet: PublishPacket):
+        topic = packet.topic_name
+        if '+' in topic or '#' in topic:
+            raise MQTTException('[MQTT-3.3.2-2] wildcard in PUBLISH topic %r' % topic)
+        qos = packet.qos
+        if qos == 1:
+            self.writer.write([puback(packet.packet_id)])
+        elif qos == 2:
+            packet_id = packet.packet_id
+            self.writer.write([pubrec(packet_id)])
+            incoming_qos2 = self.session.incoming_qos2
+            if packet_id in incoming_qos2:
+                return
+            incoming_qos2.add(packet_id)
+        elif qos == 3:
+            raise MQTTException('[MQTT-3.3.1-4] invalid QoS 3')
+        self.broker.route(packet)
+
+    def pubrel_received(self, packet):
+        self.session.incoming_qos2.discard(packet.packet_id)
+        self.writer.write([pubcomp(packet.packet_id)])
+
+    def puback_received(self, packet):
+        if self.session.window.pop(packet.packet_id) is not None:
+            self.send_pending()
+
+    def pubrec_received(self, packet):
+        message = self.session.window.get(packet.packet_id)
+        if message is not None and message.state == AWAITING_PUBREC:
+            message.state = AWAITING_PUBCOMP
+        self.writer.write([pubrel(packet.packet_id)])
+
+    def pubcomp_received(self, packet):
+        if self.session.window.pop(packet.packet_id) is not None:
+            self.send_pending()
+
+    def subscribe_received(self, packet: SubscribePacket):
+        return_codes = [self.broker.subscribe(self.session, topic_filter, qos) for topic_filter, qos in packet.topics]
+        self.writer.write([SubackPacket.build(packet.packet_id, return_codes).to_bytes()])
+        for (topic_filter, qos), granted in zip(packet.topics, return_codes):
+            if granted != 0x80:
+                self.broker.send_retained(self.session, topic_filter, granted)
+
+    def unsubscribe_received(self, packet: UnsubscribePacket):
+        for topic_filter in packet.topics:
+            self.broker.unsubscribe(self.session, topic_filter)
+        self.writer.write([unsuback(packet.packet_id)])
+
+    def pingreq_received(self, packet):
+        self.writer.write([PINGRESP_BYTES], urgent=True)
+
+    def disconnect_received(self, packet):
+        # [MQTT-3.14.4-3]
+        self.will = None
+        self.closed = True
+        self.writer.flush_all()
+        self.transport.close()
+
+
+class MQTTBroker:
+    """
+    An MQTT 3.1.1 broker.  Subscriptions of every session live in one topic trie behind a
+    match cache, so routing a PUBLISH costs one cached lookup, and each matching session gets
+    one copy at the highest QoS granted among its matching filters, capped by the QoS the
+    message was published with.  The message is encoded once for all of them, as a
+    SharedPublish; each copy only adds its packet identifier.
+
+    Retained messages are kept in a RetainedStore, and sent to each new subscription they
+    match.  authenticate(client_id, username, password), if given, decides whether a client
+    may connect.
+    """
+    def __init__(self, max_inflight: int=1024, max_queued: int=1000, max_packet_size: int=None,
+                 max_buffered: int=8388608, match_cache_size: int=4096, authenticate=None,
+                 retained: RetainedStore=None, protocol_class=MQTTServerProtocol):
+        """
+        :param max_inflight: QoS 1/2 messages which may await acknowledgement by each client.
+        :param max_queued: QoS 1/2 messages queued per session beyond that, or while a
+            persistent session is disconnected; the oldest are dropped first.
+        :param retained: the retained message store, an unbounded one by default.  If it has a
+            snapshot_path, it is saved there when the broker is closed.
+        """
+        self.max_inflight = max_inflight
+        self.max_queued = max_queued
+        self.max_packet_size = max_packet_size
+        self.max_buffered = max_buffered
+        self.authenticate = authenticate
+        self.protocol_class = protocol_class
+        self.router = TopicMatchCache(maxsize=match_cache_size)
+        self.retained = retained if retained is not None else RetainedStore()
+        self.sessions = {}
+        self.protocols = set()
+        self.server = None
+        self.messages_received = 0
+        self.messages_sent = 0
+
+    def __repr__(self):
+        return type(self).__name__ + '(sessions={0}, connections={1})'.format(len(self.sessions), len(self.protocols))
+
+    def stats(self) -> dict:
+        return {
+            'sessions': len(self.sessions),
+            'connections': len(self.protocols),
+            'subscriptions': len(self.router),
+            'messages_received': self.messages_received,
+            'messages_sent': self.messages_sent,
+            'dropped': sum(session.dropped for session in self.sessions.values()),
+            'match_cache': self.router.stats(),
+            'retained': self.retained.stats(),
+        }
+
+    def protocol_factory(self) -> MQTTServerProtocol:
+        return self.protocol_class(self, max_packet_size=self.max_packet_size, max_buffered=self.max_buffered)
+
+    async def start(self, host: str='127.0.0.1', port: int=1883, ssl=None):
+        """Listen on host and port; port 0 picks a free one, see the port property."""
+        loop = asyncio.get_event_loop()
+        self.server = await loop.create_server(self.protocol_factory, host, port, ssl=ssl)
+        return self.server
+
+    @property
+    def port(self) -> int:
+        return self.server.sockets[0].getsockname()[1]
+
+    def close(self):
+        if self.server is not None:
+            self.server.close()
+        for protocol in list(self.protocols):
+            protocol.transport.close()
+        if self.retained.snapshot_path is not None:
+            self.retained.snapshot()
+
+    async def wait_closed(self):
+        if self.server is not None:
+            await self.server.wait_closed()
+
+    def attach(self, protocol: MQTTServerProtocol, client_id: str, clean_session: bool) -> bool:
+        """Give protocol the session of client_id.  Returns whether an earlier one was resumed."""
+        session = self.sessions.get(client_id)
+        if session is not None and session.protocol is not None:
+            # [MQTT-3.1.4-2] The new connection takes over.
+            old = session.protocol
+            session.protocol = None
+            old.closed = True
+            old.transport.close()
+        if session is not None and clean_session:
+            self.end_session(session)
+            session = None
+
+        session_present = session is not None
+        if session is None:
+            session = BrokerSession(client_id, clean_session, self.max_inflight, self.max_queued)
+            self.sessions[client_id] = session
+        session.protocol = protocol
+        protocol.session = session
+        return session_present
+
+    def detach(self, protocol: MQTTServerProtocol):
+        session = protocol.session
+        if session.protocol is protocol:
+            session.protocol = None
+            if session.clean_session:
+                self.end_session(session)
+
+    def end_session(self, session: BrokerSession):
+        for topic_filter in session.subscriptions:
+            self.router.remove(topic_filter, session)
+        session.subscriptions.clear()
+        if self.sessions.get(session.client_id) is session:
+            del self.sessions[session.client_id]
+
+    def subscribe(self, session: BrokerSession, topic_filter: str, qos: int) -> int:
+        """Subscribe session to topic_filter, replacing an earlier subscription to it; returns the SUBACK code."""
+        if qos > 2:
+            return 0x80
+        try:
+            validate_filter(topic_filter)
+        except MQTTException:
+            return 0x80
+        if topic_filter in session.subscriptions:
+            self.router.remove(topic_filter, session)
+        session.subscriptions[topic_filter] = qos
+        self.router.add(Subscription(topic_filter, qos, session))
+        return qos
+
+    def unsubscribe(self, session: BrokerSession, topic_filter: str):
+        if session.subscriptions.pop(topic_filter, None) is not None:
+            self.router.remove(topic_filter, session)
+
+    def publish(self, topic: str, data, qos: int=0, retain: bool=False):
+        """Publish a message from the broker itself, as if a client had sent it."""
+        self.route(PublishPacket.build(topic, data, None, False, qos, retain))
+
+    def send_retained(self, session: BrokerSession, topic_filter: str, granted: int):
+        # [MQTT-3.3.1-6]
+        for shared, qos in self.retained.match(topic_filter):
+            session.deliver(shared, min(qos, granted), retain=True)
+
+    def route(self, packet: PublishPacket):
+        self.messages_received += 1
+        shared = None
+        if packet.retain_flag:
+            shared = SharedPublish.from_packet(packet)
+            self.retained.set(shared, packet.qos)
+        subscriptions = self.router.match(packet.topic_name)
+        if not subscriptions:
+            return
+        if len(subscriptions) == 1:
+            subscription = subscriptions[0]
+            targets = {subscription.handler: subscription.qos}
+        else:
+            targets = {}
+            for subscription in subscriptions:
+                session = subscription.handler
+                if subscription.qos >= targets.get(session, 0):
+                    targets[session] = subscription.qos
+        qos = packet.qos
+        if shared is None:
+            shared = SharedPublish.from_packet(packet)
+        for session, granted in targets.items():
+            session.deliver(shared, min(qos, granted))
+        self.messages_sent += len(targets)
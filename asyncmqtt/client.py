@@ -1,85 +1,721 @@
 import asyncio
+import math
+import os
+import warnings
+from functools import partial
 
 
 from asyncmqtt import MQTTException
-from asyncmqtt.util import bytes_as_hex
+from asyncmqtt.util import bytes_as_hex, buffer_length
 from asyncmqtt.packet import MQTTFixedHeader, CONNECT, CONNACK, PUBLISH, PUBACK, PUBREC, PUBREL, PUBCOMP, SUBSCRIBE, SUBACK, UNSUBSCRIBE, UNSUBACK, PINGREQ, PINGRESP, DISCONNECT
 from asyncmqtt.packet_ping import PingReqPacket, PingRespPacket
 from asyncmqtt.packet_connect import ConnectPacket
 from asyncmqtt.packet_connack import ConnackPacket
 from asyncmqtt.packet_subscribe import SubscribePacket
 from asyncmqtt.packet_suback import SubackPacket
-from asyncmqtt.packet_publish import PublishPacket
+from asyncmqtt.packet_unsubscribe import UnsubscribePacket
+from asyncmqtt.packet_publish import PublishPacket, PublishVariableHeader
+from asyncmqtt.packet_ack import PubackPacket, PubrecPacket, PubrelPacket, PubcompPacket, UnsubackPacket
+from asyncmqtt.packet_template import PINGREQ_BYTES, DISCONNECT_BYTES, puback, pubrec, pubrel, pubcomp
+from asyncmqtt.stream import PublishStream
+from asyncmqtt.writer import OutboundWriter
+from asyncmqtt.keepalive import KeepAlive
+from asyncmqtt.inflight import InflightMessage, AWAITING_PUBREC, AWAITING_PUBCOMP
+from asyncmqtt.router import Subscription
+from asyncmqtt.session import MQTTSession
+from asyncmqtt.decoder import FrameDecoder
 
 
 PACKET_TYPES = {
     CONNECT: ConnectPacket,
     CONNACK: ConnackPacket,
     PUBLISH: PublishPacket,
+    PUBACK: PubackPacket,
+    PUBREC: PubrecPacket,
+    PUBREL: PubrelPacket,
+    PUBCOMP: PubcompPacket,
     SUBSCRIBE: SubscribePacket,
     SUBACK: SubackPacket,
+    UNSUBSCRIBE: UnsubscribePacket,
+    UNSUBACK: UnsubackPacket,
     PINGREQ: PingReqPacket,
     PINGRESP: PingRespPacket,
 }
 
 
-class MQTTClientProtocol(asyncio.Protocol):
-    def __init__(self):
-        self.msgq = asyncio.Queue()
+class MQTTClientProtocol(FrameDecoder, asyncio.Protocol):
+    PACKET_TYPES = PACKET_TYPES
+    STREAM_CHUNK_SIZE = 65536
+    STREAM_BUFFER_LIMIT = 1048576
+
+    def __init__(self, stream_threshold: int=None, max_packet_size: int=None, max_inflight: int=1024,
+                 match_cache_size: int=4096, match_cache_policy: str='lru',
+                 queue_high_water: int=None, queue_low_water: int=None,
+                 write_max_bytes: int=65536, write_max_delay: float=None, write_fairness: int=16,
+                 keep_alive: int=0, ping_timeout: float=None, session: MQTTSession=None, store=None):
+        """
+        :param stream_threshold: PUBLISH packets whose remaining length exceeds this are delivered
+            as soon as their headers are decoded, with the payload readable from packet.stream.
+        :param max_packet_size: frames larger than this are rejected and the connection closed.
+        :param max_inflight: number of outgoing QoS 1/2 messages which may await acknowledgement
+            at once; further publishes are queued until a slot frees up.
+        :param match_cache_size: number of topics whose matching subscriptions are cached.
+        :param match_cache_policy: eviction policy of that cache, 'lru' or 'fifo'.
+        :param queue_high_water: reading from the socket is paused while msgq holds this many
+            messages, and resumed once it has drained to queue_low_water (half by default).
+            msgq is unbounded if not set.
+        :param write_max_bytes: outgoing packets are coalesced into one write per event loop
+            iteration, or sooner once this many bytes are buffered.
+        :param write_max_delay: if set, coalesce writes for up to this many seconds instead.
+        :param write_fairness: while the transport has paused writing, PUBLISH packets wait behind
+            control packets, but one is written after this many writes of control packets.
+        :param keep_alive: keep alive interval in seconds sent in CONNECT.  If set, a PINGREQ is
+            sent whenever the connection has been idle that long.
+        :param ping_timeout: the connection is aborted if a PINGREQ goes unanswered this long
+            (keep_alive by default).
+        :param session: state shared with earlier connections.  If given, it replaces
+            max_inflight, the match cache and queue settings, which configure a new session.
+        :param store: a SegmentLog in which a new session keeps outgoing QoS 1/2 messages
+            until they are acknowledged.  The session is then persistent, so its messages
+            are not failed when the connection is lost.
+        """
         self.buffer = bytearray()
+        self.offset = 0
+        self.pending_header = None
+        self.stream_threshold = stream_threshold
+        self.max_packet_size = max_packet_size
+        self.incoming_stream = None
+        self.stream_ack = None
+        self.exception = None
         self.transport = None
-        self.packet_id = 0
+        self.write_paused = False
+        self.drain_waiter = None
+        self.stream_lock = asyncio.Lock()
+        self.writer = OutboundWriter(None, write_max_bytes, write_max_delay, write_fairness)
+        if session is None:
+            session = MQTTSession(max_inflight=max_inflight, match_cache_size=match_cache_size,
+                                  match_cache_policy=match_cache_policy,
+                                  queue_high_water=queue_high_water, queue_low_water=queue_low_water,
+                                  persistent=store is not None, store=store)
+        self.session = session
+        self.packet_ids = session.packet_ids
+        self.window = session.window
+        self.incoming_qos2 = session.incoming_qos2
+        self.router = session.router
+        self.read_holds = session.read_holds
+        self.msgq = session.msgq
+        self.connack = None
+        self.closed = False
+        self.close_waiter = None
+        self.keep_alive = keep_alive
+        self.keepalive = None
+        if keep_alive:
+            self.keepalive = KeepAlive(keep_alive, self.keepalive_ping, self.keepalive_expired, ping_timeout)
+            self.writer.on_write = self.keepalive.sent
+        self.dispatch = {
+            CONNACK: self.connack_received,
+            PUBLISH: self.publish_received,
+            PUBACK: self.puback_received,
+            PUBREC: self.pubrec_received,
+            PUBREL: self.pubrel_received,
+            PUBCOMP: self.pubcomp_received,
+            SUBACK: self.suback_received,
+            UNSUBACK: self.unsuback_received,
+            PINGRESP: self.pingresp_received,
+        }
 
     @property
     def next_packet_id(self):
-        self.packet_id += 1
-        return self.packet_id % 65535
+        """
+        Deprecated: an identifier which is free right now, but is not reserved.  Use
+        packet_ids.allocate(operation) and release it once the operation completes.
+        """
+        warnings.warn('next_packet_id is deprecated, use packet_ids.allocate()', DeprecationWarning, stacklevel=2)
+        packet_id = self.packet_ids.allocate()
+        # Released at the back of the free list, so it is not handed out again soon.
+        self.packet_ids.release(packet_id)
+        return packet_id
 
     def connection_made(self, transport):
         self.transport = transport
+        self.writer.transport = transport
+        self.session.protocol = self
+        if self.read_holds:
+            # A queue of the session is still above its high water mark.
+            transport.pause_reading()
+
+    def connection_lost(self, exc):
+        exc = exc or ConnectionResetError('Connection lost')
+        self.closed = True
+        self.writer.clear()
+        if self.keepalive is not None:
+            self.keepalive.stop()
+        if self.session.protocol is self:
+            self.session.protocol = None
+        self.wake_drain_waiter(exc)
+        if self.session.persistent:
+            self.window.fail_unreplayable(exc)
+        else:
+            self.window.fail_all(exc)
+        for packet_id, operation in list(self.packet_ids.in_use.items()):
+            if isinstance(operation, asyncio.Future):
+                self.packet_ids.release(packet_id)
+                if not operation.done():
+                    operation.set_exception(exc)
+        if self.incoming_stream is not None and self.incoming_stream[0] is not None:
+            self.incoming_stream[0].set_exception(exc)
+        self.incoming_stream = None
+        self.stream_ack = None
+        for reason in [r for r in self.read_holds if isinstance(r, PublishStream)]:
+            self.read_holds.discard(reason)
+        if self.connack is not None and not self.connack.done():
+            self.connack.set_exception(exc)
+            # Mark it retrieved; callers which don't wait for CONNACK shouldn't get a warning.
+            self.connack.exception()
+        if self.close_waiter is not None and not self.close_waiter.done():
+            self.close_waiter.set_result(None)
+
+    async def wait_closed(self):
+        """Wait until the connection has been lost."""
+        if not self.closed:
+            if self.close_waiter is None:
+                self.close_waiter = asyncio.get_event_loop().create_future()
+            await self.close_waiter
+
+    def protocol_error(self, exc: MQTTException):
+        self.exception = exc
+        self.transport.close()
+
+    def hold_reading(self, reason):
+        """Pause reading from the transport until every hold has been released."""
+        if not self.read_holds and not self.transport.is_closing():
+            self.transport.pause_reading()
+        self.read_holds.add(reason)
+
+    def release_reading(self, reason):
+        if reason not in self.read_holds:
+            return
+        self.read_holds.discard(reason)
+        if not self.read_holds and not self.transport.is_closing():
+            self.transport.resume_reading()
+
+    def message_queue(self, high_water: int=None, low_water: int=None):
+        return self.session.message_queue(high_water, low_water)
+
+    def metrics(self) -> dict:
+        return {
+            'msgq': self.msgq.stats(),
+            'reading_paused': bool(self.read_holds),
+            'inflight': len(self.window),
+            'pending': len(self.window.pending),
+            'writer': self.writer.stats(),
+            'keepalive': self.keepalive.stats() if self.keepalive is not None else None,
+            'store': self.session.store.stats() if self.session.store is not None else None,
+        }
+
+    def pause_writing(self):
+        self.write_paused = True
+        self.writer.pause()
+
+    def resume_writing(self):
+        self.write_paused = False
+        self.writer.resume()
+        self.wake_drain_waiter()
+
+    def wake_drain_waiter(self, exc=None):
+        waiter, self.drain_waiter = self.drain_waiter, None
+        if waiter is not None and not waiter.done():
+            if exc is None:
+                waiter.set_result(None)
+            else:
+                waiter.set_exception(exc)
+
+    async def drain(self):
+        """Wait until the transport's write buffer is below its high-water mark."""
+        if self.transport.is_closing():
+            raise ConnectionResetError('Connection lost')
+        if not self.write_paused:
+            return
+        self.drain_waiter = asyncio.get_event_loop().create_future()
+        await self.drain_waiter
 
     def data_received(self, data):
+        if self.keepalive is not None:
+            self.keepalive.received()
         self.buffer.extend(data)
         self.decode_buffer()
 
     def message_received(self, message):
         self.msgq.put_nowait(message)
 
-    def decode_buffer(self):
-        global PACKET_TYPES
+    def packet_received(self, packet):
+        handler = self.dispatch.get(packet.fixed_header.packet_type)
+        if handler is not None:
+            handler(packet)
+        else:
+            self.message_received(packet)
 
-        while self.buffer:
-            try:
-                fixed = MQTTFixedHeader.from_bytes(self.buffer)
-            except MQTTException:
-                return
+    def publish_received(self, packet):
+        qos = packet.qos
+        if qos == 2 and packet.packet_id in self.incoming_qos2:
+            # Redelivery of a message which was already delivered, awaiting PUBREL.
+            self.write_buffers([pubrec(packet.packet_id)])
+            if packet.stream is not None and self.incoming_stream is not None:
+                # Nobody reads its payload, so it is discarded as it arrives.
+                self.incoming_stream = (None, self.incoming_stream[1])
+            return
+        if qos and packet.stream is not None and not packet.stream.eof:
+            # Not acknowledged until the whole payload has arrived, so the sender publishes
+            # it again if the connection is lost first.
+            self.stream_ack = packet
+        else:
+            self.acknowledge(packet)
+        self.route_publish(packet)
 
-            msgsize = fixed.bytes_length + fixed.remaining_length
-            if msgsize > len(self.buffer):
-                return
+    def acknowledge(self, packet):
+        if packet.qos == 1:
+            self.write_buffers([puback(packet.packet_id)])
+        elif packet.qos == 2:
+            self.write_buffers([pubrec(packet.packet_id)])
+            self.incoming_qos2.add(packet.packet_id)
 
-            workbuf = self.buffer[:msgsize]
-            self.buffer = self.buffer[msgsize:]
+    def route_publish(self, packet):
+        """
+        Deliver a PUBLISH once to each handler with a subscription whose filter matches its
+        topic, or to msgq if none does.  A streamed payload can only be read by one of them.
+        """
+        subscriptions = self.router.match(packet.topic_name)
+        if not subscriptions:
+            self.message_received(packet)
+        elif len(subscriptions) == 1:
+            subscriptions[0].deliver(packet)
+        else:
+            handlers = []
+            for subscription in subscriptions:
+                if subscription.handler not in handlers:
+                    handlers.append(subscription.handler)
+                    subscription.deliver(packet)
 
-            ptcons = PACKET_TYPES.get(fixed.packet_type, None)
-            if not ptcons:
-                print('Undefined handler for packet type %x' % fixed.packet_type)
+    def pubrel_received(self, packet):
+        self.incoming_qos2.discard(packet.packet_id)
+        self.write_buffers([pubcomp(packet.packet_id)])
 
-            packet = ptcons.from_bytes(workbuf)
-            self.message_received(packet)
+    def puback_received(self, packet):
+        message = self.window.pop(packet.packet_id)
+        if message is not None:
+            self.session.forget(message)
+            message.complete()
+            self.send_pending()
 
-    def connect(self, username: str=None, password: str=None):
+    def pubrec_received(self, packet):
+        message = self.window.get(packet.packet_id)
+        if message is not None and message.state == AWAITING_PUBREC:
+            message.state = AWAITING_PUBCOMP
+            self.session.checkpoint(message)
+        self.write_buffers([pubrel(packet.packet_id)])
+
+    def pubcomp_received(self, packet):
+        message = self.window.pop(packet.packet_id)
+        if message is not None:
+            self.session.forget(message)
+            message.complete()
+            self.send_pending()
+
+    def suback_received(self, packet):
+        self.operation_acked(packet.packet_id, packet.return_codes)
+        self.message_received(packet)
+
+    def unsuback_received(self, packet):
+        self.operation_acked(packet.packet_id, None)
+        self.message_received(packet)
+
+    def operation_acked(self, packet_id: int, result):
+        operation = self.packet_ids.get(packet_id)
+        if isinstance(operation, asyncio.Future):
+            self.packet_ids.release(packet_id)
+            if not operation.done():
+                operation.set_result(result)
+            self.send_pending()
+
+    def connack_received(self, packet):
+        if self.connack is not None and not self.connack.done():
+            self.connack.set_result(packet)
+        self.message_received(packet)
+
+    def pingresp_received(self, packet):
+        if self.keepalive is not None:
+            self.keepalive.pong()
+
+    def keepalive_ping(self):
+        # While a streamed PUBLISH holds the writer, its chunks are traffic enough; a PINGREQ
+        # would only be written after them, with its timeout running all the while.
+        if not self.writer.held:
+            self.ping()
+
+    def keepalive_expired(self):
+        self.exception = MQTTException('no PINGRESP within %s seconds' % self.keepalive.timeout)
+        self.transport.abort()
+
+    def streams(self, fixed: MQTTFixedHeader) -> bool:
+        return self.stream_threshold is not None and fixed.packet_type == PUBLISH and \
+            fixed.remaining_length > self.stream_threshold
+
+    def start_stream(self, buffer, fixed: MQTTFixedHeader, header_length: int) -> int:
+        """
+        Deliver a large PUBLISH as soon as its variable header is available.  Returns the number
+        of bytes consumed, or 0 if the variable header is still incomplete.
+        """
+        needed = header_length + 2
+        if len(buffer) < needed:
+            return 0
+        needed += (buffer[header_length] << 8) | buffer[header_length + 1]
+        if fixed.flags & PublishPacket.QOS_FLAG:
+            needed += 2
+        if needed > header_length + fixed.remaining_length:
+            self.protocol_error(MQTTException('PUBLISH topic and packet identifier overrun the %d byte frame' %
+                                              (header_length + fixed.remaining_length)))
+            self.pending_header = None
+            return len(buffer)
+        if len(buffer) < needed:
+            return 0
+
+        variable_header, consumed = PublishVariableHeader.decode(buffer[header_length:needed], fixed)
+        length = fixed.remaining_length - consumed
+        stream = PublishStream(length, self.STREAM_BUFFER_LIMIT,
+                               lambda: self.hold_reading(stream), lambda: self.release_reading(stream))
+        packet = PublishPacket(fixed, variable_header)
+        packet.stream = stream
+        self.pending_header = None
+        if length:
+            self.incoming_stream = (stream, length)
+        self.packet_received(packet)
+        return needed
+
+    def feed_stream(self, view, offset: int, end: int) -> int:
+        stream, remaining = self.incoming_stream
+        size = min(remaining, end - offset)
+        if stream is not None:
+            stream.feed(bytes(view[offset:offset + size]))
+        if size == remaining:
+            self.incoming_stream = None
+            if self.stream_ack is not None:
+                packet, self.stream_ack = self.stream_ack, None
+                self.acknowledge(packet)
+        else:
+            self.incoming_stream = (stream, remaining - size)
+        return offset + size
+
+    def connect(self, username: str=None, password: str=None, clean_session: bool=None) -> asyncio.Future:
+        """Send CONNECT.  Returns a future which resolves to the CONNACK packet."""
         cp = ConnectPacket()
+        cp.client_id = self.session.client_id
         if username:
             cp.username = username
         if password:
             cp.password = password
-        self.transport.write(cp.to_bytes())
+        if clean_session is not None:
+            cp.clean_session_flag = clean_session
+        cp.keep_alive = math.ceil(self.keep_alive)
+        self.connack = asyncio.get_event_loop().create_future()
+        self.send_packet(cp)
+        if self.keepalive is not None:
+            self.keepalive.start()
+        return self.connack
+
+    def replay(self):
+        """
+        Re-send the inflight messages of a resumed session in their original order, PUBLISH
+        with the dup flag or PUBREL depending on how far each got, then the queued ones.
+        """
+        for message in self.window.messages():
+            if message.state == AWAITING_PUBCOMP:
+                self.write_buffers([pubrel(message.packet.packet_id)])
+            else:
+                message.packet.dup_flag = True
+                self.send_packet(message.packet, bulk=True)
+        self.send_pending()
+
+    def subscribe(self, topics, handler=None) -> asyncio.Future:
+        """
+        Subscribe to a list of (topic filter, qos) pairs.  Returns a future which resolves to the
+        granted return codes once the SUBACK arrives.  If every packet identifier is in use, the
+        SUBSCRIBE is sent once one is released.
+
+        Matching messages are routed to handler (a callable or an asyncio.Queue), or to msgq
+        without one; a message matching several filters goes to each of their handlers once.
+        Filters the server refuses are removed from the router again; invalid ones are never
+        added, the server refuses those.
+        """
+        if handler is None:
+            handler = self.msgq
+        future = asyncio.get_event_loop().create_future()
+        subscriptions = [Subscription(topic_filter, qos, handler) for topic_filter, qos in topics]
+        for subscription in subscriptions:
+            try:
+                self.router.add(subscription)
+            except MQTTException:
+                pass
+        future.add_done_callback(partial(self.subscribe_done, subscriptions))
+        self.send_with_packet_id(partial(SubscribePacket.build, topics), future)
+        return future
+
+    def resubscribe(self, topics) -> asyncio.Future:
+        """
+        Send SUBSCRIBE for filters which are already in the router, such as those of a session
+        the server lost.  Returns a future which resolves to the granted return codes.
+        """
+        future = asyncio.get_event_loop().create_future()
+        self.send_with_packet_id(partial(SubscribePacket.build, topics), future)
+        return future
+
+    def subscribe_done(self, subscriptions: list, future: asyncio.Future):
+        if future.cancelled() or future.exception() is not None:
+            return
+        for subscription, return_code in zip(subscriptions, future.result()):
+            if return_code == 0x80:
+                self.router.remove(subscription.topic_filter, subscription.handler)
+
+    def unsubscribe(self, topic_filters: list) -> asyncio.Future:
+        """
+        Unsubscribe from a list of topic filters, removing their handlers.  Returns a future
+        which resolves once the UNSUBACK arrives.
+        """
+        for topic_filter in topic_filters:
+            self.router.remove(topic_filter)
+        future = asyncio.get_event_loop().create_future()
+        self.send_with_packet_id(partial(UnsubscribePacket.build, topic_filters), future)
+        return future
+
+    def send_with_packet_id(self, build, future: asyncio.Future):
+        """Send build(packet_id) under an identifier tied to future, waiting for one if need be."""
+        if self.closed:
+            future.set_exception(ConnectionResetError('Connection lost'))
+        elif self.packet_ids.exhausted:
+            asyncio.ensure_future(self.send_when_packet_id_free(build, future))
+        else:
+            self.send_packet(build(self.packet_ids.allocate(future)))
+
+    async def send_when_packet_id_free(self, build, future: asyncio.Future):
+        await self.packet_ids.wait()
+        if self.closed:
+            if not future.done():
+                future.set_exception(ConnectionResetError('Connection lost'))
+            return
+        self.send_packet(build(self.packet_ids.allocate(future)))
+
+    def send_packet(self, packet, bulk: bool=False):
+        """Write a packet as a vectored write, so a PUBLISH payload is not copied in Python."""
+        self.writer.write(packet.to_buffers(), False, bulk)
+
+    def write_buffers(self, buffers: list, urgent: bool=False):
+        """
+        Queue control packet buffers for the next coalesced write, or write them now if urgent.
+        They are written ahead of any PUBLISH packets still buffered.
+        """
+        self.writer.write(buffers, urgent)
+
+    def publish(self, topic: str, data, qos: int=0, retain: bool=False) -> asyncio.Future:
+        """
+        Publish data to topic.  Returns a future which resolves once the QoS flow has completed:
+        immediately for QoS 0, on PUBACK for QoS 1 and on PUBCOMP for QoS 2.  Publishes beyond
+        the inflight window, or made while every packet identifier is in use, are queued and
+        sent in order as acknowledgements arrive.
+
+        Once the connection has been lost, the future fails with ConnectionResetError, except
+        that a QoS 1/2 message of a persistent session is queued for the next connection.
+        """
+        future = asyncio.get_event_loop().create_future()
+        packet = PublishPacket.build(topic, data, None, False, qos, retain)
+        if self.closed and not (qos and self.session.persistent):
+            future.set_exception(ConnectionResetError('Connection lost'))
+            return future
+        if not qos:
+            self.send_packet(packet, bulk=True)
+            future.set_result(None)
+            return future
+
+        message = InflightMessage(packet, future)
+        self.session.persist(message)
+        if self.closed or self.window.full:
+            self.window.pending.append(message)
+        else:
+            self.send_inflight(message)
+        return future
+
+    def send_inflight(self, message: InflightMessage):
+        self.window.add(message)
+        self.session.checkpoint(message)
+        self.send_packet(message.packet, bulk=True)
+
+    def send_pending(self):
+        pending = self.window.pending
+        while pending and not self.window.full:
+            message = pending.popleft()
+            if message.future is not None and message.future.cancelled():
+                # Never sent, so it can be dropped.
+                self.session.forget(message)
+            else:
+                self.send_inflight(message)
+
+    def ping(self):
+        self.write_buffers([PINGREQ_BYTES], urgent=True)
+        if self.keepalive is not None:
+            self.keepalive.ping_sent()
+
+    def disconnect(self):
+        self.writer.write([DISCONNECT_BYTES], bulk=True)
+        self.writer.flush_all()
+        self.transport.close()
+
+    async def publish_stream(self, topic: str, source, length: int, qos: int=0, retain: bool=False,
+                             chunk_size: int=None):
+        """
+        Publish a payload of length bytes without holding it in memory.  source is a file path,
+        a binary file object, a buffer (mmap, memoryview, bytes) or an async iterator of byte
+        chunks.  The headers are written first, then the payload is written in chunks, waiting
+        for the transport's write buffer to drain between chunks.  Buffer sources are written
+        without copying, so they must stay valid until the transport has sent them.
 
-    def subscribe(self, topics):
-        sp = SubscribePacket.build(topics, self.next_packet_id)
-        self.transport.write(sp.to_bytes())
+        For QoS 1/2 this returns once the flow has completed.  The message takes an inflight
+        slot, but is never queued behind the window or retransmitted, since the source can
+        only be read once.
+        """
+        if isinstance(source, (str, os.PathLike)):
+            with open(source, 'rb') as f:
+                return await self.publish_stream(topic, f, length, qos, retain, chunk_size)
+        if not hasattr(source, '__aiter__') and not hasattr(source, 'read') and buffer_length(source) != length:
+            raise MQTTException('buffer of %d bytes does not match length %d' % (buffer_length(source), length))
+
+        chunks = self.stream_chunks(source, length, chunk_size or self.STREAM_CHUNK_SIZE)
+        packet = PublishPacket.build(topic, None, 0 if qos else None, False, qos, retain)
+        async with self.stream_lock:
+            # The identifier is only taken under the lock, so a task cancelled while waiting
+            # for it holds none.
+            if qos:
+                message = InflightMessage(packet, asyncio.get_event_loop().create_future(), replayable=False)
+                await self.packet_ids.wait()
+                self.window.add(message)
+            header = packet.encode_header(length)
+
+            # Other packets are held back so they are not written into the middle of the payload.
+            self.writer.hold()
+            try:
+                self.writer.write_now(header)
+                sent = 0
+                async for chunk in chunks:
+                    sent += buffer_length(chunk)
+                    if sent > length:
+                        raise MQTTException('stream source is longer than the announced %d bytes' % length)
+                    self.writer.write_now(chunk)
+                    await self.drain()
+                if sent != length:
+                    raise MQTTException('stream source ended after %d of %d bytes' % (sent, length))
+            except BaseException:
+                # The frame on the wire is incomplete, so the connection can not be used anymore.
+                self.writer.clear()
+                self.writer.release()
+                if qos:
+                    self.window.pop(packet.packet_id)
+                self.transport.close()
+                raise
+
+            self.writer.release()
+
+        if qos:
+            await message.future
+        return packet
+
+    async def stream_chunks(self, source, length: int, chunk_size: int):
+        if hasattr(source, '__aiter__'):
+            async for chunk in source:
+                yield chunk
+        elif hasattr(source, 'read'):
+            loop = asyncio.get_event_loop()
+            remaining = length
+            while remaining > 0:
+                chunk = await loop.run_in_executor(None, source.read, min(chunk_size, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                yield chunk
+        else:
+            with memoryview(source) as view:
+                view = view.cast('B')
+                for needle in range(0, len(view), chunk_size):
+                    yield view[needle:needle + chunk_size]
 
     async def next_message(self):
         msg = await self.msgq.get()
         return msg
+
+    async def next_messages(self, max_n: int=1024, timeout: float=None) -> list:
+        """
+        Return up to max_n messages from msgq in one call: whatever is queued already, or the
+        first to arrive within timeout seconds.  Returns an empty list on timeout.
+        """
+        return await self.msgq.get_batch(max_n, timeout)
+
+    async def batches(self, max_n: int=1024, timeout: float=None):
+        """
+        Iterate over batches of messages from msgq.  With a timeout, an empty batch is yielded
+        whenever none arrived in time, so consumers get a chance to flush.
+        """
+        while True:
+            yield await self.msgq.get_batch(max_n, timeout)
+
+
+class MQTTBufferedClientProtocol(MQTTClientProtocol, asyncio.BufferedProtocol):
+    """
+    MQTTClientProtocol variant which lets the event loop read socket data straight into a
+    preallocated arena through get_buffer()/buffer_updated(), instead of allocating a new
+    bytes object per read and copying it into the receive buffer.
+    """
+    ARENA_SIZE = 65536
+    MIN_READ_SIZE = 4096
+
+    def __init__(self, arena_size: int=None, **kwargs):
+        super().__init__(**kwargs)
+        self.arena_size = arena_size or self.ARENA_SIZE
+        self.buffer = bytearray(self.arena_size)
+        self.end = 0
+
+    def get_buffer(self, sizehint: int):
+        wanted = max(sizehint, self.MIN_READ_SIZE)
+        if self.pending_header is not None and not self.streams(self.pending_header[0]):
+            wanted = max(wanted, self.pending_header[1] - (self.end - self.offset))
+        if len(self.buffer) - self.end < wanted:
+            self.reserve(wanted)
+        return memoryview(self.buffer)[self.end:]
+
+    def buffer_updated(self, nbytes: int):
+        if self.keepalive is not None:
+            self.keepalive.received()
+        self.end += nbytes
+        self.offset = self.decode_frames(self.buffer, self.offset, self.end)
+        if self.offset == self.end:
+            self.offset = self.end = 0
+            if len(self.buffer) > self.arena_size:
+                self.buffer = bytearray(self.arena_size)
+
+    def data_received(self, data):
+        # Only used by transports without BufferedProtocol support.
+        with self.get_buffer(len(data)) as view:
+            view[:len(data)] = data
+        self.buffer_updated(len(data))
+
+    def reserve(self, size: int):
+        """
+        Make room for at least size bytes after the unread data.  The arena is compacted in
+        place when possible, and otherwise replaced; it is never resized, since the event loop
+        may still hold a view of it.  An arena grown for a large frame shrinks back once that
+        frame has been consumed.
+        """
+        unread = self.end - self.offset
+        needed = unread + size
+        if needed <= len(self.buffer) and (len(self.buffer) == self.arena_size or needed > self.arena_size):
+            self.buffer[:unread] = self.buffer[self.offset:self.end]
+        else:
+            arena = bytearray(max(needed, self.arena_size))
+            arena[:unread] = self.buffer[self.offset:self.end]
+            self.buffer = arena
+        self.offset, self.end = 0, unread
@@ -0,0 +1,106 @@
+from asyncmqtt import MQTTException
+from asyncmqtt.packet import MQTTFixedHeader
+
+
+# The packet type byte and at most four remaining length bytes.
+MAX_FIXED_HEADER_LENGTH = 5
+
+
+class FrameDecoder:
+    """
+    The receive side shared by the client and server protocols.  Received bytes are appended
+    to buffer and decoded from offset; each frame is handed to its packet class as a memoryview,
+    so frames are never copied out of the receive buffer, and the packet goes to
+    packet_received().  If a frame is incomplete, its fixed header is kept in pending_header so
+    it is not parsed again on the next read.
+
+    A frame larger than max_packet_size, of a type packet_class() refuses, or which raises
+    MQTTException while being decoded or handled, is passed to protocol_error() and ends the
+    decoding, as does a fixed header with an invalid remaining length or a handler setting
+    closed.  Subclasses may stream a large PUBLISH by overriding streams(), start_stream() and
+    feed_stream().
+    """
+    COMPACT_THRESHOLD = 65536
+    PACKET_TYPES = {}
+
+    incoming_stream = None
+    closed = False
+
+    def packet_class(self, fixed: MQTTFixedHeader):
+        cls = self.PACKET_TYPES.get(fixed.packet_type)
+        if cls is None:
+            raise MQTTException('unexpected packet type %x' % fixed.packet_type)
+        return cls
+
+    def decode_buffer(self):
+        self.offset = self.decode_frames(self.buffer, self.offset, len(self.buffer))
+        self.compact_buffer()
+
+    def decode_frames(self, buffer, offset: int, end: int) -> int:
+        """
+        Decode every complete frame in buffer[offset:end] and return the offset of the first
+        byte that was not consumed.
+        """
+        with memoryview(buffer) as view:
+            while offset < end and not self.closed:
+                if self.incoming_stream is not None:
+                    offset = self.feed_stream(view, offset, end)
+                    continue
+
+                if self.pending_header is None:
+                    # Decoded from buffer itself, which may hold stale bytes past end, so a
+                    # header is only complete or invalid once it lies within end.
+                    try:
+                        fixed, header_length = MQTTFixedHeader.decode(buffer, offset)
+                    except MQTTException as exc:
+                        if end - offset < MAX_FIXED_HEADER_LENGTH:
+                            break
+                        self.protocol_error(exc)
+                        return end
+                    if offset + header_length > end:
+                        break
+                    msgsize = header_length + fixed.remaining_length
+                    if self.max_packet_size is not None and msgsize > self.max_packet_size:
+                        self.protocol_error(MQTTException('packet of %d bytes exceeds maximum packet size %d' %
+                                                          (msgsize, self.max_packet_size)))
+                        return end
+                    self.pending_header = (fixed, msgsize, header_length)
+
+                fixed, msgsize, header_length = self.pending_header
+                if self.streams(fixed):
+                    consumed = self.start_stream(view[offset:end], fixed, header_length)
+                    if not consumed:
+                        break
+                    offset += consumed
+                    continue
+
+                if offset + msgsize > end:
+                    break
+
+                self.pending_header = None
+                try:
+                    with view[offset:offset + msgsize] as workbuf:
+                        packet = self.packet_class(fixed).from_bytes(workbuf)
+                    offset += msgsize
+                    self.packet_received(packet)
+                except MQTTException as exc:
+                    self.protocol_error(exc)
+                    return end
+
+        return offset
+
+    def streams(self, fixed: MQTTFixedHeader) -> bool:
+        return False
+
+    def compact_buffer(self):
+        """
+        Drop consumed bytes from the front of the receive buffer.  This is done only when the
+        buffer is fully drained or the consumed prefix has grown large, so a burst of small
+        frames costs one move instead of one per frame.
+        """
+        if self.offset == len(self.buffer):
+            self.buffer.clear()
+            self.offset = 0
+        elif self.offset >= self.COMPACT_THRESHOLD:
+            del self.buffer[:self.offset]
+            self.offset = 0
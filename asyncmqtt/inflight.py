@@ -0,0 +1,104 @@
+import collections
+
+from asyncmqtt.packet_id import PacketIDAllocator
+
+
+# States of an outgoing QoS 1/2 flow.
+AWAITING_PUBACK = 1
+AWAITING_PUBREC = 2
+AWAITING_PUBCOMP = 3
+
+
+class InflightMessage:
+    """
+    An outgoing QoS 1/2 PUBLISH and the future resolved when its flow completes, if anybody
+    waits for it.  Messages whose payload was streamed can not be replayed on a new connection.
+    record is the message's sequence number in the session's store, if it was written there.
+    """
+    __slots__ = ('packet', 'future', 'state', 'replayable', 'record')
+
+    def __init__(self, packet, future, replayable: bool=True):
+        self.packet = packet
+        self.future = future
+        self.state = AWAITING_PUBACK if packet.qos == 1 else AWAITING_PUBREC
+        self.replayable = replayable
+        self.record = None
+
+    def __repr__(self):
+        return type(self).__name__ + '(packet_id={0}, state={1})'.format(self.packet.packet_id, self.state)
+
+    def complete(self):
+        if self.future is not None and not self.future.done():
+            self.future.set_result(None)
+
+    def fail(self, exc: Exception):
+        if self.future is not None and not self.future.done():
+            self.future.set_exception(exc)
+
+
+class InflightWindow:
+    """
+    Outgoing QoS 1/2 messages.  At most max_inflight of them are on the wire at once; the rest
+    wait in FIFO order for a slot, so publishes are pipelined instead of waiting for each
+    acknowledgement in turn.  Messages on the wire are registered in the packet identifier
+    allocator under their identifier, and release it when their flow completes.
+    """
+    def __init__(self, packet_ids: PacketIDAllocator, max_inflight: int=1024):
+        self.packet_ids = packet_ids
+        self.max_inflight = max_inflight
+        self.count = 0
+        self.pending = collections.deque()
+
+    def __repr__(self):
+        return type(self).__name__ + '(inflight={0}, pending={1}, max_inflight={2})'.format(
+            self.count, len(self.pending), self.max_inflight)
+
+    def __len__(self):
+        return self.count
+
+    @property
+    def full(self) -> bool:
+        return self.count >= self.max_inflight or self.packet_ids.exhausted
+
+    def add(self, message: InflightMessage) -> int:
+        """Allocate a packet identifier for message and count it as inflight."""
+        packet_id = self.packet_ids.allocate(message)
+        message.packet.packet_id = packet_id
+        self.count += 1
+        return packet_id
+
+    def restore(self, message: InflightMessage, packet_id: int):
+        """Count message as inflight under the identifier it was sent with before."""
+        self.packet_ids.claim(packet_id, message)
+        message.packet.packet_id = packet_id
+        self.count += 1
+
+    def get(self, packet_id: int) -> InflightMessage:
+        message = self.packet_ids.get(packet_id)
+        if type(message) is InflightMessage:
+            return message
+        return None
+
+    def pop(self, packet_id: int) -> InflightMessage:
+        message = self.get(packet_id)
+        if message is not None:
+            self.packet_ids.release(packet_id)
+            self.count -= 1
+        return message
+
+    def messages(self) -> list:
+        """Messages on the wire, in the order they were sent."""
+        return [message for message in self.packet_ids.in_use.values() if type(message) is InflightMessage]
+
+    def fail_all(self, exc: Exception):
+        for message in self.messages():
+            self.pop(message.packet.packet_id)
+            message.fail(exc)
+        while self.pending:
+            self.pending.popleft().fail(exc)
+
+    def fail_unreplayable(self, exc: Exception):
+        for message in self.messages():
+            if not message.replayable:
+                self.pop(message.packet.packet_id)
+                message.fail(exc)
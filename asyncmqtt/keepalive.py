@@ -0,0 +1,137 @@
+import asyncio
+import bisect
+import collections
+import time
+
+
+class RTTHistogram:
+    """Rolling window of the last size round trip times, in seconds."""
+    BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+    def __init__(self, size: int=256):
+        self.samples = collections.deque(maxlen=size)
+
+    def __repr__(self):
+        return type(self).__name__ + '(samples={0})'.format(len(self.samples))
+
+    def __len__(self):
+        return len(self.samples)
+
+    def add(self, rtt: float):
+        self.samples.append(rtt)
+
+    @property
+    def last(self) -> float:
+        return self.samples[-1] if self.samples else None
+
+    def percentile(self, p: float) -> float:
+        if not self.samples:
+            return None
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * p / 100))]
+
+    def histogram(self) -> dict:
+        """Sample counts keyed by bucket upper bound; None for samples above the last one."""
+        counts = dict.fromkeys(self.BUCKETS + (None,), 0)
+        for rtt in self.samples:
+            i = bisect.bisect_left(self.BUCKETS, rtt)
+            counts[self.BUCKETS[i] if i < len(self.BUCKETS) else None] += 1
+        return counts
+
+    def stats(self) -> dict:
+        if not self.samples:
+            return {'count': 0}
+        return {
+            'count': len(self.samples),
+            'min': min(self.samples),
+            'max': max(self.samples),
+            'mean': sum(self.samples) / len(self.samples),
+            'p50': self.percentile(50),
+            'p90': self.percentile(90),
+            'p99': self.percentile(99),
+        }
+
+
+class KeepAlive:
+    """
+    Sends a PINGREQ once the connection has been idle for interval seconds, in either direction,
+    so pings are skipped while traffic flows.  Each PINGRESP is paired with the oldest ping
+    still unanswered to record the round trip time.  If a ping goes unanswered for timeout
+    seconds, on_dead() is called; this catches a dead peer long before TCP would.
+
+    A single timer is rescheduled from the last activity timestamps, so traffic itself costs
+    no timer work.
+    """
+    def __init__(self, interval: float, ping, on_dead, timeout: float=None, rtt: RTTHistogram=None):
+        self.interval = interval
+        self.timeout = timeout if timeout is not None else interval
+        self.ping = ping
+        self.on_dead = on_dead
+        self.rtt = rtt if rtt is not None else RTTHistogram()
+        self.last_sent = self.last_received = time.monotonic()
+        self.outstanding = collections.deque()
+        self.handle = None
+        self.pings_sent = 0
+        self.pings_answered = 0
+
+    def __repr__(self):
+        return type(self).__name__ + '(interval={0}, outstanding={1})'.format(self.interval, len(self.outstanding))
+
+    def stats(self) -> dict:
+        return {
+            'pings_sent': self.pings_sent,
+            'pings_answered': self.pings_answered,
+            'outstanding': len(self.outstanding),
+            'rtt': self.rtt.stats(),
+        }
+
+    def start(self):
+        self.last_sent = self.last_received = time.monotonic()
+        self.schedule(self.interval)
+
+    def stop(self):
+        if self.handle is not None:
+            self.handle.cancel()
+            self.handle = None
+        self.outstanding.clear()
+
+    def schedule(self, delay: float):
+        if self.handle is not None:
+            self.handle.cancel()
+        self.handle = asyncio.get_event_loop().call_later(max(delay, 0), self.check)
+
+    def sent(self):
+        self.last_sent = time.monotonic()
+
+    def received(self):
+        self.last_received = time.monotonic()
+
+    def ping_sent(self):
+        """Record a PINGREQ, whether sent from here or by the user."""
+        now = time.monotonic()
+        self.outstanding.append(now)
+        self.last_sent = now
+        self.pings_sent += 1
+
+    def pong(self):
+        if self.outstanding:
+            self.rtt.add(time.monotonic() - self.outstanding.popleft())
+            self.pings_answered += 1
+
+    def check(self):
+        self.handle = None
+        now = time.monotonic()
+        if self.outstanding:
+            deadline = self.outstanding[0] + self.timeout
+            if now >= deadline:
+                self.on_dead()
+                return
+            self.schedule(deadline - now)
+            return
+
+        due = min(self.last_sent, self.last_received) + self.interval
+        if now >= due:
+            self.ping()
+            self.schedule(self.timeout)
+        else:
+            self.schedule(due - now)
@@ -0,0 +1,233 @@
+import asyncio
+import random
+import time
+from functools import partial
+
+from asyncmqtt import MQTTException
+from asyncmqtt.client import MQTTClientProtocol
+from asyncmqtt.packet_connack import CONNECTION_ACCEPTED
+from asyncmqtt.packet_publish import PublishPacket
+from asyncmqtt.inflight import InflightMessage
+from asyncmqtt.keepalive import RTTHistogram
+from asyncmqtt.session import MQTTSession
+
+
+SESSION_OPTIONS = ('max_inflight', 'match_cache_size', 'match_cache_policy', 'queue_high_water', 'queue_low_water',
+                   'store')
+
+
+def chain_future(source: asyncio.Future, target: asyncio.Future):
+    def copy(source):
+        if target.done():
+            return
+        if source.cancelled():
+            target.cancel()
+        elif source.exception() is not None:
+            target.set_exception(source.exception())
+        else:
+            target.set_result(source.result())
+    source.add_done_callback(copy)
+
+
+class MQTTManagedClient:
+    """
+    Keeps a connection to a broker up.  Lost connections are re-established with jittered
+    exponential backoff, which only starts over once a connection has stayed up for
+    min_uptime seconds, so a broker which accepts and then drops the connection is not
+    hammered with reconnects.  Each connection resumes the broker session (clean_session=False).
+    Unacknowledged QoS 1/2 messages are re-sent with the dup flag, and subscriptions are only
+    re-sent if the CONNACK says the broker lost the session.
+
+    QoS 1/2 publishes made while disconnected are queued for the next connection; QoS 0
+    publishes fail.  Messages, subscriptions and the inflight window live in one persistent
+    MQTTSession shared by each connection's protocol.  With store=SegmentLog(...), queued and
+    inflight messages also survive a restart of the process.
+    """
+    def __init__(self, host: str, port: int=1883, username: str=None, password: str=None,
+                 client_id: str=None, ssl=None, min_backoff: float=0.1, max_backoff: float=30.0,
+                 min_uptime: float=10.0, connect_timeout: float=10.0, protocol_class=MQTTClientProtocol,
+                 **protocol_kwargs):
+        """
+        :param min_backoff: upper bound of the delay before the first reconnect attempt; the
+            bound doubles with each failed attempt, up to max_backoff.
+        :param min_uptime: a connection lost sooner than this after CONNACK counts as a failed
+            attempt.
+        :param protocol_kwargs: passed on to protocol_class, or used to configure the session.
+        """
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.ssl = ssl
+        self.min_backoff = min_backoff
+        self.max_backoff = max_backoff
+        self.min_uptime = min_uptime
+        self.connect_timeout = connect_timeout
+        self.protocol_class = protocol_class
+        session_options = {k: protocol_kwargs.pop(k) for k in SESSION_OPTIONS if k in protocol_kwargs}
+        self.protocol_kwargs = protocol_kwargs
+        self.session = MQTTSession(client_id, persistent=True, **session_options)
+        self.msgq = self.session.msgq
+        self.protocol = None
+        self.subscriptions = {}
+        self.queued_requests = []
+        self.task = None
+        self.stopping = False
+        self.ready = None
+        self.disconnected_at = None
+        self.last_error = None
+        self.connects = 0
+        self.connect_failures = 0
+        self.last_recovery_time = None
+        self.recovery_times = RTTHistogram()
+
+    def __repr__(self):
+        return type(self).__name__ + '(host={0!r}, port={1}, connected={2})'.format(
+            self.host, self.port, self.connected)
+
+    @property
+    def connected(self) -> bool:
+        return self.protocol is not None and not self.protocol.closed
+
+    def metrics(self) -> dict:
+        return {
+            'connected': self.connected,
+            'connects': self.connects,
+            'connect_failures': self.connect_failures,
+            'last_recovery_time': self.last_recovery_time,
+            'recovery_times': self.recovery_times.stats(),
+            'inflight': len(self.session.window),
+            'pending': len(self.session.window.pending),
+            'protocol': self.protocol.metrics() if self.protocol is not None else None,
+        }
+
+    def start(self):
+        if self.task is None:
+            self.stopping = False
+            self.task = asyncio.ensure_future(self.run())
+
+    async def stop(self):
+        """Disconnect and stop reconnecting.  Queued and inflight messages stay in the session."""
+        self.stopping = True
+        if self.connected:
+            self.protocol.disconnect()
+        if self.task is not None:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+            self.task = None
+
+    async def wait_connected(self):
+        while not self.connected:
+            if self.ready is None or self.ready.done():
+                self.ready = asyncio.get_event_loop().create_future()
+            await self.ready
+
+    def backoff(self, attempt: int) -> float:
+        # Full jitter spreads out clients which lost the same broker at the same moment.
+        return random.uniform(0, min(self.max_backoff, self.min_backoff * 2 ** attempt))
+
+    async def run(self):
+        attempt = 0
+        while not self.stopping:
+            try:
+                protocol = await self.open()
+            except (OSError, asyncio.TimeoutError, MQTTException) as exc:
+                self.last_error = exc
+                self.connect_failures += 1
+                await asyncio.sleep(self.backoff(attempt))
+                attempt += 1
+                continue
+
+            connected_at = time.monotonic()
+            await protocol.wait_closed()
+            self.last_error = protocol.exception
+            self.protocol = None
+            self.disconnected_at = time.monotonic()
+            if self.disconnected_at - connected_at >= self.min_uptime:
+                attempt = 0
+            if not self.stopping:
+                await asyncio.sleep(self.backoff(attempt))
+                attempt += 1
+
+    async def open(self) -> MQTTClientProtocol:
+        loop = asyncio.get_event_loop()
+        factory = partial(self.protocol_class, session=self.session, **self.protocol_kwargs)
+        transport, protocol = await asyncio.wait_for(
+            loop.create_connection(factory, self.host, self.port, ssl=self.ssl), self.connect_timeout)
+        try:
+            connack = await asyncio.wait_for(
+                protocol.connect(self.username, self.password, clean_session=False), self.connect_timeout)
+            if connack.return_code != CONNECTION_ACCEPTED:
+                raise MQTTException('connection refused, return code %d' % connack.return_code)
+        except BaseException:
+            transport.close()
+            raise
+
+        if not connack.session_present:
+            # The broker has no state for us: QoS 2 identifiers it sent before are free again.
+            self.session.incoming_qos2.clear()
+            if self.subscriptions:
+                self.retrieve(protocol.resubscribe(list(self.subscriptions.items())))
+        protocol.replay()
+        queued, self.queued_requests = self.queued_requests, []
+        for send, future in queued:
+            chain_future(send(protocol), future)
+
+        self.protocol = protocol
+        self.connects += 1
+        if self.disconnected_at is not None:
+            self.last_recovery_time = time.monotonic() - self.disconnected_at
+            self.recovery_times.add(self.last_recovery_time)
+            self.disconnected_at = None
+        if self.ready is not None and not self.ready.done():
+            self.ready.set_result(None)
+        return protocol
+
+    @staticmethod
+    def retrieve(future: asyncio.Future):
+        # A failed resubscription is retried on the next connection, nobody awaits it.
+        future.add_done_callback(lambda f: f.cancelled() or f.exception())
+
+    def publish(self, topic: str, data, qos: int=0, retain: bool=False) -> asyncio.Future:
+        if self.connected:
+            return self.protocol.publish(topic, data, qos, retain)
+        future = asyncio.get_event_loop().create_future()
+        if not qos:
+            future.set_exception(ConnectionError('not connected'))
+        else:
+            packet = PublishPacket.build(topic, data, None, False, qos, retain)
+            message = InflightMessage(packet, future)
+            self.session.persist(message)
+            self.session.window.pending.append(message)
+        return future
+
+    def subscribe(self, topics, handler=None) -> asyncio.Future:
+        """Subscribe now, or on the next connection; resubscribed when a session is lost."""
+        for topic_filter, qos in topics:
+            self.subscriptions[topic_filter] = qos
+        if self.connected:
+            return self.protocol.subscribe(topics, handler)
+        return self.queue_request(lambda protocol: protocol.subscribe(topics, handler))
+
+    def unsubscribe(self, topic_filters: list) -> asyncio.Future:
+        for topic_filter in topic_filters:
+            self.subscriptions.pop(topic_filter, None)
+        if self.connected:
+            return self.protocol.unsubscribe(topic_filters)
+        for topic_filter in topic_filters:
+            self.session.router.remove(topic_filter)
+        return self.queue_request(lambda protocol: protocol.unsubscribe(topic_filters))
+
+    def queue_request(self, send) -> asyncio.Future:
+        future = asyncio.get_event_loop().create_future()
+        self.queued_requests.append((send, future))
+        return future
+
+    async def next_message(self):
+        return await self.msgq.get()
+
+    async def next_messages(self, max_n: int=1024, timeout: float=None) -> list:
+        return await self.msgq.get_batch(max_n, timeout)
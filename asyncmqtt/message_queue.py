@@ -0,0 +1,72 @@
+import asyncio
+
+
+class MessageQueue(asyncio.Queue):
+    """
+    Queue of received messages with water marks.  Once high_water messages are queued, pause()
+    is called, and resume() once consumers have drained it down to low_water.  The protocol
+    uses these to stop reading from the socket, so a slow consumer pushes back on the sender
+    through TCP flow control instead of growing the queue without bound.  put_nowait() never
+    refuses a message; the queue can overshoot high_water by what was already read.
+    """
+    def __init__(self, high_water: int=None, low_water: int=None, pause=None, resume=None):
+        super().__init__()
+        self.high_water = high_water
+        self.low_water = low_water if low_water is not None else (high_water or 0) // 2
+        self.pause = pause
+        self.resume = resume
+        self.paused = False
+        self.pause_count = 0
+        self.resume_count = 0
+        self.max_depth = 0
+
+    def __repr__(self):
+        return type(self).__name__ + '(high_water={0}, low_water={1}, stats={2!r})'.format(
+            self.high_water, self.low_water, self.stats())
+
+    def stats(self) -> dict:
+        return {
+            'depth': self.qsize(),
+            'max_depth': self.max_depth,
+            'paused': self.paused,
+            'pause_count': self.pause_count,
+            'resume_count': self.resume_count,
+        }
+
+    def put_nowait(self, item):
+        super().put_nowait(item)
+        depth = self.qsize()
+        if depth > self.max_depth:
+            self.max_depth = depth
+        if self.high_water is not None and not self.paused and depth >= self.high_water:
+            self.paused = True
+            self.pause_count += 1
+            if self.pause is not None:
+                self.pause()
+
+    def get_nowait(self):
+        item = super().get_nowait()
+        if self.paused and self.qsize() <= self.low_water:
+            self.paused = False
+            self.resume_count += 1
+            if self.resume is not None:
+                self.resume()
+        return item
+
+    async def get_batch(self, max_n: int, timeout: float=None) -> list:
+        """
+        Return up to max_n queued messages, waiting up to timeout seconds (forever if None) for
+        the first one.  Returns an empty list if none arrived in time.
+        """
+        if self.empty():
+            try:
+                first = await asyncio.wait_for(self.get(), timeout)
+            except asyncio.TimeoutError:
+                return []
+            batch = [first]
+        else:
+            batch = []
+        get = self.get_nowait
+        for i in range(min(max_n - len(batch), self.qsize())):
+            batch.append(get())
+        return batch
@@ -1,10 +1,12 @@
 import struct
 import asyncio
+import time
+from bisect import bisect_right
 from datetime import datetime
 
 
 from asyncmqtt import MQTTException
-from asyncmqtt.util import int_to_bytes, bytes_to_int
+from asyncmqtt.util import int_to_bytes
 
 
 RESERVED_0 = 0x00
@@ -25,41 +27,73 @@ DISCONNECT = 0x0e
 RESERVED_15 = 0x0f
 
 
+# Exclusive upper bounds of the remaining length values which encode to 1, 2, 3 and 4 bytes.
+REMAINING_LENGTH_LIMITS = (0x80, 0x4000, 0x200000, 0x10000000)
+# Encoded form of every remaining length value which fits in a single byte.
+REMAINING_LENGTH_BYTES = tuple(bytes((length,)) for length in range(0x80))
+
+
+def remaining_length_size(length: int) -> int:
+    """Return the number of bytes needed to encode a remaining length, without encoding it."""
+    size = bisect_right(REMAINING_LENGTH_LIMITS, length) + 1
+    if size > 4:
+        raise MQTTException('remaining length exceeds 4 bytes: value=%d' % length)
+    return size
+
+
+def encode_remaining_length(length: int) -> bytes:
+    if length < 0x80:
+        return REMAINING_LENGTH_BYTES[length]
+    if length < 0x4000:
+        return bytes((length & 0x7f | 0x80, length >> 7))
+    if length < 0x200000:
+        return bytes((length & 0x7f | 0x80, (length >> 7) & 0x7f | 0x80, length >> 14))
+    if length < 0x10000000:
+        return bytes((length & 0x7f | 0x80, (length >> 7) & 0x7f | 0x80, (length >> 14) & 0x7f | 0x80, length >> 21))
+    raise MQTTException('remaining length exceeds 4 bytes: value=%d' % length)
+
+
 class MQTTFixedHeader:
+    __slots__ = ('packet_type', 'remaining_length', 'flags')
+
     def __init__(self, packet_type, flags=0, length=0):
         self.packet_type = packet_type
         self.remaining_length = length
         self.flags = flags
 
     def to_bytes(self):
-        def encode_remaining_length(length: int):
-            encoded = bytearray()
-            while True:
-                length_byte = length % 0x80
-                length //= 0x80
-                if length > 0:
-                    length_byte |= 0x80
-                encoded.append(length_byte)
-                if length <= 0:
-                    break
-            return encoded
-
-        out = bytearray()
-        packet_type = 0
-        try:
-            packet_type = (self.packet_type << 4) | self.flags
-            out.append(packet_type)
-        except OverflowError:
-            raise MQTTException('packet_type encoding exceed 1 byte length: value=%d', packet_type)
-
-        encoded_length = encode_remaining_length(self.remaining_length)
-        out.extend(encoded_length)
+        packet_type = (self.packet_type << 4) | self.flags
+        if packet_type > 0xff:
+            raise MQTTException('packet_type encoding exceed 1 byte length: value=%d' % packet_type)
 
-        return out
+        return bytes((packet_type,)) + encode_remaining_length(self.remaining_length)
 
     @property
     def bytes_length(self):
-        return len(self.to_bytes())
+        return 1 + remaining_length_size(self.remaining_length)
+
+    @classmethod
+    def decode(cls, buffer, offset: int=0):
+        """
+        Decode a fixed header starting at buffer[offset] in a single pass.
+        :return: (FixedHeader instance, number of bytes consumed)
+        """
+        try:
+            first = buffer[offset]
+            enc_byte = buffer[offset + 1]
+            if not enc_byte & 0x80:
+                return cls(first >> 4, first & 0x0f, enc_byte), 2
+
+            value = enc_byte & 0x7f
+            for needle, shift in ((offset + 2, 7), (offset + 3, 14), (offset + 4, 21)):
+                enc_byte = buffer[needle]
+                value |= (enc_byte & 0x7f) << shift
+                if not enc_byte & 0x80:
+                    return cls(first >> 4, first & 0x0f, value), needle + 1 - offset
+        except IndexError:
+            raise MQTTException("Packet is truncated")
+
+        raise MQTTException("Invalid remaining length bytes:%r, packet_type=%d" % (bytes(buffer[offset:offset + 5]), first >> 4))
 
     @classmethod
     def from_bytes(cls, buffer: bytearray):
@@ -67,34 +101,7 @@ class MQTTFixedHeader:
         Read and decode MQTT message fixed header from stream
         :return: FixedHeader instance
         """
-        def decode_remaining_length(buffer: bytearray):
-            """
-            Decode message length according to MQTT specifications
-            :return:
-            """
-            multiplier = 1
-            value = 0
-            valid = False
-            for enc_byte in buffer:
-                value += (enc_byte & 0x7f) * multiplier
-                if (enc_byte & 0x80) == 0:
-                    valid = True
-                    break
-                else:
-                    multiplier *= 128
-                    if multiplier > 128 * 128 * 128:
-                        raise MQTTException("Invalid remaining length bytes:%r, packet_type=%d" % (buffer, msg_type))
-
-            if not valid:
-                raise MQTTException("Packet is truncated")
-
-            return value
-
-        msg_type = (buffer[0] & 0xf0) >> 4
-        flags = buffer[0] & 0x0f
-        remain_length = decode_remaining_length(buffer[1:])
-
-        return cls(msg_type, flags, remain_length)
+        return cls.decode(buffer)[0]
 
     def __repr__(self):
         return type(self).__name__ + '(packet_type={2}, length={0}, flags={1})'.\
@@ -102,21 +109,31 @@ class MQTTFixedHeader:
 
 
 class MQTTVariableHeader:
+    __slots__ = ()
+
     def to_bytes(self) -> bytes:
         """Marshal header data to bytes."""
         raise NotImplementedError()
 
     @property
     def bytes_length(self):
+        """Encoded length.  Subclasses compute this from their fields instead of encoding."""
         return len(self.to_bytes())
 
+    @classmethod
+    def decode(cls, buffer: bytearray, fixed_header: MQTTFixedHeader):
+        """Demarshal header data from bytes, returning (header, number of bytes consumed)."""
+        raise NotImplementedError()
+
     @classmethod
     def from_bytes(cls, buffer: bytearray, fixed_header: MQTTFixedHeader):
         """Demarshal header data from bytes."""
-        raise NotImplementedError()
+        return cls.decode(buffer, fixed_header)[0]
 
 
 class PacketIDVariableHeader(MQTTVariableHeader):
+    __slots__ = ('packet_id',)
+
     def __init__(self, packet_id=0):
         self.packet_id = packet_id
 
@@ -126,12 +143,18 @@ class PacketIDVariableHeader(MQTTVariableHeader):
     def to_bytes(self) -> bytes:
         return int_to_bytes(self.packet_id, 2)
 
+    @property
+    def bytes_length(self):
+        return 2
+
     @classmethod
-    def from_bytes(cls, buffer: bytearray, fixed_header: MQTTFixedHeader):
-        return cls(bytes_to_int(buffer[0:2]))
+    def decode(cls, buffer: bytearray, fixed_header: MQTTFixedHeader):
+        return cls((buffer[0] << 8) | buffer[1]), 2
 
 
 class MQTTPayload:
+    __slots__ = ()
+
     def to_bytes(self):
         """Marshal payload data to bytes."""
         raise NotImplementedError()
@@ -139,7 +162,7 @@ class MQTTPayload:
     @classmethod
     def from_bytes(cls, buffer: bytearray, fixed_header: MQTTFixedHeader, variable_header: MQTTVariableHeader):
         """Demarshal payload data from bytes.  In most cases, the default implementation is adequate."""
-        return cls(buffer)
+        return cls(bytes(buffer))
 
 
 class MQTTPacket:
@@ -147,11 +170,24 @@ class MQTTPacket:
     VARIABLE_HEADER = None
     PAYLOAD = None
 
+    __slots__ = ('fixed_header', 'variable_header', 'payload', 'protocol_time')
+
     def __init__(self, fixed: MQTTFixedHeader, variable_header: MQTTVariableHeader=None, payload: MQTTPayload=None):
         self.fixed_header = fixed
         self.variable_header = variable_header
         self.payload = payload
-        self.protocol_ts = None
+        self.protocol_time = None
+
+    @property
+    def protocol_ts(self):
+        """Receive time as a datetime.  Only the float timestamp is stored when decoding."""
+        if self.protocol_time is None:
+            return None
+        return datetime.fromtimestamp(self.protocol_time)
+
+    @protocol_ts.setter
+    def protocol_ts(self, ts: datetime):
+        self.protocol_time = ts.timestamp() if ts is not None else None
 
     def to_bytes(self) -> bytes:
         if self.variable_header:
@@ -168,23 +204,31 @@ class MQTTPacket:
 
         return fixed_header_bytes + variable_header_bytes + payload_bytes
 
+    def to_buffers(self) -> list:
+        """
+        Encode the packet as a list of buffers which, written in order, form the packet.
+        Packets with large payloads override this to avoid copying the payload.
+        """
+        return [self.to_bytes()]
+
     @property
     def bytes_length(self):
         return len(self.to_bytes())
 
     @classmethod
     def from_bytes(cls, buffer: bytearray):
-        needle = 0
-        fixed_header = variable_header = payload = None
-        if cls.FIXED_HEADER:
-            fixed_header = cls.FIXED_HEADER.from_bytes(buffer)
-        needle += fixed_header.bytes_length
-        if cls.VARIABLE_HEADER:
-            variable_header = cls.VARIABLE_HEADER.from_bytes(buffer[needle:], fixed_header)
-        if variable_header:
-            needle += variable_header.bytes_length
-            if cls.PAYLOAD:
-                payload = cls.PAYLOAD.from_bytes(buffer[needle:], fixed_header, variable_header)
+        variable_header = payload = None
+        with memoryview(buffer) as view:
+            fixed_header, needle = cls.FIXED_HEADER.decode(view)
+            end = needle + fixed_header.remaining_length
+            if cls.VARIABLE_HEADER:
+                try:
+                    variable_header, consumed = cls.VARIABLE_HEADER.decode(view[needle:end], fixed_header)
+                    needle += consumed
+                    if cls.PAYLOAD:
+                        payload = cls.PAYLOAD.from_bytes(view[needle:end], fixed_header, variable_header)
+                except IndexError:
+                    raise MQTTException('%s is truncated' % cls.__name__)
 
         if fixed_header and not variable_header and not payload:
             instance = cls(fixed_header)
@@ -193,7 +237,7 @@ class MQTTPacket:
         else:
             instance = cls(fixed_header, variable_header, payload)
 
-        instance.protocol_ts = datetime.now()
+        instance.protocol_time = time.time()
         return instance
 
     def __repr__(self):
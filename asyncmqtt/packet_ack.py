@@ -0,0 +1,75 @@
+from asyncmqtt import MQTTException
+from asyncmqtt.packet import MQTTFixedHeader, MQTTPacket, PacketIDVariableHeader, PUBACK, PUBREC, PUBREL, PUBCOMP, UNSUBACK
+from asyncmqtt.packet_template import PUBACK_TEMPLATE, PUBREC_TEMPLATE, PUBREL_TEMPLATE, PUBCOMP_TEMPLATE, UNSUBACK_TEMPLATE
+
+
+class PacketIDPacket(MQTTPacket):
+    """Base class for the QoS acknowledgements, which carry nothing but a packet identifier."""
+    PACKET_TYPE = None
+    FLAGS = 0x00
+    TEMPLATE = None
+    VARIABLE_HEADER = PacketIDVariableHeader
+    PAYLOAD = None
+
+    __slots__ = ()
+
+    def __init__(self, fixed: MQTTFixedHeader=None, variable_header: PacketIDVariableHeader=None, payload=None):
+        if fixed is None:
+            header = MQTTFixedHeader(self.PACKET_TYPE, self.FLAGS)
+        else:
+            if fixed.packet_type is not self.PACKET_TYPE:
+                raise MQTTException("Invalid fixed packet type %s for %s init" % (fixed.packet_type, type(self).__name__))
+            header = fixed
+        super().__init__(header)
+        self.variable_header = variable_header
+
+    @property
+    def packet_id(self):
+        return self.variable_header.packet_id
+
+    @packet_id.setter
+    def packet_id(self, packet_id: int):
+        self.variable_header.packet_id = packet_id
+
+    def to_bytes(self) -> bytes:
+        return self.TEMPLATE.build(self.packet_id)
+
+    @classmethod
+    def build(cls, packet_id: int):
+        return cls(variable_header=PacketIDVariableHeader(packet_id))
+
+
+class PubackPacket(PacketIDPacket):
+    PACKET_TYPE = PUBACK
+    TEMPLATE = PUBACK_TEMPLATE
+
+    __slots__ = ()
+
+
+class PubrecPacket(PacketIDPacket):
+    PACKET_TYPE = PUBREC
+    TEMPLATE = PUBREC_TEMPLATE
+
+    __slots__ = ()
+
+
+class PubrelPacket(PacketIDPacket):
+    PACKET_TYPE = PUBREL
+    FLAGS = 0x02 # [MQTT-3.6.1-1]
+    TEMPLATE = PUBREL_TEMPLATE
+
+    __slots__ = ()
+
+
+class PubcompPacket(PacketIDPacket):
+    PACKET_TYPE = PUBCOMP
+    TEMPLATE = PUBCOMP_TEMPLATE
+
+    __slots__ = ()
+
+
+class UnsubackPacket(PacketIDPacket):
+    PACKET_TYPE = UNSUBACK
+    TEMPLATE = UNSUBACK_TEMPLATE
+
+    __slots__ = ()
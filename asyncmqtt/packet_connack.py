@@ -12,32 +12,39 @@ NOT_AUTHORIZED = 0x05
 
 
 class ConnackVariableHeader(MQTTVariableHeader):
-    def __init__(self, return_code=None):
+    __slots__ = ('return_code', 'session_present')
+
+    def __init__(self, return_code=None, session_present=False):
         super().__init__()
         self.return_code = return_code
+        self.session_present = session_present
 
     @classmethod
-    def from_bytes(cls, buffer: bytearray, fixed_header: MQTTFixedHeader):
-        data = buffer[0:2]
-        return_code = data[1]
-        return cls(return_code)
+    def decode(cls, buffer: bytearray, fixed_header: MQTTFixedHeader):
+        return cls(buffer[1], bool(buffer[0] & 0x01)), 2
+
+    @property
+    def bytes_length(self):
+        return 2
 
     def to_bytes(self):
         out = bytearray(2)
 
-        out[0] = 0
+        out[0] = 0x01 if self.session_present else 0
         out[1] = self.return_code
 
         return out
 
     def __repr__(self):
-        return type(self).__name__ + ('(return_code=%x)' % self.return_code)
+        return type(self).__name__ + ('(return_code=%x, session_present=%s)' % (self.return_code, self.session_present))
 
 
 class ConnackPacket(MQTTPacket):
     VARIABLE_HEADER = ConnackVariableHeader
     PAYLOAD = None
 
+    __slots__ = ()
+
     @property
     def return_code(self):
         return self.variable_header.return_code
@@ -46,6 +53,10 @@ class ConnackPacket(MQTTPacket):
     def return_code(self, return_code):
         self.variable_header.return_code = return_code
 
+    @property
+    def session_present(self):
+        return self.variable_header.session_present
+
     def __init__(self, fixed: MQTTFixedHeader=None, variable_header: ConnackVariableHeader=None, payload=None):
         if fixed is None:
             header = MQTTFixedHeader(CONNACK, 0x00)
@@ -58,7 +69,7 @@ class ConnackPacket(MQTTPacket):
         self.payload = None
 
     @classmethod
-    def build(cls, return_code=None):
-        v_header = ConnackVariableHeader(return_code)
+    def build(cls, return_code=None, session_present=False):
+        v_header = ConnackVariableHeader(return_code, session_present)
         packet = ConnackPacket(variable_header=v_header)
         return packet
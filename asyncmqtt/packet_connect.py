@@ -12,6 +12,8 @@ class ConnectVariableHeader(MQTTVariableHeader):
     CLEAN_SESSION_FLAG = 0x02
     RESERVED_FLAG = 0x01
 
+    __slots__ = ('proto_name', 'proto_level', 'flags', 'keep_alive')
+
     def __init__(self, connect_flags=0, keep_alive=0, proto_name='MQTT', proto_level=0x04):
         self.proto_name = proto_name
         self.proto_level = proto_level
@@ -88,11 +90,8 @@ class ConnectVariableHeader(MQTTVariableHeader):
         self.flags |= (val << 3)
 
     @classmethod
-    def from_bytes(cls, buffer: bytes, fixed_header: MQTTFixedHeader):
-        needle = 0
-
-        protocol_name = decode_string(buffer[needle:])
-        needle += 2 + len(protocol_name)
+    def decode(cls, buffer: bytes, fixed_header: MQTTFixedHeader):
+        protocol_name, needle = decode_string_at(buffer, 0)
 
         # protocol level
         protocol_level = buffer[needle]
@@ -103,9 +102,14 @@ class ConnectVariableHeader(MQTTVariableHeader):
         needle += 1
 
         # keep-alive
-        keep_alive = bytes_to_int(buffer[needle:][:2])
+        keep_alive = (buffer[needle] << 8) | buffer[needle + 1]
+        needle += 2
 
-        return cls(flags, keep_alive, protocol_name, protocol_level)
+        return cls(flags, keep_alive, protocol_name, protocol_level), needle
+
+    @property
+    def bytes_length(self):
+        return 2 + len(self.proto_name.encode('utf-8')) + 4
 
     def to_bytes(self):
         out = bytearray()
@@ -123,6 +127,8 @@ class ConnectVariableHeader(MQTTVariableHeader):
 
 
 class ConnectPayload(MQTTPayload):
+    __slots__ = ('client_id', 'will_topic', 'will_message', 'username', 'password')
+
     def __init__(self, client_id=None, will_topic=None, will_message=None, username=None, password=None):
         super().__init__()
         self.client_id = client_id
@@ -140,25 +146,20 @@ class ConnectPayload(MQTTPayload):
     @classmethod
     def from_bytes(cls, buffer: bytes, fixed_header: MQTTFixedHeader,
                     variable_header: ConnectVariableHeader):
-        needle = 0
-        payload = cls()
-        payload.client_id = decode_string(buffer)
-
-        needle += 2 + len(payload.client_id)
+        client_id, needle = decode_string_at(buffer, 0)
+        payload = cls(client_id)
 
         # Read will topic, username and password
         if variable_header.will_flag:
-            payload.will_topic = decode_string(buffer[needle:])
-            needle += 2 + len(payload.will_topic)
+            payload.will_topic, needle = decode_string_at(buffer, needle)
             payload.will_message = decode_data(buffer[needle:])
             needle += 2 + len(payload.will_message)
 
         if variable_header.username_flag:
-            payload.username = decode_string(buffer[needle:])
-            needle += 2 + len(payload.username)
+            payload.username, needle = decode_string_at(buffer, needle)
 
         if variable_header.password_flag:
-            payload.password = decode_string(buffer[needle:])
+            payload.password, needle = decode_string_at(buffer, needle)
 
         return payload
 
@@ -188,6 +189,8 @@ class ConnectPacket(MQTTPacket):
     VARIABLE_HEADER = ConnectVariableHeader
     PAYLOAD = ConnectPayload
 
+    __slots__ = ()
+
     @property
     def proto_name(self):
         return self.variable_header.proto_name
@@ -0,0 +1,96 @@
+import asyncio
+import collections
+
+from asyncmqtt import MQTTException
+
+
+MAX_PACKET_ID = 0xffff
+
+
+class PacketIDAllocator:
+    """
+    Allocates packet identifiers (1-65535) in O(1) and maps each identifier in use to the
+    operation it belongs to.  Identifiers are handed out in sequence, then released ones are
+    reused in FIFO order, so an identifier is not handed out again right after it was
+    acknowledged.  When every identifier is in use,
+    allocate() raises and acquire() waits for one to be released.
+    """
+    def __init__(self, size: int=MAX_PACKET_ID):
+        self.size = size
+        self.next_fresh = 1
+        self.free = collections.deque()
+        self.in_use = {}
+        self.waiters = collections.deque()
+
+    def __repr__(self):
+        return type(self).__name__ + '(in_use={0}, size={1})'.format(len(self.in_use), self.size)
+
+    def __len__(self):
+        return len(self.in_use)
+
+    def __contains__(self, packet_id: int) -> bool:
+        return packet_id in self.in_use
+
+    @property
+    def exhausted(self) -> bool:
+        return not self.free and self.next_fresh > self.size
+
+    def allocate(self, operation=None) -> int:
+        if self.next_fresh <= self.size:
+            packet_id = self.next_fresh
+            self.next_fresh += 1
+        elif self.free:
+            packet_id = self.free.popleft()
+        else:
+            raise MQTTException('all %d packet identifiers are in use' % self.size)
+        self.in_use[packet_id] = operation
+        return packet_id
+
+    def claim(self, packet_id: int, operation=None):
+        """Take a particular identifier, such as one a message was sent with before a restart."""
+        if packet_id in self.in_use:
+            raise MQTTException('packet identifier %d is in use' % packet_id)
+        if packet_id >= self.next_fresh:
+            self.free.extend(range(self.next_fresh, packet_id))
+            self.next_fresh = packet_id + 1
+        else:
+            self.free.remove(packet_id)
+        self.in_use[packet_id] = operation
+
+    async def acquire(self, operation=None) -> int:
+        """Allocate an identifier, waiting for one to be released if all are in use."""
+        await self.wait()
+        return self.allocate(operation)
+
+    async def wait(self):
+        """Wait until an identifier is free."""
+        while self.exhausted:
+            waiter = asyncio.get_event_loop().create_future()
+            self.waiters.append(waiter)
+            try:
+                await waiter
+            except asyncio.CancelledError:
+                if waiter.done() and not waiter.cancelled():
+                    # Pass the wakeup on, it was meant for an identifier this task won't take.
+                    self.wake_waiter()
+                raise
+
+    def get(self, packet_id: int):
+        """Return the operation the identifier is in use for, or None."""
+        return self.in_use.get(packet_id)
+
+    def release(self, packet_id: int):
+        """Release an identifier and return its operation, or None if it was not in use."""
+        if packet_id not in self.in_use:
+            return None
+        operation = self.in_use.pop(packet_id)
+        self.free.append(packet_id)
+        self.wake_waiter()
+        return operation
+
+    def wake_waiter(self):
+        while self.waiters:
+            waiter = self.waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
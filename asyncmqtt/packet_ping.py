@@ -1,23 +1,34 @@
 from asyncmqtt.packet import MQTTException, MQTTPacket, MQTTFixedHeader, PINGREQ, PINGRESP
+from asyncmqtt.packet_template import PINGREQ_BYTES, PINGRESP_BYTES
 
 
 class PingReqPacket(MQTTPacket):
     VARIABLE_HEADER = None
     PAYLOAD = None
 
+    __slots__ = ()
+
     def __init__(self, fixed: MQTTFixedHeader=None):
         if not fixed:
             fixed = MQTTFixedHeader(PINGREQ)
         assert fixed.packet_type == PINGREQ
         super().__init__(fixed)
 
+    def to_bytes(self) -> bytes:
+        return PINGREQ_BYTES
+
 
 class PingRespPacket(MQTTPacket):
     VARIABLE_HEADER = None
     PAYLOAD = None
 
+    __slots__ = ()
+
     def __init__(self, fixed: MQTTFixedHeader=None):
         if not fixed:
             fixed = MQTTFixedHeader(PINGRESP)
         assert fixed.packet_type == PINGRESP
         super().__init__(fixed)
+
+    def to_bytes(self) -> bytes:
+        return PINGRESP_BYTES
@@ -1,9 +1,14 @@
+import struct
+import time
+
 from asyncmqtt import MQTTException
-from asyncmqtt.packet import MQTTFixedHeader, MQTTVariableHeader, MQTTPayload, MQTTPacket, PUBLISH, PacketIDVariableHeader
+from asyncmqtt.packet import MQTTFixedHeader, MQTTVariableHeader, MQTTPayload, MQTTPacket, PUBLISH, PacketIDVariableHeader, encode_remaining_length
 from asyncmqtt.util import *
 
 
 class PublishVariableHeader(MQTTVariableHeader):
+    __slots__ = ('topic_name', 'packet_id')
+
     def __init__(self, topic_name: str, packet_id: int=None):
         super().__init__()
         if '*' in topic_name:
@@ -15,25 +20,29 @@ class PublishVariableHeader(MQTTVariableHeader):
         return type(self).__name__ + '(topic={0}, packet_id={1})'.format(self.topic_name, self.packet_id)
 
     def to_bytes(self):
-        out = bytearray()
-        out.extend(encode_string(self.topic_name))
         if self.packet_id is not None:
-            out.extend(int_to_bytes(self.packet_id, 2))
-        return out
+            return encode_topic(self.topic_name) + int_to_bytes(self.packet_id, 2)
+        return encode_topic(self.topic_name)
+
+    @property
+    def bytes_length(self):
+        return len(encode_topic(self.topic_name)) + (2 if self.packet_id is not None else 0)
 
     @classmethod
-    def from_bytes(cls, buffer: bytearray, fixed_header: MQTTFixedHeader):
-        topic_name = decode_string(buffer)
-        needle = 2 + len(topic_name)
+    def decode(cls, buffer: bytearray, fixed_header: MQTTFixedHeader):
+        topic_name, needle = decode_topic_at(buffer, 0)
         has_qos = (fixed_header.flags >> 1) & 0x03
         if has_qos:
-            packet_id = bytes_to_int(buffer[needle:needle + 2])
+            packet_id = (buffer[needle] << 8) | buffer[needle + 1]
+            needle += 2
         else:
             packet_id = None
-        return cls(topic_name, packet_id)
+        return cls(topic_name, packet_id), needle
 
 
 class PublishPayload(MQTTPayload):
+    __slots__ = ('data',)
+
     def __init__(self, data: bytes=None):
         super().__init__()
         self.data = data
@@ -46,6 +55,16 @@ class PublishPayload(MQTTPayload):
 
 
 class PublishPacket(MQTTPacket):
+    """
+    PUBLISH packet.  Decoded packets are lazy: from_bytes() only records the frame and the
+    offsets of the topic and payload.  The topic is decoded on first access, and data is a
+    memoryview of the frame (use data_bytes for a bytes copy).  The variable header and payload
+    objects are only built if they are asked for, or if the packet is modified; changing only
+    the flags or the packet identifier patches the frame instead.
+
+    Packets received in streaming mode have no payload; their data is read from stream, a
+    PublishStream.
+    """
     VARIABLE_HEADER = PublishVariableHeader
     PAYLOAD = PublishPayload
 
@@ -53,18 +72,138 @@ class PublishPacket(MQTTPacket):
     RETAIN_FLAG = 0x01
     QOS_FLAG = 0x06
 
+    __slots__ = ('_variable_header', '_payload', 'frame', 'stream', '_topic_name', '_packet_id',
+                 'topic_start', 'topic_end')
+
     def __init__(self, fixed: MQTTFixedHeader=None, variable_header: PublishVariableHeader=None, payload=None):
         if fixed is None:
             header = MQTTFixedHeader(PUBLISH, 0x00)
         else:
             if fixed.packet_type is not PUBLISH:
-                raise HBMQTTException("Invalid fixed packet type %s for PublishPacket init" % fixed.packet_type)
+                raise MQTTException("Invalid fixed packet type %s for PublishPacket init" % fixed.packet_type)
             header = fixed
 
+        self.frame = None
+        self.stream = None
+        self._topic_name = None
+        self._packet_id = None
         super().__init__(header)
         self.variable_header = variable_header
         self.payload = payload
 
+    @classmethod
+    def from_bytes(cls, buffer: bytearray):
+        fixed_header, topic_start = MQTTFixedHeader.decode(buffer)
+        frame_length = topic_start + fixed_header.remaining_length
+        if len(buffer) < frame_length:
+            raise MQTTException('PUBLISH is truncated: %d of %d bytes' % (len(buffer), frame_length))
+        if fixed_header.remaining_length < 2:
+            raise MQTTException('PUBLISH remaining length %d has no room for a topic' % fixed_header.remaining_length)
+        frame = bytes(buffer) if len(buffer) == frame_length else bytes(buffer[:frame_length])
+        topic_start += 2
+        topic_end = topic_start + ((frame[topic_start - 2] << 8) | frame[topic_start - 1])
+        data_start = topic_end + 2 if fixed_header.flags & cls.QOS_FLAG else topic_end
+        if data_start > frame_length:
+            raise MQTTException('PUBLISH topic and packet identifier overrun the %d byte frame' % frame_length)
+
+        instance = cls(fixed_header)
+        instance.frame = frame
+        instance.topic_start = topic_start
+        instance.topic_end = topic_end
+        instance.protocol_time = time.time()
+        return instance
+
+    @property
+    def frame_packet_id(self):
+        # The layout of the frame follows the flags it was received with, not the current ones.
+        if self.frame[0] & self.QOS_FLAG:
+            return (self.frame[self.topic_end] << 8) | self.frame[self.topic_end + 1]
+        return None
+
+    @property
+    def data_start(self):
+        if self.frame[0] & self.QOS_FLAG:
+            return self.topic_end + 2
+        return self.topic_end
+
+    def frame_buffers(self):
+        """
+        The received frame as buffers, if it still encodes this packet.  If the dup/retain/qos
+        flags or the packet identifier changed, the headers are patched and the payload is
+        a memoryview of the frame, so it is not copied.  None if the packet has to be encoded
+        again.
+        """
+        frame = self.frame
+        if frame is None or self._variable_header is not None or self._payload is not None:
+            return None
+        flags = self.fixed_header.flags
+        if bool(flags & self.QOS_FLAG) != bool(frame[0] & self.QOS_FLAG):
+            return None
+        if self._packet_id is None or self._packet_id == self.frame_packet_id:
+            if flags == frame[0] & 0x0f:
+                return [frame]
+            return [bytes(((PUBLISH << 4) | flags,)), memoryview(frame)[1:]]
+        data_start = self.topic_end + 2
+        header = bytearray(frame[:data_start])
+        header[0] = (PUBLISH << 4) | flags
+        header[-2:] = int_to_bytes(self._packet_id, 2)
+        if data_start == len(frame):
+            return [bytes(header)]
+        return [bytes(header), memoryview(frame)[data_start:]]
+
+    def frame_bytes(self):
+        """The received frame, patched like frame_buffers(), or None."""
+        buffers = self.frame_buffers()
+        if buffers is None:
+            return None
+        return buffers[0] if len(buffers) == 1 else b''.join(buffers)
+
+    def to_bytes(self) -> bytes:
+        frame = self.frame_bytes()
+        if frame is not None:
+            return frame
+        return b''.join(self.to_buffers())
+
+    def to_buffers(self) -> list:
+        """
+        Encode as [header, payload].  The header holds the fixed and variable headers, and the
+        payload is the data object the packet was built with (bytes, memoryview, mmap, ...),
+        so large payloads are never copied.
+        """
+        buffers = self.frame_buffers()
+        if buffers is not None:
+            return buffers
+        data = self.payload.data
+        length = buffer_length(data)
+        header = self.encode_header(length)
+        return [header, data] if length else [header]
+
+    def encode_header(self, payload_length: int) -> bytes:
+        """Encode the fixed and variable headers for a payload of payload_length bytes."""
+        variable_header_bytes = self.variable_header.to_bytes()
+        self.fixed_header.remaining_length = len(variable_header_bytes) + payload_length
+        return self.fixed_header.to_bytes() + variable_header_bytes
+
+    @property
+    def variable_header(self):
+        if self._variable_header is None and self.frame is not None:
+            self._variable_header = PublishVariableHeader(self.topic_name, self.packet_id)
+        return self._variable_header
+
+    @variable_header.setter
+    def variable_header(self, variable_header: PublishVariableHeader):
+        self._variable_header = variable_header
+
+    @property
+    def payload(self):
+        if self._payload is None and self.frame is not None:
+            self._payload = PublishPayload(self.frame[self.data_start:])
+        return self._payload
+
+    @payload.setter
+    def payload(self, payload: PublishPayload):
+        self._payload = payload
+
     def set_flags(self, dup_flag=False, qos=0, retain_flag=False):
         self.dup_flag = dup_flag
         self.retain_flag = retain_flag
@@ -109,22 +248,41 @@ class PublishPacket(MQTTPacket):
 
     @property
     def packet_id(self):
+        if self._variable_header is None and self.frame is not None:
+            if self._packet_id is not None:
+                return self._packet_id
+            return self.frame_packet_id
         return self.variable_header.packet_id
 
     @packet_id.setter
     def packet_id(self, val: int):
-        self.variable_header.packet_id = val
+        if val is not None and self._variable_header is None and self.frame is not None \
+                and self.frame[0] & self.QOS_FLAG:
+            self._packet_id = val
+        else:
+            self.variable_header.packet_id = val
 
     @property
     def data(self):
+        if self._payload is None and self.frame is not None:
+            return memoryview(self.frame)[self.data_start:]
         return self.payload.data
 
+    @property
+    def data_bytes(self) -> bytes:
+        return bytes(self.data)
+
     @data.setter
     def data(self, data: bytes):
         self.payload.data = data
 
     @property
     def topic_name(self):
+        if self._variable_header is None and self.frame is not None:
+            if self._topic_name is None:
+                with memoryview(self.frame) as view:
+                    self._topic_name = decode_topic(view[self.topic_start:self.topic_end])
+            return self._topic_name
         return self.variable_header.topic_name
 
     @topic_name.setter
@@ -140,3 +298,93 @@ class PublishPacket(MQTTPacket):
         packet.retain_flag = retain
         packet.qos = qos
         return packet
+
+
+PACKET_ID = struct.Struct('!H')
+
+
+class SharedPublish:
+    """
+    A PUBLISH encoded once for many recipients.  The topic and payload are kept as they are;
+    the fixed header and topic are encoded once per combination of flags.  copy() gives a
+    packet for one recipient, which only adds its packet identifier: its buffers are the
+    shared header, 2 bytes of packet identifier and the shared payload, for vectored writes.
+    QoS 0 recipients can all be written the very same buffers().
+    """
+    __slots__ = ('topic_name', 'topic_bytes', 'data', 'data_length', 'headers')
+
+    def __init__(self, topic_name: str, data, topic_bytes: bytes=None):
+        self.topic_name = topic_name
+        self.topic_bytes = topic_bytes if topic_bytes is not None else encode_topic(topic_name)
+        self.data = data
+        self.data_length = buffer_length(data)
+        self.headers = {}
+
+    def __repr__(self):
+        return type(self).__name__ + '(topic={0!r}, length={1})'.format(self.topic_name, self.data_length)
+
+    @classmethod
+    def from_packet(cls, packet: PublishPacket):
+        """Share a PUBLISH; the payload of a received one is not copied out of its frame."""
+        frame = packet.frame
+        if frame is not None and packet._variable_header is None and packet._payload is None:
+            return cls(packet.topic_name, packet.data, frame[packet.topic_start - 2:packet.topic_end])
+        return cls(packet.topic_name, packet.data)
+
+    def header(self, qos: int=0, dup_flag: bool=False, retain: bool=False) -> bytes:
+        """The fixed header and topic, which precede the packet identifier if qos is set."""
+        flags = (qos << 1) | (PublishPacket.DUP_FLAG if dup_flag else 0) | (PublishPacket.RETAIN_FLAG if retain else 0)
+        header = self.headers.get(flags)
+        if header is None:
+            remaining_length = len(self.topic_bytes) + (2 if qos else 0) + self.data_length
+            header = bytes(((PUBLISH << 4) | flags,)) + encode_remaining_length(remaining_length) + self.topic_bytes
+            self.headers[flags] = header
+        return header
+
+    def buffers(self, retain: bool=False) -> list:
+        """The buffers of the QoS 0 packet."""
+        if self.data_length:
+            return [self.header(0, False, retain), self.data]
+        return [self.header(0, False, retain)]
+
+    def copy(self, qos: int, packet_id: int=None, retain: bool=False):
+        return SharedPublishCopy(self, qos, packet_id, retain)
+
+
+class SharedPublishCopy:
+    """
+    One recipient's PUBLISH of a SharedPublish.  It stands in for a PublishPacket in the
+    inflight window: the packet identifier and dup flag can be changed, nothing else.
+    """
+    __slots__ = ('shared', 'qos', 'packet_id', 'dup_flag', 'retain_flag')
+
+    def __init__(self, shared: SharedPublish, qos: int, packet_id: int=None, retain: bool=False):
+        self.shared = shared
+        self.qos = qos
+        self.packet_id = packet_id
+        self.dup_flag = False
+        self.retain_flag = retain
+
+    def __repr__(self):
+        return type(self).__name__ + '(topic={0!r}, qos={1}, packet_id={2})'.format(
+            self.shared.topic_name, self.qos, self.packet_id)
+
+    @property
+    def topic_name(self) -> str:
+        return self.shared.topic_name
+
+    @property
+    def data(self):
+        return self.shared.data
+
+    def to_buffers(self) -> list:
+        shared = self.shared
+        buffers = [shared.header(self.qos, self.dup_flag, self.retain_flag)]
+        if self.qos:
+            buffers.append(PACKET_ID.pack(self.packet_id))
+        if shared.data_length:
+            buffers.append(shared.data)
+        return buffers
+
+    def to_bytes(self) -> bytes:
+        return b''.join(self.to_buffers())
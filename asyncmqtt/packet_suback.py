@@ -9,6 +9,8 @@ class SubackPayload(MQTTPayload):
     RETURN_CODE_02 = 0x02
     RETURN_CODE_80 = 0x80
 
+    __slots__ = ('return_codes',)
+
     def __init__(self, return_codes=[]):
         self.return_codes = return_codes
 
@@ -24,17 +26,15 @@ class SubackPayload(MQTTPayload):
     @classmethod
     def from_bytes(cls, buffer: bytearray, fixed_header: MQTTFixedHeader,
                    variable_header: MQTTVariableHeader):
-        return_codes = []
-        length = fixed_header.remaining_length - variable_header.bytes_length
-        for i in range(0, length):
-            return_codes.append(buffer[i])
-        return cls(return_codes)
+        return cls(list(buffer))
 
 
 class SubackPacket(MQTTPacket):
     VARIABLE_HEADER = PacketIDVariableHeader
     PAYLOAD = SubackPayload
 
+    __slots__ = ()
+
     def __init__(self, fixed: MQTTFixedHeader=None, variable_header: PacketIDVariableHeader=None, payload=None):
         if fixed is None:
             header = MQTTFixedHeader(SUBACK, 0x00)
@@ -47,6 +47,10 @@ class SubackPacket(MQTTPacket):
         self.variable_header = variable_header
         self.payload = payload
 
+    @property
+    def packet_id(self):
+        return self.variable_header.packet_id
+
     @property
     def return_codes(self):
         return self.payload.return_codes
@@ -4,6 +4,8 @@ from asyncmqtt.util import *
 
 
 class SubscribePayload(MQTTPayload):
+    __slots__ = ('topics',)
+
     def __init__(self, topics=[]):
         super().__init__()
         self.topics = topics
@@ -11,7 +13,7 @@ class SubscribePayload(MQTTPayload):
     def to_bytes(self, fixed_header: MQTTFixedHeader, variable_header: MQTTVariableHeader):
         out = b''
         for topic in self.topics:
-            out += encode_string(topic[0])
+            out += encode_topic(topic[0])
             out += int_to_bytes(topic[1], 1)
         return out
 
@@ -19,11 +21,10 @@ class SubscribePayload(MQTTPayload):
     def from_bytes(cls, buffer: bytearray, fixed_header: MQTTFixedHeader,
                    variable_header: MQTTVariableHeader):
         topics = []
-        payload_length = fixed_header.remaining_length - variable_header.bytes_length
+        payload_length = len(buffer)
         needle = 0
         while needle < payload_length:
-            topic = decode_string(buffer[needle:])
-            needle += 2 + len(topic.encode('utf-8'))
+            topic, needle = decode_topic_at(buffer, needle)
             qos = buffer[needle]
             needle += 1
             topics.append((topic, qos))
@@ -37,6 +38,8 @@ class SubscribePacket(MQTTPacket):
     VARIABLE_HEADER = PacketIDVariableHeader
     PAYLOAD = SubscribePayload
 
+    __slots__ = ()
+
     def __init__(self, fixed: MQTTFixedHeader=None, variable_header: PacketIDVariableHeader=None, payload=None):
         if fixed is None:
             header = MQTTFixedHeader(SUBSCRIBE, 0x02) # [MQTT-3.8.1-1]
@@ -49,6 +52,10 @@ class SubscribePacket(MQTTPacket):
         self.variable_header = variable_header
         self.payload = payload
 
+    @property
+    def packet_id(self):
+        return self.variable_header.packet_id
+
     @property
     def topics(self):
         return self.payload.topics
@@ -0,0 +1,40 @@
+import struct
+from functools import partial
+
+from asyncmqtt.packet import PUBACK, PUBREC, PUBREL, PUBCOMP, UNSUBACK, PINGREQ, PINGRESP, DISCONNECT
+
+
+# Packets which never vary are encoded once, here.
+PINGREQ_BYTES = bytes((PINGREQ << 4, 0))
+PINGRESP_BYTES = bytes((PINGRESP << 4, 0))
+DISCONNECT_BYTES = bytes((DISCONNECT << 4, 0))
+
+
+class PacketIDTemplate:
+    """
+    Pre-encoded form of a packet which is only a fixed header and a 2 byte packet identifier.
+    build(packet_id) produces the wire bytes with a single struct pack and no packet objects.
+    """
+    ENCODER = struct.Struct('!BBH')
+
+    __slots__ = ('first_byte', 'build')
+
+    def __init__(self, packet_type: int, flags: int=0):
+        self.first_byte = (packet_type << 4) | flags
+        self.build = partial(self.ENCODER.pack, self.first_byte, 2)
+
+    def __repr__(self):
+        return type(self).__name__ + '(first_byte=%s)' % hex(self.first_byte)
+
+
+PUBACK_TEMPLATE = PacketIDTemplate(PUBACK)
+PUBREC_TEMPLATE = PacketIDTemplate(PUBREC)
+PUBREL_TEMPLATE = PacketIDTemplate(PUBREL, 0x02) # [MQTT-3.6.1-1]
+PUBCOMP_TEMPLATE = PacketIDTemplate(PUBCOMP)
+UNSUBACK_TEMPLATE = PacketIDTemplate(UNSUBACK)
+
+puback = PUBACK_TEMPLATE.build
+pubrec = PUBREC_TEMPLATE.build
+pubrel = PUBREL_TEMPLATE.build
+pubcomp = PUBCOMP_TEMPLATE.build
+unsuback = UNSUBACK_TEMPLATE.build
@@ -0,0 +1,61 @@
+from asyncmqtt import MQTTException
+from asyncmqtt.packet import MQTTFixedHeader, MQTTVariableHeader, MQTTPayload, MQTTPacket, UNSUBSCRIBE, PacketIDVariableHeader
+from asyncmqtt.util import *
+
+
+class UnsubscribePayload(MQTTPayload):
+    __slots__ = ('topics',)
+
+    def __init__(self, topics=[]):
+        super().__init__()
+        self.topics = topics
+
+    def to_bytes(self, fixed_header: MQTTFixedHeader, variable_header: MQTTVariableHeader):
+        return b''.join(encode_topic(topic) for topic in self.topics)
+
+    @classmethod
+    def from_bytes(cls, buffer: bytearray, fixed_header: MQTTFixedHeader,
+                   variable_header: MQTTVariableHeader):
+        topics = []
+        payload_length = len(buffer)
+        needle = 0
+        while needle < payload_length:
+            topic, needle = decode_topic_at(buffer, needle)
+            topics.append(topic)
+        return cls(topics)
+
+    def __repr__(self):
+        return type(self).__name__ + '(topics={0!r})'.format(self.topics)
+
+
+class UnsubscribePacket(MQTTPacket):
+    VARIABLE_HEADER = PacketIDVariableHeader
+    PAYLOAD = UnsubscribePayload
+
+    __slots__ = ()
+
+    def __init__(self, fixed: MQTTFixedHeader=None, variable_header: PacketIDVariableHeader=None, payload=None):
+        if fixed is None:
+            header = MQTTFixedHeader(UNSUBSCRIBE, 0x02) # [MQTT-3.10.1-1]
+        else:
+            if fixed.packet_type is not UNSUBSCRIBE:
+                raise MQTTException("Invalid fixed packet type %s for UnsubscribePacket init" % fixed.packet_type)
+            header = fixed
+
+        super().__init__(header)
+        self.variable_header = variable_header
+        self.payload = payload
+
+    @property
+    def packet_id(self):
+        return self.variable_header.packet_id
+
+    @property
+    def topics(self):
+        return self.payload.topics
+
+    @classmethod
+    def build(cls, topics, packet_id):
+        v_header = PacketIDVariableHeader(packet_id)
+        payload = UnsubscribePayload(topics)
+        return UnsubscribePacket(variable_header=v_header, payload=payload)
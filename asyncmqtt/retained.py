@@ -0,0 +1,166 @@
+import os
+from collections import OrderedDict
+
+from asyncmqtt.packet import MQTTFixedHeader
+from asyncmqtt.packet_publish import PublishPacket, SharedPublish
+
+
+class RetainedNode:
+    __slots__ = ('children', 'message')
+
+    def __init__(self):
+        self.children = {}
+        self.message = None
+
+
+class RetainedStore:
+    """
+    Retained messages, indexed by topic level, so the messages matching a new subscription
+    are found by walking the branches its filter selects rather than testing every topic.
+    Each message is kept as a SharedPublish with its QoS, so it is encoded once however many
+    subscribers get it.
+
+    At most max_messages messages and max_bytes of topics and payloads are kept; the ones
+    retained longest ago are evicted first.  With a snapshot_path, the store is loaded from
+    it when created, and snapshot() saves it there.
+    """
+    def __init__(self, max_messages: int=None, max_bytes: int=None, snapshot_path: str=None):
+        self.max_messages = max_messages
+        self.max_bytes = max_bytes
+        self.snapshot_path = snapshot_path
+        self.root = RetainedNode()
+        self.order = OrderedDict()
+        self.bytes = 0
+        self.evictions = 0
+        if snapshot_path is not None and os.path.exists(snapshot_path):
+            self.load(snapshot_path)
+
+    def __repr__(self):
+        return type(self).__name__ + '(messages={0}, bytes={1})'.format(len(self.order), self.bytes)
+
+    def __len__(self):
+        return len(self.order)
+
+    def stats(self) -> dict:
+        return {
+            'messages': len(self.order),
+            'bytes': self.bytes,
+            'evictions': self.evictions,
+        }
+
+    @staticmethod
+    def size(shared: SharedPublish) -> int:
+        return len(shared.topic_bytes) + shared.data_length
+
+    def get(self, topic: str) -> tuple:
+        """The (SharedPublish, qos) retained for topic, or None."""
+        node = self.root
+        for level in topic.split('/'):
+            node = node.children.get(level)
+            if node is None:
+                return None
+        return node.message
+
+    def set(self, shared: SharedPublish, qos: int):
+        """Retain a message for its topic, or clear the topic if the payload is empty [MQTT-3.3.1-10]."""
+        topic = shared.topic_name
+        self.remove(topic)
+        if not shared.data_length:
+            return
+        node = self.root
+        for level in topic.split('/'):
+            child = node.children.get(level)
+            if child is None:
+                child = node.children[level] = RetainedNode()
+            node = child
+        node.message = self.order[topic] = (shared, qos)
+        self.bytes += self.size(shared)
+        while self.order and ((self.max_messages is not None and len(self.order) > self.max_messages) or
+                              (self.max_bytes is not None and self.bytes > self.max_bytes)):
+            self.remove(next(iter(self.order)))
+            self.evictions += 1
+
+    def remove(self, topic: str):
+        message = self.order.pop(topic, None)
+        if message is None:
+            return
+        self.bytes -= self.size(message[0])
+        levels = topic.split('/')
+        path = [self.root]
+        for level in levels:
+            path.append(path[-1].children[level])
+        path[-1].message = None
+        for depth in range(len(levels), 0, -1):
+            node = path[depth]
+            if node.message is not None or node.children:
+                break
+            del path[depth - 1].children[levels[depth - 1]]
+
+    def match(self, topic_filter: str) -> list:
+        """Return the (SharedPublish, qos) of every retained topic topic_filter matches."""
+        matched = []
+        levels = topic_filter.split('/')
+        nodes = [self.root]
+        for depth, level in enumerate(levels):
+            next_nodes = []
+            for node in nodes:
+                if level == '#':
+                    # 'a/#' also matches 'a' [MQTT-4.7.1-2].
+                    if node.message is not None and depth:
+                        matched.append(node.message)
+                    self.collect(node, matched, depth == 0)
+                elif level == '+':
+                    for name, child in node.children.items():
+                        # [MQTT-4.7.2-1]
+                        if depth or not name.startswith('$'):
+                            next_nodes.append(child)
+                else:
+                    child = node.children.get(level)
+                    if child is not None:
+                        next_nodes.append(child)
+            if not next_nodes:
+                return matched
+            nodes = next_nodes
+
+        for node in nodes:
+            if node.message is not None:
+                matched.append(node.message)
+        return matched
+
+    @staticmethod
+    def collect(node: RetainedNode, matched: list, root: bool):
+        """Add the messages of every node below node."""
+        stack = [child for name, child in node.children.items() if not (root and name.startswith('$'))]
+        while stack:
+            node = stack.pop()
+            if node.message is not None:
+                matched.append(node.message)
+            stack.extend(node.children.values())
+
+    def snapshot(self, path: str=None):
+        """
+        Write every retained message to path (snapshot_path by default) as its QoS byte followed
+        by its encoded PUBLISH.  The file is replaced atomically.
+        """
+        path = path or self.snapshot_path
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            for shared, qos in self.order.values():
+                f.write(bytes((qos,)))
+                f.writelines(shared.buffers(retain=True))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+
+    def load(self, path: str):
+        with open(path, 'rb') as f:
+            data = f.read()
+        offset = 0
+        with memoryview(data) as view:
+            while offset < len(data):
+                qos = data[offset]
+                fixed, header_length = MQTTFixedHeader.decode(view, offset + 1)
+                end = offset + 1 + header_length + fixed.remaining_length
+                packet = PublishPacket.from_bytes(view[offset + 1:end])
+                self.set(SharedPublish.from_packet(packet), qos)
+                offset = end
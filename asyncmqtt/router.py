@@ -0,0 +1,225 @@
+import asyncio
+from collections import OrderedDict
+
+from asyncmqtt import MQTTException
+
+
+class Subscription:
+    """
+    A topic filter and where its messages go.  handler is either a callable taking the
+    PUBLISH packet or an asyncio.Queue the packets are put on.
+    """
+    __slots__ = ('topic_filter', 'qos', 'handler', 'deliver')
+
+    def __init__(self, topic_filter: str, qos: int=0, handler=None):
+        if handler is None:
+            handler = asyncio.Queue()
+        self.topic_filter = topic_filter
+        self.qos = qos
+        self.handler = handler
+        self.deliver = handler.put_nowait if isinstance(handler, asyncio.Queue) else handler
+
+    def __repr__(self):
+        return type(self).__name__ + '(topic_filter={0!r}, qos={1})'.format(self.topic_filter, self.qos)
+
+    async def next_message(self):
+        """Return the next message, for subscriptions delivering to a queue."""
+        return await self.handler.get()
+
+
+class TopicNode:
+    __slots__ = ('children', 'subscriptions')
+
+    def __init__(self):
+        self.children = {}
+        self.subscriptions = []
+
+
+def validate_filter(topic_filter: str) -> list:
+    """Split a topic filter into levels, checking the placement of wildcards."""
+    if not topic_filter:
+        raise MQTTException('empty topic filter')
+    levels = topic_filter.split('/')
+    for i, level in enumerate(levels):
+        if level == '#':
+            if i != len(levels) - 1:
+                raise MQTTException("'#' must be the last level of topic filter %r" % topic_filter)
+        elif level != '+' and ('#' in level or '+' in level):
+            raise MQTTException('wildcard must occupy a whole level in topic filter %r' % topic_filter)
+    return levels
+
+
+def topic_matches(topic_filter: str, topic: str) -> bool:
+    """Whether topic_filter matches topic, without a trie."""
+    if topic.startswith('$') and topic_filter[:1] in ('+', '#'):
+        return False
+    filter_levels = topic_filter.split('/')
+    topic_levels = topic.split('/')
+    for i, level in enumerate(filter_levels):
+        if level == '#':
+            return True
+        if i >= len(topic_levels):
+            return False
+        if level != '+' and level != topic_levels[i]:
+            return False
+    return len(filter_levels) == len(topic_levels)
+
+
+class TopicTrie:
+    """
+    Subscriptions indexed by topic filter level, so matching a topic walks one path per
+    wildcard branch instead of testing every filter.  Topics starting with '$' are not
+    matched by a leading wildcard [MQTT-4.7.2-1].
+    """
+    def __init__(self):
+        self.root = TopicNode()
+        self.count = 0
+
+    def __repr__(self):
+        return type(self).__name__ + '(subscriptions={0})'.format(self.count)
+
+    def __len__(self):
+        return self.count
+
+    def add(self, subscription: Subscription):
+        node = self.root
+        for level in validate_filter(subscription.topic_filter):
+            child = node.children.get(level)
+            if child is None:
+                child = node.children[level] = TopicNode()
+            node = child
+        node.subscriptions.append(subscription)
+        self.count += 1
+
+    def remove(self, topic_filter: str, handler=None) -> list:
+        """
+        Remove the subscriptions to topic_filter, or only those delivering to handler, and
+        return them.  Nodes left without subscriptions or children are pruned.
+        """
+        path = [self.root]
+        for level in topic_filter.split('/'):
+            node = path[-1].children.get(level)
+            if node is None:
+                return []
+            path.append(node)
+
+        node = path[-1]
+        removed = [s for s in node.subscriptions if handler is None or s.handler is handler]
+        if not removed:
+            return []
+        node.subscriptions = [s for s in node.subscriptions if s not in removed]
+        self.count -= len(removed)
+
+        levels = topic_filter.split('/')
+        for depth in range(len(levels), 0, -1):
+            node = path[depth]
+            if node.subscriptions or node.children:
+                break
+            del path[depth - 1].children[levels[depth - 1]]
+        return removed
+
+    def match(self, topic: str) -> list:
+        """Return the subscriptions whose filters match topic."""
+        matched = []
+        nodes = [self.root]
+        wildcards = not topic.startswith('$')
+        for level in topic.split('/'):
+            next_nodes = []
+            for node in nodes:
+                children = node.children
+                if wildcards:
+                    child = children.get('#')
+                    if child is not None:
+                        matched.extend(child.subscriptions)
+                    child = children.get('+')
+                    if child is not None:
+                        next_nodes.append(child)
+                child = children.get(level)
+                if child is not None:
+                    next_nodes.append(child)
+            if not next_nodes:
+                return matched
+            nodes = next_nodes
+            wildcards = True
+
+        for node in nodes:
+            matched.extend(node.subscriptions)
+            # 'a/#' also matches 'a' [MQTT-4.7.1-2].
+            child = node.children.get('#')
+            if child is not None:
+                matched.extend(child.subscriptions)
+        return matched
+
+
+class TopicMatchCache:
+    """
+    Bounded cache from a topic to the subscriptions matching it, in front of a TopicTrie, so
+    the trie is only walked for topics outside the hot set.  Adding or removing a filter only
+    drops the cached topics that filter matches.  policy is 'lru' or 'fifo'; a maxsize of 0
+    disables caching.
+    """
+    POLICIES = ('lru', 'fifo')
+
+    def __init__(self, trie: TopicTrie=None, maxsize: int=4096, policy: str='lru'):
+        if policy not in self.POLICIES:
+            raise MQTTException('unknown cache policy %r' % policy)
+        self.trie = trie if trie is not None else TopicTrie()
+        self.maxsize = maxsize
+        self.policy = policy
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def __repr__(self):
+        return type(self).__name__ + '(maxsize={0}, policy={1!r}, stats={2!r})'.format(
+            self.maxsize, self.policy, self.stats())
+
+    def __len__(self):
+        return len(self.trie)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'invalidations': self.invalidations,
+            'size': len(self.entries),
+        }
+
+    def clear(self):
+        self.entries.clear()
+
+    def match(self, topic: str) -> tuple:
+        matched = self.entries.get(topic)
+        if matched is not None:
+            self.hits += 1
+            if self.policy == 'lru':
+                self.entries.move_to_end(topic)
+            return matched
+
+        self.misses += 1
+        matched = tuple(self.trie.match(topic))
+        if self.maxsize:
+            self.entries[topic] = matched
+            if len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+        return matched
+
+    def add(self, subscription: Subscription):
+        self.trie.add(subscription)
+        self.invalidate(subscription.topic_filter)
+
+    def remove(self, topic_filter: str, handler=None) -> list:
+        removed = self.trie.remove(topic_filter, handler)
+        if removed:
+            self.invalidate(topic_filter)
+        return removed
+
+    def invalidate(self, topic_filter: str):
+        """Drop the cached topics topic_filter matches."""
+        stale = [topic for topic in self.entries if topic_matches(topic_filter, topic)]
+        for topic in stale:
+            del self.entries[topic]
+        self.invalidations += len(stale)
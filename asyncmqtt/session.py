@@ -0,0 +1,110 @@
+import struct
+from functools import partial
+
+from asyncmqtt import MQTTException
+from asyncmqtt.util import gen_client_id
+from asyncmqtt.packet_id import PacketIDAllocator
+from asyncmqtt.inflight import InflightMessage, InflightWindow
+from asyncmqtt.packet_publish import PublishPacket
+from asyncmqtt.router import TopicMatchCache
+from asyncmqtt.message_queue import MessageQueue
+
+
+# Packet identifier and flow state of a stored message which was sent.
+CHECKPOINT = struct.Struct('!HB')
+
+
+class MQTTSession:
+    """
+    Client state which can outlive a connection: the client identifier, packet identifiers,
+    the inflight window, received QoS 2 identifiers, subscriptions and the message queues.
+
+    A persistent session keeps its inflight messages when the connection is lost, so they can
+    be replayed on the next connection made with the same session; otherwise they fail.
+
+    With a store (a SegmentLog), outgoing QoS 1/2 messages are also written to disk until their
+    flow completes, along with the packet identifier they were sent with and whether PUBREC
+    arrived.  Messages left in the store by an earlier process are restored when the session
+    is created: those which were sent go back into the inflight window under their identifier
+    and are replayed like any other, the rest are queued.  Only a persistent session may have
+    a store, since the messages must outlive the connection.
+    """
+    def __init__(self, client_id: str=None, persistent: bool=False, max_inflight: int=1024,
+                 match_cache_size: int=4096, match_cache_policy: str='lru',
+                 queue_high_water: int=None, queue_low_water: int=None, store=None):
+        self.client_id = client_id or gen_client_id()
+        self.persistent = persistent
+        self.packet_ids = PacketIDAllocator()
+        self.window = InflightWindow(self.packet_ids, max_inflight)
+        self.incoming_qos2 = set()
+        self.router = TopicMatchCache(maxsize=match_cache_size, policy=match_cache_policy)
+        self.protocol = None
+        self.read_holds = set()
+        self.msgq = self.message_queue(queue_high_water, queue_low_water)
+        self.store = store
+        if store is not None:
+            if not persistent:
+                raise MQTTException('a store requires a persistent session')
+            self.restore()
+
+    def __repr__(self):
+        return type(self).__name__ + '(client_id={0!r}, persistent={1}, inflight={2})'.format(
+            self.client_id, self.persistent, len(self.window))
+
+    def message_queue(self, high_water: int=None, low_water: int=None) -> MessageQueue:
+        """
+        A queue which holds reading from the session's connection while it is above its high
+        water mark.  Pass it to subscribe() to apply backpressure per subscription.
+        """
+        queue = MessageQueue(high_water, low_water)
+        queue.pause = partial(self.hold_reading, queue)
+        queue.resume = partial(self.release_reading, queue)
+        return queue
+
+    def persist(self, message: InflightMessage):
+        """Write message to the store, if any, until forget() is called for it."""
+        if self.store is None or not message.replayable:
+            return
+        packet = message.packet
+        if packet.packet_id is None:
+            # A placeholder, so the stored frame has room for the identifier sent later.
+            packet.packet_id = 0
+        message.record = self.store.append(packet.to_buffers())
+
+    def checkpoint(self, message: InflightMessage):
+        """Record the identifier message was sent with and the state of its flow."""
+        if message.record is not None:
+            self.store.set_state(message.record, CHECKPOINT.pack(message.packet.packet_id, message.state))
+
+    def forget(self, message: InflightMessage):
+        """Remove message from the store, once its flow has completed or it was never sent."""
+        if message.record is not None:
+            self.store.remove(message.record)
+            message.record = None
+
+    def restore(self):
+        """Take back the messages an earlier process left in the store."""
+        for record, frame in self.store.records():
+            packet = PublishPacket.from_bytes(frame)
+            # Nobody awaits these.
+            message = InflightMessage(packet, None)
+            message.record = record
+            state = self.store.get_state(record)
+            if state is None:
+                self.window.pending.append(message)
+            else:
+                packet_id, message.state = CHECKPOINT.unpack(state)
+                packet.dup_flag = True
+                self.window.restore(message, packet_id)
+
+    def hold_reading(self, reason):
+        if self.protocol is not None:
+            self.protocol.hold_reading(reason)
+        else:
+            self.read_holds.add(reason)
+
+    def release_reading(self, reason):
+        if self.protocol is not None:
+            self.protocol.release_reading(reason)
+        else:
+            self.read_holds.discard(reason)
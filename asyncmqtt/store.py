@@ -0,0 +1,284 @@
+import mmap
+import os
+import struct
+import zlib
+
+from asyncmqtt.util import buffer_length
+
+
+# Record kinds.  A zero kind byte ends the records of a segment.
+RECORD_DATA = 1
+RECORD_ACK = 2
+RECORD_STATE = 3
+
+# kind, data length, sequence number, crc32 of the header fields and the data.
+RECORD = struct.Struct('!BIQI')
+RECORD_FIELDS = struct.Struct('!BIQ')
+
+
+class Segment:
+    """One memory-mapped segment file of a SegmentLog."""
+    __slots__ = ('number', 'path', 'file', 'mm', 'size', 'end', 'live', 'live_bytes')
+
+    def __init__(self, number: int, path: str, size: int=None):
+        self.number = number
+        self.path = path
+        if size is None:
+            self.file = open(path, 'r+b')
+            size = os.fstat(self.file.fileno()).st_size
+        else:
+            self.file = open(path, 'w+b')
+            self.file.truncate(size)
+        self.mm = mmap.mmap(self.file.fileno(), size)
+        self.size = size
+        self.end = 0
+        self.live = 0
+        self.live_bytes = 0
+
+    def __repr__(self):
+        return type(self).__name__ + '(number={0}, end={1}, size={2}, live={3})'.format(
+            self.number, self.end, self.size, self.live)
+
+    def close(self):
+        self.mm.close()
+        self.file.close()
+
+
+class SegmentLog:
+    """
+    Append-only log of encoded messages, kept in memory-mapped segment files in directory.
+    append() copies a message into the log and returns its sequence number; remove() marks it
+    acknowledged by appending an ack record.  set_state() keeps a small blob with a live message,
+    such as how far its delivery got; each call appends a state record replacing the last one.
+    The in-memory index maps the sequence numbers of
+    live messages to their offsets, and is rebuilt by scanning the segments when the log is
+    opened again.  Every record carries a crc32, so a torn write at the tail is detected and
+    the scan stops there.
+
+    Segments are reclaimed oldest first, as soon as all their messages are acknowledged.
+    compact() moves the few live messages of old segments to the tail so those segments can
+    be reclaimed too; it runs whenever a new segment is started.  Once no message is live,
+    the last segment is rewound instead of growing.
+
+    The operating system writes the mapped pages back, so the log survives the process; with
+    sync=True every change is also flushed to disk before returning, to survive the machine.
+    """
+    def __init__(self, directory: str, segment_size: int=16777216, compact_ratio: float=0.25,
+                 sync: bool=False):
+        self.directory = directory
+        self.segment_size = segment_size
+        self.compact_ratio = compact_ratio
+        self.sync = sync
+        self.segments = []
+        self.index = {}
+        self.states = {}
+        self.next_seq = 1
+        self.appends = 0
+        self.removes = 0
+        self.compactions = 0
+        self.segments_reclaimed = 0
+        os.makedirs(directory, exist_ok=True)
+        self.recover()
+
+    def __repr__(self):
+        return type(self).__name__ + '(directory={0!r}, records={1}, segments={2})'.format(
+            self.directory, len(self.index), len(self.segments))
+
+    def __len__(self):
+        return len(self.index)
+
+    def __contains__(self, seq: int):
+        return seq in self.index
+
+    def stats(self) -> dict:
+        return {
+            'records': len(self.index),
+            'live_bytes': sum(segment.live_bytes for segment in self.segments),
+            'segments': len(self.segments),
+            'appends': self.appends,
+            'removes': self.removes,
+            'compactions': self.compactions,
+            'segments_reclaimed': self.segments_reclaimed,
+        }
+
+    def segment_path(self, number: int) -> str:
+        return os.path.join(self.directory, '{0:08d}.log'.format(number))
+
+    def recover(self):
+        numbers = sorted(int(name[:-4]) for name in os.listdir(self.directory)
+                         if name.endswith('.log') and name[:-4].isdigit())
+        for number in numbers:
+            path = self.segment_path(number)
+            if os.path.getsize(path) == 0:
+                os.remove(path)
+                continue
+            segment = Segment(number, path)
+            self.segments.append(segment)
+            self.scan(segment)
+        self.release_segments()
+
+    def scan(self, segment: Segment):
+        mm = segment.mm
+        offset = 0
+        while offset + RECORD.size <= segment.size:
+            kind, length, seq, crc = RECORD.unpack_from(mm, offset)
+            end = offset + RECORD.size + length
+            if kind not in (RECORD_DATA, RECORD_ACK, RECORD_STATE) or end > segment.size:
+                break
+            if zlib.crc32(mm[offset + RECORD.size:end], zlib.crc32(mm[offset:offset + RECORD_FIELDS.size])) != crc:
+                break
+            if kind == RECORD_DATA:
+                # A message moved by compact() shows up again further on; the later copy wins.
+                self.forget(seq)
+                self.index[seq] = (segment, offset + RECORD.size, length)
+                segment.live += 1
+                segment.live_bytes += RECORD.size + length
+            elif kind == RECORD_STATE:
+                if seq in self.index:
+                    self.states[seq] = mm[offset + RECORD.size:end]
+            else:
+                self.forget(seq)
+            self.next_seq = max(self.next_seq, seq + 1)
+            offset = end
+        segment.end = offset
+
+    def forget(self, seq: int):
+        self.states.pop(seq, None)
+        entry = self.index.pop(seq, None)
+        if entry is not None:
+            segment, offset, length = entry
+            segment.live -= 1
+            segment.live_bytes -= RECORD.size + length
+        return entry
+
+    def append(self, buffers) -> int:
+        """Copy a message, given as a buffer or a list of buffers, into the log."""
+        if not isinstance(buffers, (list, tuple)):
+            buffers = [buffers]
+        length = 0
+        for buffer in buffers:
+            length += buffer_length(buffer)
+        seq = self.next_seq
+        self.next_seq += 1
+        rolled = self.write_record(RECORD_DATA, seq, buffers, length)
+        self.appends += 1
+        if rolled:
+            self.compact()
+        return seq
+
+    def remove(self, seq: int):
+        """Mark a message acknowledged.  Unknown sequence numbers are ignored."""
+        if self.forget(seq) is None:
+            return
+        self.removes += 1
+        self.write_record(RECORD_ACK, seq, (), 0)
+        self.release_segments()
+        if not self.index and len(self.segments) == 1:
+            self.rewind()
+
+    def set_state(self, seq: int, state: bytes):
+        """Keep state with a live message, replacing any earlier one.  Unknown sequence numbers are ignored."""
+        if seq not in self.index:
+            return
+        self.states[seq] = state
+        if self.write_record(RECORD_STATE, seq, [state], len(state)):
+            self.compact()
+
+    def get_state(self, seq: int) -> bytes:
+        return self.states.get(seq)
+
+    def read(self, seq: int) -> bytes:
+        segment, offset, length = self.index[seq]
+        return segment.mm[offset:offset + length]
+
+    def records(self):
+        """Yield (sequence number, bytes) for each live message, oldest first."""
+        for seq in sorted(self.index):
+            yield seq, self.read(seq)
+
+    def write_record(self, kind: int, seq: int, buffers, length: int) -> bool:
+        """Write a record at the tail, starting a new segment if need be.  True if one was."""
+        size = RECORD.size + length
+        rolled = False
+        if not self.segments or self.segments[-1].end + size > self.segments[-1].size:
+            self.roll(size)
+            rolled = True
+        segment = self.segments[-1]
+        mm = segment.mm
+        offset = segment.end
+        fields = RECORD_FIELDS.pack(kind, length, seq)
+        crc = zlib.crc32(fields)
+        position = offset + RECORD.size
+        for buffer in buffers:
+            n = buffer_length(buffer)
+            mm[position:position + n] = buffer
+            crc = zlib.crc32(buffer, crc)
+            position += n
+        if position < segment.size:
+            mm[position] = 0
+        RECORD.pack_into(mm, offset, kind, length, seq, crc)
+        segment.end = position
+        if kind == RECORD_DATA:
+            self.index[seq] = (segment, offset + RECORD.size, length)
+            segment.live += 1
+            segment.live_bytes += size
+        if self.sync:
+            mm.flush()
+        return rolled
+
+    def roll(self, size: int):
+        number = self.segments[-1].number + 1 if self.segments else 1
+        # One byte more than the record, for the end marker.
+        segment = Segment(number, self.segment_path(number), max(self.segment_size, size + 1))
+        self.segments.append(segment)
+
+    def compact(self):
+        """
+        Move the live messages of the oldest segments to the tail and reclaim those segments,
+        while no more than compact_ratio of their bytes are live.
+        """
+        for segment in self.segments[:-1]:
+            if segment.live_bytes > segment.end * self.compact_ratio:
+                break
+            moved = [(seq, entry) for seq, entry in self.index.items() if entry[0] is segment]
+            for seq, (_, offset, length) in moved:
+                data = segment.mm[offset:offset + length]
+                state = self.states.get(seq)
+                self.forget(seq)
+                self.write_record(RECORD_DATA, seq, [data], length)
+                if state is not None:
+                    # After the data, so a scan finds it in effect.
+                    self.states[seq] = state
+                    self.write_record(RECORD_STATE, seq, [state], len(state))
+            self.compactions += 1
+            self.release_segments()
+
+    def release_segments(self):
+        # Segments only go oldest first: an older one may hold messages acked by later ones.
+        while len(self.segments) > 1 and not self.segments[0].live:
+            self.delete(self.segments.pop(0))
+
+    def rewind(self):
+        """Start over at the beginning of the only segment, once no message is live."""
+        segment = self.segments[0]
+        segment.mm[0] = 0
+        segment.end = 0
+        if self.sync:
+            segment.mm.flush()
+
+    def delete(self, segment: Segment):
+        segment.close()
+        os.remove(segment.path)
+        self.segments_reclaimed += 1
+
+    def flush(self):
+        for segment in self.segments:
+            segment.mm.flush()
+
+    def close(self):
+        self.flush()
+        for segment in self.segments:
+            segment.close()
+        self.segments = []
+        self.index.clear()
+        self.states.clear()
@@ -0,0 +1,96 @@
+import asyncio
+import collections
+import tempfile
+
+
+class PublishStream:
+    """
+    Chunked reader for the payload of a PUBLISH received in streaming mode.  The protocol
+    feeds payload bytes as they arrive; once more than limit bytes are waiting to be read,
+    reading from the socket is paused until the consumer catches up.
+    """
+    def __init__(self, length: int, limit: int, pause=None, resume=None):
+        self.length = length
+        self.limit = limit
+        self.received = 0
+        self.chunks = collections.deque()
+        self.buffered = 0
+        self.eof = length == 0
+        self.exception = None
+        self.waiter = None
+        self.paused = False
+        self.pause = pause
+        self.resume = resume
+
+    def __repr__(self):
+        return type(self).__name__ + '(length={0}, received={1}, buffered={2})'.format(
+            self.length, self.received, self.buffered)
+
+    def wake_waiter(self):
+        waiter, self.waiter = self.waiter, None
+        if waiter is not None and not waiter.done():
+            waiter.set_result(None)
+
+    def feed(self, chunk: bytes):
+        self.chunks.append(chunk)
+        self.received += len(chunk)
+        self.buffered += len(chunk)
+        if self.received >= self.length:
+            self.eof = True
+        if self.buffered > self.limit and not self.paused and self.pause is not None:
+            self.paused = True
+            self.pause()
+        self.wake_waiter()
+
+    def set_exception(self, exc: Exception):
+        self.exception = exc
+        self.wake_waiter()
+
+    def resume_if_drained(self):
+        if self.paused and self.buffered <= self.limit // 2:
+            self.paused = False
+            self.resume()
+
+    async def read(self) -> bytes:
+        """Return the next chunk of the payload, or b'' once all of it has been read."""
+        while not self.chunks:
+            if self.eof:
+                return b''
+            if self.exception is not None:
+                raise self.exception
+            self.waiter = asyncio.get_event_loop().create_future()
+            await self.waiter
+
+        chunk = self.chunks.popleft()
+        self.buffered -= len(chunk)
+        self.resume_if_drained()
+        return chunk
+
+    async def readall(self) -> bytes:
+        out = bytearray()
+        async for chunk in self:
+            out.extend(chunk)
+        return bytes(out)
+
+    async def spool(self, file=None):
+        """
+        Copy the rest of the payload into file (a new temporary file by default) and return
+        the file, rewound to the start.  Pass the result to mmap for random access.
+        """
+        if file is None:
+            file = tempfile.TemporaryFile()
+        loop = asyncio.get_event_loop()
+        async for chunk in self:
+            await loop.run_in_executor(None, file.write, chunk)
+        file.flush()
+        file.seek(0)
+        return file
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        chunk = await self.read()
+        if not chunk:
+            raise StopAsyncIteration
+        return chunk
@@ -1,4 +1,5 @@
 import random
+from collections import OrderedDict
 
 from asyncmqtt import MQTTException
 
@@ -15,11 +16,28 @@ def int_to_bytes(data: int, length: int) -> bytes:
     return data.to_bytes(length, byteorder='big')
 
 
+def buffer_length(data) -> int:
+    """Length in bytes of any buffer object (bytes, bytearray, memoryview, mmap)."""
+    if data is None:
+        return 0
+    if isinstance(data, memoryview):
+        return data.nbytes
+    return len(data)
+
+
 def encode_string(string: str) -> bytes:
     payload = string.encode('utf-8')
     return int_to_bytes(len(payload), 2) + payload
 
 
+def decode_utf8(data) -> str:
+    try:
+        return str(data, 'utf-8')
+    except UnicodeDecodeError as exc:
+        # [MQTT-1.5.3-1]
+        raise MQTTException('invalid UTF-8 string: %s' % exc)
+
+
 def decode_string(data: bytes) -> str:
     if len(data) < 2:
         raise MQTTException('packet not large enough to contain any data, length=%d' % len(data))
@@ -28,8 +46,117 @@ def decode_string(data: bytes) -> str:
     if not data_len:
         return ''
 
-    return data[2:2 + data_len].decode('utf-8')
+    return decode_utf8(data[2:2 + data_len])
+
+
+def encode_data_with_length(data: bytes) -> bytes:
+    return int_to_bytes(buffer_length(data), 2) + bytes(data)
+
+
+def decode_data(data: bytes) -> bytes:
+    """Decode length-prefixed binary data, as a copy, so no view of data is kept."""
+    if len(data) < 2:
+        raise MQTTException('packet not large enough to contain any data, length=%d' % len(data))
+
+    return bytes(data[2:2 + ((data[0] << 8) | data[1])])
+
+
+def decode_string_at(data: bytes, offset: int) -> (str, int):
+    """Decode the length-prefixed string at data[offset], returning it and the offset after it."""
+    if len(data) < offset + 2:
+        raise MQTTException('packet not large enough to contain any data, length=%d' % (len(data) - offset))
+
+    end = offset + 2 + ((data[offset] << 8) | data[offset + 1])
+    if end > len(data):
+        raise MQTTException('string of %d bytes overruns the packet' % (end - offset - 2))
+    return decode_utf8(data[offset + 2:end]), end
 
 
 def gen_client_id() -> str:
     return 'asyncmqtt/' + ''.join(format(random.randint(0, 256), '02x') for i in range(10))
+
+
+class TopicCache:
+    """
+    Bounded LRU cache for topic names.  Decoding maps the raw topic bytes to one shared str;
+    encoding maps a topic str to its length-prefixed bytes.  Topics come from a small working
+    set in practice, so most lookups skip UTF-8 work entirely.
+    """
+    def __init__(self, maxsize: int=4096):
+        self.maxsize = maxsize
+        self.decoded = OrderedDict()
+        self.encoded = OrderedDict()
+        self.decode_hits = 0
+        self.decode_misses = 0
+        self.encode_hits = 0
+        self.encode_misses = 0
+
+    def __repr__(self):
+        return type(self).__name__ + '(maxsize={0}, stats={1!r})'.format(self.maxsize, self.stats())
+
+    def stats(self) -> dict:
+        return {
+            'decode_hits': self.decode_hits,
+            'decode_misses': self.decode_misses,
+            'encode_hits': self.encode_hits,
+            'encode_misses': self.encode_misses,
+            'decoded_size': len(self.decoded),
+            'encoded_size': len(self.encoded),
+        }
+
+    def clear(self):
+        self.decoded.clear()
+        self.encoded.clear()
+
+    def decode(self, data) -> str:
+        """Decode topic bytes (bytes or a read-only memoryview, without the length prefix)."""
+        topic = self.decoded.get(data)
+        if topic is not None:
+            self.decode_hits += 1
+            self.decoded.move_to_end(data)
+            return topic
+
+        self.decode_misses += 1
+        data = bytes(data)
+        topic = decode_utf8(data)
+        self.decoded[data] = topic
+        if len(self.decoded) > self.maxsize:
+            self.decoded.popitem(last=False)
+        return topic
+
+    def encode(self, topic: str) -> bytes:
+        """Return the length-prefixed UTF-8 encoding of topic."""
+        encoded = self.encoded.get(topic)
+        if encoded is not None:
+            self.encode_hits += 1
+            self.encoded.move_to_end(topic)
+            return encoded
+
+        self.encode_misses += 1
+        encoded = encode_string(topic)
+        self.encoded[topic] = encoded
+        if len(self.encoded) > self.maxsize:
+            self.encoded.popitem(last=False)
+        return encoded
+
+
+topic_cache = TopicCache()
+
+
+def encode_topic(topic: str) -> bytes:
+    return topic_cache.encode(topic)
+
+
+def decode_topic(data) -> str:
+    return topic_cache.decode(data)
+
+
+def decode_topic_at(data: bytes, offset: int) -> (str, int):
+    """Like decode_string_at(), but through the topic cache."""
+    if len(data) < offset + 2:
+        raise MQTTException('packet not large enough to contain any data, length=%d' % (len(data) - offset))
+
+    end = offset + 2 + ((data[offset] << 8) | data[offset + 1])
+    if end > len(data):
+        raise MQTTException('topic of %d bytes overruns the packet' % (end - offset - 2))
+    return topic_cache.decode(bytes(data[offset + 2:end])), end
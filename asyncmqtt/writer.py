@@ -0,0 +1,163 @@
+import asyncio
+import collections
+
+from asyncmqtt.util import buffer_length
+
+
+class OutboundWriter:
+    """
+    Collects encoded packets and writes them to the transport with a single writelines() call,
+    so many small packets sent during one event loop iteration cost one send instead of one
+    each.  Buffered packets are flushed on the next loop iteration, or max_delay seconds later
+    if set, or as soon as max_bytes are buffered.  Urgent writes flush immediately, behind
+    whatever was buffered before them.
+
+    Packets are either control packets (acknowledgements, PINGREQ, SUBSCRIBE, ...) or bulk
+    packets (PUBLISH).  Each flush writes all control packets first, then at most max_bytes of
+    bulk packets.  While the transport has paused writing, bulk packets are kept here instead
+    of piling up in the transport's buffer, so control packets don't queue behind them; after
+    max_control_streak flushes of control packets only, one bulk packet is let through anyway
+    so bulk traffic is never starved.
+
+    While held (during a streamed PUBLISH), packets are buffered but not flushed, so they are
+    not written into the middle of the stream; write_now() writes around the buffer.
+    """
+    def __init__(self, transport=None, max_bytes: int=65536, max_delay: float=None,
+                 max_control_streak: int=16):
+        self.transport = transport
+        self.max_bytes = max_bytes
+        self.max_delay = max_delay
+        self.max_control_streak = max_control_streak
+        self.control = []
+        self.control_size = 0
+        self.bulk = collections.deque()
+        self.bulk_size = 0
+        self.handle = None
+        self.held = False
+        self.paused = False
+        self.control_streak = 0
+        self.flushes = 0
+        self.buffers_written = 0
+        self.on_write = None
+
+    def __repr__(self):
+        return type(self).__name__ + '(control={0}, bulk={1}, held={2}, paused={3})'.format(
+            len(self.control), len(self.bulk), self.held, self.paused)
+
+    def stats(self) -> dict:
+        return {
+            'control_buffers': len(self.control),
+            'control_bytes': self.control_size,
+            'bulk_packets': len(self.bulk),
+            'bulk_bytes': self.bulk_size,
+            'flushes': self.flushes,
+            'buffers_written': self.buffers_written,
+        }
+
+    def write(self, buffers: list, urgent: bool=False, bulk: bool=False):
+        size = 0
+        for buffer in buffers:
+            size += buffer_length(buffer)
+        if bulk:
+            self.bulk.append((buffers, size))
+            self.bulk_size += size
+        else:
+            self.control.extend(buffers)
+            self.control_size += size
+        if self.held:
+            return
+        if urgent or self.control_size + self.bulk_size >= self.max_bytes:
+            self.flush()
+        else:
+            self.schedule()
+
+    def write_now(self, data):
+        """Write data straight to the transport, bypassing anything buffered."""
+        self.transport.write(data)
+        if self.on_write is not None:
+            self.on_write()
+
+    def schedule(self, delay: float=None):
+        if self.handle is None:
+            loop = asyncio.get_event_loop()
+            delay = self.max_delay if delay is None else delay
+            if delay:
+                self.handle = loop.call_later(delay, self.flush)
+            else:
+                self.handle = loop.call_soon(self.flush)
+
+    def flush(self):
+        if self.handle is not None:
+            self.handle.cancel()
+            self.handle = None
+        if self.held:
+            return
+
+        out, self.control = self.control, []
+        self.control_size = 0
+        if self.bulk:
+            if not self.paused:
+                self.take_bulk(out, self.max_bytes)
+                self.control_streak = 0
+                if self.bulk:
+                    # Leave room for control packets sent meanwhile.
+                    self.schedule(0)
+            elif self.control_streak >= self.max_control_streak:
+                self.take_bulk(out, 1)
+                self.control_streak = 0
+            elif out:
+                self.control_streak += 1
+        self.write_out(out)
+
+    def flush_all(self):
+        """Write everything buffered, bulk included, even while paused."""
+        if self.handle is not None:
+            self.handle.cancel()
+            self.handle = None
+        out, self.control = self.control, []
+        self.control_size = 0
+        self.take_bulk(out, self.bulk_size)
+        self.write_out(out)
+
+    def take_bulk(self, out: list, budget: int):
+        bulk = self.bulk
+        while bulk and budget > 0:
+            buffers, size = bulk.popleft()
+            out.extend(buffers)
+            self.bulk_size -= size
+            budget -= size
+
+    def write_out(self, out: list):
+        if out:
+            self.flushes += 1
+            self.buffers_written += len(out)
+            self.transport.writelines(out)
+            if self.on_write is not None:
+                self.on_write()
+
+    def pause(self):
+        self.paused = True
+
+    def resume(self):
+        self.paused = False
+        if self.bulk and not self.held:
+            self.flush()
+
+    def hold(self):
+        """Flush everything buffered, then buffer everything until release()."""
+        self.flush_all()
+        self.held = True
+
+    def release(self):
+        self.held = False
+        self.flush()
+
+    def clear(self):
+        """Drop everything buffered, for a connection which is gone."""
+        if self.handle is not None:
+            self.handle.cancel()
+            self.handle = None
+        self.control = []
+        self.control_size = 0
+        self.bulk.clear()
+        self.bulk_size = 0
@@ -0,0 +1,137 @@
+"""
+Codec microbenchmarks: encode and decode every packet type, PUBLISH with payloads from 0 B
+to 16 MB, the bare fixed header, and decode_buffer() fed a stream of mixed frames split at
+random read boundaries.  Run from the repository root:
+
+    python benchmarks/bench_codec.py [--quick]
+"""
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from harness import result, ns_per_op, print_results
+from asyncmqtt.client import MQTTClientProtocol, MQTTBufferedClientProtocol
+from asyncmqtt.packet import MQTTFixedHeader, PUBLISH
+from asyncmqtt.packet_connect import ConnectPacket
+from asyncmqtt.packet_connack import ConnackPacket
+from asyncmqtt.packet_publish import PublishPacket, SharedPublish
+from asyncmqtt.packet_subscribe import SubscribePacket
+from asyncmqtt.packet_suback import SubackPacket
+from asyncmqtt.packet_unsubscribe import UnsubscribePacket
+from asyncmqtt.packet_ack import PubackPacket, PubrecPacket, PubrelPacket, PubcompPacket, UnsubackPacket
+from asyncmqtt.packet_ping import PingReqPacket, PingRespPacket
+
+
+PAYLOAD_SIZES = (0, 64, 1024, 65536, 1048576, 16777216)
+QUICK_PAYLOAD_SIZES = (0, 64, 1024, 65536)
+# (name, low, high) bounds of the read sizes decode_buffer() is fed.
+SPLITS = (('small', 1, 64), ('mtu', 1, 1500), ('large', 1, 65536))
+
+
+def packets() -> list:
+    """(name, packet) for every packet type except PUBLISH, and DISCONNECT which has no class."""
+    connect = ConnectPacket()
+    connect.client_id = 'asyncmqtt/bench'
+    connect.username = 'user'
+    connect.password = 'secret'
+    connect.will_flag = True
+    connect.will_topic = 'clients/bench/status'
+    connect.will_message = b'offline'
+    return [
+        ('connect', connect),
+        ('connack', ConnackPacket.build(0, True)),
+        ('puback', PubackPacket.build(1)),
+        ('pubrec', PubrecPacket.build(1)),
+        ('pubrel', PubrelPacket.build(1)),
+        ('pubcomp', PubcompPacket.build(1)),
+        ('subscribe', SubscribePacket.build([('sensors/+/temperature', 1), ('alerts/#', 2)], 1)),
+        ('suback', SubackPacket.build(1, [1, 2])),
+        ('unsubscribe', UnsubscribePacket.build(['sensors/+/temperature', 'alerts/#'], 1)),
+        ('unsuback', UnsubackPacket.build(1)),
+        ('pingreq', PingReqPacket()),
+        ('pingresp', PingRespPacket()),
+    ]
+
+
+def codec_benchmarks(quick: bool=False) -> list:
+    results = []
+    data = bytes(MQTTFixedHeader(PUBLISH, 0, 300).to_bytes())
+    results.append(result('codec.decode.fixed_header', ns_per_op(lambda: MQTTFixedHeader.decode(data)), 'ns/op'))
+
+    for name, packet in packets():
+        cls = type(packet)
+        data = bytes(packet.to_bytes())
+        results.append(result('codec.encode.%s' % name, ns_per_op(packet.to_bytes), 'ns/op'))
+        results.append(result('codec.decode.%s' % name, ns_per_op(lambda: cls.from_bytes(data)), 'ns/op'))
+
+    for size in QUICK_PAYLOAD_SIZES if quick else PAYLOAD_SIZES:
+        payload = b'x' * size
+        packet = PublishPacket.build('sensors/a/temperature', payload, 1, False, 1, False)
+        data = bytes(packet.to_bytes())
+        received = PublishPacket.from_bytes(data)
+        shared = SharedPublish.from_packet(received)
+        results.append(result('codec.encode.publish.%dB' % size, ns_per_op(packet.to_bytes), 'ns/op'))
+        results.append(result('codec.encode_buffers.publish.%dB' % size, ns_per_op(packet.to_buffers), 'ns/op'))
+        results.append(result('codec.encode_shared.publish.%dB' % size,
+                              ns_per_op(lambda: shared.copy(1, 7).to_buffers()), 'ns/op'))
+        results.append(result('codec.decode.publish.%dB' % size,
+                              ns_per_op(lambda: PublishPacket.from_bytes(data)), 'ns/op'))
+    return results
+
+
+def frame_stream(count: int, rng: random.Random) -> bytes:
+    """count frames of the kinds a client receives, mostly small PUBLISH packets."""
+    frames = []
+    for i in range(count):
+        kind = rng.random()
+        if kind < 0.8:
+            payload = b'x' * rng.choice((0, 16, 64, 256, 1024))
+            frames.append(PublishPacket.build('sensors/%d/temperature' % (i % 100), payload, None, False, 0, False))
+        elif kind < 0.9:
+            frames.append(PublishPacket.build('bulk/%d' % (i % 10), b'x' * 16384, None, False, 0, False))
+        elif kind < 0.95:
+            frames.append(SubackPacket.build(i % 65535 + 1, [1]))
+        else:
+            frames.append(PingRespPacket())
+    return b''.join(bytes(frame.to_bytes()) for frame in frames)
+
+
+def split(data: bytes, low: int, high: int, rng: random.Random) -> list:
+    chunks = []
+    needle = 0
+    while needle < len(data):
+        size = rng.randint(low, high)
+        chunks.append(data[needle:needle + size])
+        needle += size
+    return chunks
+
+
+def decode_buffer_benchmarks(quick: bool=False) -> list:
+    rng = random.Random(1234)
+    count = 2000 if quick else 20000
+    data = frame_stream(count, rng)
+    results = []
+    for split_name, low, high in SPLITS:
+        chunks = split(data, low, high, rng)
+        for protocol_name, protocol_class in (('client', MQTTClientProtocol), ('buffered', MQTTBufferedClientProtocol)):
+            def feed():
+                client = protocol_class()
+                for chunk in chunks:
+                    client.data_received(chunk)
+            elapsed = ns_per_op(feed, min_time=0.1, repeat=3)
+            results.append(result('decode_buffer.%s.%s' % (protocol_name, split_name), elapsed / count, 'ns/frame'))
+    return results
+
+
+def benchmarks(quick: bool=False) -> list:
+    return codec_benchmarks(quick) + decode_buffer_benchmarks(quick)
+
+
+def main():
+    print_results(benchmarks('--quick' in sys.argv))
+
+
+if __name__ == '__main__':
+    main()
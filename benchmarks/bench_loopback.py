@@ -0,0 +1,131 @@
+"""
+End-to-end loopback benchmark: a publisher and a subscriber connected over TCP to an
+in-process MQTTBroker.  Measures throughput at QoS 0, 1 and 2, with the publisher writing in
+batches and waiting on drain(), and the publish-to-delivery latency of single messages,
+timestamped in their payload.  Run from the repository root:
+
+    python benchmarks/bench_loopback.py [--quick]
+"""
+import asyncio
+import os
+import struct
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from harness import result, percentile, print_results
+from asyncmqtt.broker import MQTTBroker
+from asyncmqtt.client import MQTTClientProtocol
+
+TIMESTAMP = struct.Struct('!Q')
+
+
+async def connect(port: int) -> MQTTClientProtocol:
+    loop = asyncio.get_event_loop()
+    transport, client = await loop.create_connection(MQTTClientProtocol, '127.0.0.1', port)
+    await client.connect()
+    # The CONNACK is queued on msgq as well.
+    await client.next_message()
+    return client
+
+
+async def subscribe(port: int, topic: str, qos: int) -> MQTTClientProtocol:
+    client = await connect(port)
+    await client.subscribe([(topic, qos)])
+    # So is the SUBACK.
+    await client.next_message()
+    return client
+
+
+async def receive(client: MQTTClientProtocol, count: int, idle: float=2.0) -> tuple:
+    """
+    Take messages off msgq until count arrived or none came for idle seconds.  Returns how
+    many arrived and when the last one did.
+    """
+    received = 0
+    last = time.perf_counter()
+    while received < count:
+        batch = await client.next_messages(4096, idle)
+        if not batch:
+            break
+        received += len(batch)
+        last = time.perf_counter()
+    return received, last
+
+
+async def throughput(port: int, qos: int, count: int, size: int, batch: int=1000) -> tuple:
+    subscriber = await subscribe(port, 'bench/throughput', qos)
+    publisher = await connect(port)
+    payload = b'x' * size
+
+    start = time.perf_counter()
+    receiving = asyncio.ensure_future(receive(subscriber, count))
+    futures = []
+    for i in range(0, count, batch):
+        for j in range(min(batch, count - i)):
+            futures.append(publisher.publish('bench/throughput', payload, qos))
+        await publisher.drain()
+    await asyncio.gather(*futures)
+    received, last = await receiving
+    elapsed = last - start
+
+    publisher.disconnect()
+    subscriber.disconnect()
+    return received / elapsed, count - received
+
+
+async def latency(port: int, qos: int, count: int) -> list:
+    """Delivery times in microseconds of count messages, each sent once the last completed."""
+    subscriber = await subscribe(port, 'bench/latency', qos)
+    publisher = await connect(port)
+
+    samples = []
+    for i in range(count):
+        published = publisher.publish('bench/latency', TIMESTAMP.pack(time.perf_counter_ns()), qos)
+        message = await asyncio.wait_for(subscriber.next_message(), 5)
+        samples.append((time.perf_counter_ns() - TIMESTAMP.unpack(message.data)[0]) / 1000)
+        await published
+
+    publisher.disconnect()
+    subscriber.disconnect()
+    return samples
+
+
+async def run(quick: bool) -> list:
+    count = 10000 if quick else 100000
+    latency_count = 1000 if quick else 10000
+    # Queue every QoS 1/2 message rather than dropping the oldest.
+    broker = MQTTBroker(max_queued=count)
+    await broker.start(port=0)
+    results = []
+    try:
+        for qos in (0, 1, 2):
+            rate, lost = await throughput(broker.port, qos, count, 32)
+            results.append(result('loopback.throughput.qos%d' % qos, rate, 'msg/s', lower_is_better=False))
+            if lost:
+                results.append(result('loopback.lost.qos%d' % qos, lost, 'messages'))
+        for qos in (0, 1, 2):
+            samples = await latency(broker.port, qos, latency_count)
+            results.append(result('loopback.latency.qos%d.p50' % qos, percentile(samples, 50), 'us'))
+            results.append(result('loopback.latency.qos%d.p99' % qos, percentile(samples, 99), 'us'))
+    finally:
+        broker.close()
+        await broker.wait_closed()
+    return results
+
+
+def benchmarks(quick: bool=False) -> list:
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(run(quick))
+    finally:
+        loop.close()
+
+
+def main():
+    print_results(benchmarks('--quick' in sys.argv))
+
+
+if __name__ == '__main__':
+    main()
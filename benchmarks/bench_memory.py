@@ -0,0 +1,52 @@
+"""
+Memory per queued message: decode PUBLISH packets through MQTTClientProtocol into msgq and
+report the traced allocation per message.  Run from the repository root:
+
+    python benchmarks/bench_memory.py
+"""
+import gc
+import os
+import sys
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from harness import result
+from asyncmqtt.client import MQTTClientProtocol
+from asyncmqtt.packet_publish import PublishPacket
+
+
+def measure(count, touch):
+    data = b''.join(bytes(PublishPacket.build('sensors/%d/temperature' % (i % 100), b'x' * 32, i % 65535 + 1,
+                                              False, 1, False).to_bytes())
+                    for i in range(count))
+    client = MQTTClientProtocol()
+    gc.collect()
+    tracemalloc.start()
+    start = tracemalloc.get_traced_memory()[0]
+    for needle in range(0, len(data), 65536):
+        client.data_received(data[needle:needle + 65536])
+    if touch:
+        for message in client.msgq._queue:
+            message.variable_header, message.payload
+    gc.collect()
+    used = tracemalloc.get_traced_memory()[0] - start
+    tracemalloc.stop()
+    return used / client.msgq.qsize()
+
+
+def benchmarks(quick: bool=False) -> list:
+    count = 10000 if quick else 100000
+    return [
+        result('memory.queued.lazy', measure(count, False), 'bytes/message'),
+        result('memory.queued.materialized', measure(count, True), 'bytes/message'),
+    ]
+
+
+def main(count=100000):
+    print('%-24s %6.0f bytes/message' % ('lazy (as queued)', measure(count, False)))
+    print('%-24s %6.0f bytes/message' % ('headers materialized', measure(count, True)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+"""
+QoS 1/2 publish throughput through the inflight window, against an in-process peer which
+acknowledges everything written in the previous loop iteration.  Run from the repository root:
+
+    python benchmarks/bench_publish.py
+"""
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from harness import result
+from asyncmqtt.client import MQTTClientProtocol
+from asyncmqtt.packet import MQTTFixedHeader, PUBLISH, PUBREL
+from asyncmqtt.packet_template import puback, pubrec, pubcomp
+
+
+class AckingTransport:
+    """Collects written packets and answers them on the next loop iteration, like a broker."""
+    def __init__(self, protocol, loop):
+        self.protocol = protocol
+        self.loop = loop
+        self.buffers = []
+        self.scheduled = False
+        self.writes = 0
+
+    def write(self, data):
+        self.writelines([data])
+
+    def writelines(self, buffers):
+        self.writes += 1
+        self.buffers.extend(buffers)
+        if not self.scheduled:
+            self.scheduled = True
+            self.loop.call_soon(self.answer)
+
+    def is_closing(self):
+        return False
+
+    def answer(self):
+        self.scheduled = False
+        data = b''.join(self.buffers)
+        self.buffers.clear()
+        replies = []
+        needle = 0
+        while needle < len(data):
+            fixed, header_length = MQTTFixedHeader.decode(data, needle)
+            body = needle + header_length
+            if fixed.packet_type == PUBLISH:
+                topic_end = body + 2 + ((data[body] << 8) | data[body + 1])
+                packet_id = (data[topic_end] << 8) | data[topic_end + 1]
+                qos = (fixed.flags >> 1) & 0x03
+                replies.append(puback(packet_id) if qos == 1 else pubrec(packet_id))
+            elif fixed.packet_type == PUBREL:
+                replies.append(pubcomp((data[body] << 8) | data[body + 1]))
+            needle = body + fixed.remaining_length
+        if replies:
+            self.protocol.data_received(b''.join(replies))
+
+
+async def run(qos, count, window):
+    loop = asyncio.get_event_loop()
+    client = MQTTClientProtocol(max_inflight=window)
+    transport = AckingTransport(client, loop)
+    client.connection_made(transport)
+
+    start = time.perf_counter()
+    futures = [client.publish('sensors/a/temperature', b'x' * 32, qos) for i in range(count)]
+    await asyncio.gather(*futures)
+    await asyncio.sleep(0)
+    return count / (time.perf_counter() - start), transport.writes
+
+
+def benchmarks(quick: bool=False, window: int=10000) -> list:
+    count = 10000 if quick else 100000
+    loop = asyncio.new_event_loop()
+    results = []
+    try:
+        for qos in (0, 1, 2):
+            rate, writes = loop.run_until_complete(run(qos, count, window))
+            results.append(result('publish.window.qos%d' % qos, rate, 'msg/s', lower_is_better=False))
+    finally:
+        loop.close()
+    return results
+
+
+def main(count=100000, window=10000):
+    loop = asyncio.new_event_loop()
+    for qos in (0, 1, 2):
+        rate, writes = loop.run_until_complete(run(qos, count, window))
+        print('qos %d, window %d: %8.0f msg/s, %d writes' % (qos, window, rate, writes))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+"""
+Shared pieces of the benchmark suite: timing, results, and comparison against a baseline.
+
+Each benchmark module has a benchmarks(quick) function returning a list of results, dicts
+with a name, a value, its unit and whether lower values are better.
+"""
+import json
+import platform
+import sys
+import time
+import timeit
+
+
+def result(name: str, value: float, unit: str, lower_is_better: bool=True) -> dict:
+    return {'name': name, 'value': value, 'unit': unit, 'lower_is_better': lower_is_better}
+
+
+def ns_per_op(func, min_time: float=0.2, repeat: int=5) -> float:
+    """Best of repeat runs of func, in nanoseconds per call; each run lasts at least min_time."""
+    timer = timeit.Timer(func)
+    number = 1
+    while True:
+        elapsed = timer.timeit(number)
+        if elapsed >= min_time:
+            break
+        number = max(number * 2, int(number * min_time / max(elapsed, 1e-9)))
+    best = min([elapsed] + timer.repeat(repeat - 1, number))
+    return best / number * 1e9
+
+
+def percentile(samples: list, p: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * p / 100))]
+
+
+def report(results: list) -> dict:
+    return {
+        'python': sys.version.split()[0],
+        'implementation': platform.python_implementation(),
+        'platform': platform.platform(),
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'results': {r['name']: r for r in results},
+    }
+
+
+def save(report: dict, path: str):
+    with open(path, 'w') as f:
+        json.dump(report, f, indent=2, sort_keys=True)
+
+
+def load(path: str) -> dict:
+    with open(path) as f:
+        return json.load(f)
+
+
+def compare(current: dict, baseline: dict) -> list:
+    """
+    Return (name, baseline value, current value, change) for every result both reports have.
+    change is the relative slowdown, positive when the current value is worse.
+    """
+    rows = []
+    for name, now in sorted(current['results'].items()):
+        before = baseline['results'].get(name)
+        if before is None or not before['value']:
+            continue
+        change = (now['value'] - before['value']) / before['value']
+        if not now['lower_is_better']:
+            change = -change
+        rows.append((name, before['value'], now['value'], change))
+    return rows
+
+
+def print_results(results: list):
+    for r in results:
+        print('%-48s %14.1f %s' % (r['name'], r['value'], r['unit']))
+
+
+def print_comparison(rows: list, threshold: float) -> int:
+    """Print the comparison; returns the number of results worse than threshold."""
+    regressions = 0
+    for name, before, now, change in rows:
+        flag = ''
+        if change > threshold:
+            flag = '  REGRESSION'
+            regressions += 1
+        elif change < -threshold:
+            flag = '  improved'
+        print('%-48s %14.1f -> %14.1f  %+6.1f%%%s' % (name, before, now, change * 100, flag))
+    return regressions
@@ -0,0 +1,60 @@
+"""
+Run the benchmark suite, optionally save the results as JSON and compare them against a
+baseline saved earlier.  Exits with status 1 if any result is worse than the baseline by more
+than the threshold.  Run from the repository root:
+
+    python benchmarks/run.py [--quick] [--only codec,loopback] [--json results.json]
+                             [--baseline baseline.json] [--threshold 0.1]
+"""
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import harness
+import bench_codec
+import bench_loopback
+import bench_memory
+import bench_publish
+
+MODULES = {
+    'codec': bench_codec,
+    'publish': bench_publish,
+    'memory': bench_memory,
+    'loopback': bench_loopback,
+}
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description='Run the asyncmqtt benchmark suite.')
+    parser.add_argument('--quick', action='store_true', help='smaller payloads and counts')
+    parser.add_argument('--only', help='comma-separated modules to run: ' + ', '.join(MODULES))
+    parser.add_argument('--json', help='save the results to this file')
+    parser.add_argument('--baseline', help='compare the results against this saved file')
+    parser.add_argument('--threshold', type=float, default=0.1,
+                        help='relative slowdown which counts as a regression (default 0.1)')
+    args = parser.parse_args(argv)
+
+    names = args.only.split(',') if args.only else list(MODULES)
+    for name in names:
+        if name not in MODULES:
+            parser.error('unknown module %r' % name)
+    results = []
+    for name in names:
+        results.extend(MODULES[name].benchmarks(args.quick))
+
+    report = harness.report(results)
+    harness.print_results(results)
+    if args.json:
+        harness.save(report, args.json)
+    if args.baseline:
+        print()
+        rows = harness.compare(report, harness.load(args.baseline))
+        if harness.print_comparison(rows, args.threshold):
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
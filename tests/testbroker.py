@@ -0,0 +1,226 @@
+import asyncio
+import unittest
+
+from asyncmqtt.broker import MQTTBroker
+from asyncmqtt.client import MQTTClientProtocol
+from asyncmqtt.session import MQTTSession
+from asyncmqtt.router import Subscription
+from asyncmqtt.packet_connect import ConnectPacket
+from asyncmqtt.packet_connack import ConnackPacket, UNACCEPTABLE_PROTOCOL_VERSION, NOT_AUTHORIZED
+from asyncmqtt.packet_template import PINGREQ_BYTES, PINGRESP_BYTES
+
+
+class MQTTBrokerTests(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.broker = MQTTBroker()
+        await self.broker.start(port=0)
+        self.clients = []
+
+    async def asyncTearDown(self):
+        for client in self.clients:
+            if not client.closed:
+                client.transport.close()
+        self.broker.close()
+        await self.broker.wait_closed()
+
+    async def connect(self, client_id=None, clean_session=None):
+        """Connect a client whose received messages all go to client.queue."""
+        session = MQTTSession(client_id)
+        queue = asyncio.Queue()
+        session.router.add(Subscription('#', 0, queue))
+        loop = asyncio.get_event_loop()
+        transport, client = await loop.create_connection(
+            lambda: MQTTClientProtocol(session=session), '127.0.0.1', self.broker.port)
+        client.queue = queue
+        self.clients.append(client)
+        connack = await asyncio.wait_for(client.connect(clean_session=clean_session), 5)
+        self.assertEqual(connack.return_code, 0)
+        return client, connack
+
+    async def raw_connect(self, packet):
+        reader, writer = await asyncio.open_connection('127.0.0.1', self.broker.port)
+        writer.write(packet.to_bytes())
+        return reader, writer
+
+    async def subscribe(self, client, topics):
+        return client.queue, await asyncio.wait_for(client.subscribe(topics), 5)
+
+    async def next_message(self, queue):
+        return await asyncio.wait_for(queue.get(), 5)
+
+    async def test_publish_subscribe(self):
+        subscriber, connack = await self.connect()
+        self.assertFalse(connack.session_present)
+        queue, codes = await self.subscribe(subscriber, [('moo/+', 2), ('cow/#', 0)])
+        self.assertEqual(codes, [2, 0])
+        publisher, connack = await self.connect()
+
+        for qos in (0, 1, 2):
+            await asyncio.wait_for(publisher.publish('moo/cow', b'qos %d' % qos, qos), 5)
+            message = await self.next_message(queue)
+            self.assertEqual(message.topic_name, 'moo/cow')
+            self.assertEqual(message.data, b'qos %d' % qos)
+            self.assertEqual(message.qos, qos)
+
+        await asyncio.wait_for(publisher.publish('cow/says', b'moo', 2), 5)
+        message = await self.next_message(queue)
+        self.assertEqual(message.qos, 0)
+        self.assertEqual(self.broker.stats()['messages_received'], 4)
+
+    async def test_fan_out(self):
+        subscribers = []
+        for qos in (0, 1, 2, 2):
+            subscriber, connack = await self.connect()
+            await self.subscribe(subscriber, [('moo', qos)])
+            subscribers.append((subscriber, qos))
+        publisher, connack = await self.connect()
+        await asyncio.wait_for(publisher.publish('moo', b'cows go moo', 2), 5)
+
+        for subscriber, qos in subscribers:
+            message = await self.next_message(subscriber.queue)
+            self.assertEqual(message.qos, qos)
+            self.assertEqual(message.data, b'cows go moo')
+
+    async def test_retained(self):
+        publisher, connack = await self.connect()
+        await asyncio.wait_for(publisher.publish('moo/cow', b'retained', 1, retain=True), 5)
+        await asyncio.wait_for(publisher.publish('moo/bull', b'cleared', 1, retain=True), 5)
+        await asyncio.wait_for(publisher.publish('moo/bull', b'', 1, retain=True), 5)
+        await asyncio.wait_for(publisher.publish('moo/calf', b'live', 1), 5)
+
+        subscriber, connack = await self.connect()
+        queue, codes = await self.subscribe(subscriber, [('moo/+', 2)])
+        message = await self.next_message(queue)
+        self.assertEqual((message.topic_name, message.data, message.qos), ('moo/cow', b'retained', 1))
+        self.assertTrue(message.retain_flag)
+
+        await asyncio.wait_for(publisher.publish('moo/cow', b'update', 0, retain=True), 5)
+        message = await self.next_message(queue)
+        self.assertEqual(message.data, b'update')
+        self.assertFalse(message.retain_flag)
+        self.assertTrue(queue.empty())
+        self.assertEqual(len(self.broker.retained), 1)
+
+    async def test_overlapping_subscriptions(self):
+        subscriber, connack = await self.connect()
+        queue, codes = await self.subscribe(subscriber, [('moo/#', 0), ('moo/cow', 1)])
+        await asyncio.wait_for(subscriber.publish('moo/cow', b'once', 1), 5)
+        message = await self.next_message(queue)
+        self.assertEqual(message.qos, 1)
+        await asyncio.sleep(0.05)
+        self.assertTrue(queue.empty())
+
+    async def test_unsubscribe(self):
+        subscriber, connack = await self.connect()
+        queue, codes = await self.subscribe(subscriber, [('moo', 0), ('cow', 0)])
+        await asyncio.wait_for(subscriber.unsubscribe(['moo']), 5)
+        subscriber.publish('moo', b'gone', 0)
+        subscriber.publish('cow', b'here', 0)
+        message = await self.next_message(queue)
+        self.assertEqual(message.topic_name, 'cow')
+
+    async def test_invalid_filter_refused(self):
+        subscriber, connack = await self.connect()
+        queue, codes = await self.subscribe(subscriber, [('moo/#/cow', 0), ('moo', 3)])
+        self.assertEqual(codes, [0x80, 0x80])
+
+    async def test_ping(self):
+        reader, writer = await self.raw_connect(ConnectPacket())
+        await reader.readexactly(4)
+        writer.write(PINGREQ_BYTES)
+        self.assertEqual(await asyncio.wait_for(reader.readexactly(2), 5), PINGRESP_BYTES)
+        writer.close()
+
+    async def test_will(self):
+        subscriber, connack = await self.connect()
+        queue, codes = await self.subscribe(subscriber, [('status/+', 1)])
+
+        for clean in (True, False):
+            cp = ConnectPacket()
+            cp.will_flag = True
+            cp.will_qos = 1
+            cp.will_topic = 'status/moo'
+            cp.will_message = b'gone'
+            reader, writer = await self.raw_connect(cp)
+            await reader.readexactly(4)
+            if clean:
+                writer.write(b'\xe0\x00')
+                await writer.drain()
+                await reader.read()
+            else:
+                writer.transport.abort()
+
+        message = await self.next_message(queue)
+        self.assertEqual(message.data, b'gone')
+        await asyncio.sleep(0.05)
+        self.assertTrue(queue.empty())
+
+    async def test_persistent_session(self):
+        subscriber, connack = await self.connect('moo', clean_session=False)
+        await self.subscribe(subscriber, [('moo', 1)])
+        subscriber.transport.close()
+        await subscriber.wait_closed()
+
+        publisher, connack = await self.connect()
+        for i in range(3):
+            await asyncio.wait_for(publisher.publish('moo', b'%d' % i, 1), 5)
+
+        subscriber, connack = await self.connect('moo', clean_session=False)
+        self.assertTrue(connack.session_present)
+        queue = subscriber.queue
+        for i in range(3):
+            message = await self.next_message(queue)
+            self.assertEqual(message.data, b'%d' % i)
+
+        subscriber.transport.close()
+        await subscriber.wait_closed()
+        subscriber, connack = await self.connect('moo', clean_session=True)
+        self.assertFalse(connack.session_present)
+
+    async def test_takeover(self):
+        first, connack = await self.connect('moo')
+        second, connack = await self.connect('moo')
+        await asyncio.wait_for(first.wait_closed(), 5)
+        self.assertFalse(second.closed)
+        self.assertIsNotNone(self.broker.sessions['moo'].protocol)
+
+    async def test_first_packet_must_be_connect(self):
+        reader, writer = await asyncio.open_connection('127.0.0.1', self.broker.port)
+        writer.write(PINGREQ_BYTES)
+        self.assertEqual(await asyncio.wait_for(reader.read(), 5), b'')
+        writer.close()
+
+    async def test_malformed_packets(self):
+        for frame in (b'\x30\x05\x00\x09moo', b'\x30\x05\x00\x03\xff\xfe\xfd', b'\x30\x05\x00\x03m/+',
+                      b'\x30\xff\xff\xff\xff\x01moo'):
+            reader, writer = await self.raw_connect(ConnectPacket())
+            connack = await asyncio.wait_for(reader.readexactly(4), 5)
+            self.assertEqual(ConnackPacket.from_bytes(connack).return_code, 0)
+            writer.write(frame)
+            self.assertEqual(await asyncio.wait_for(reader.read(), 5), b'')
+            writer.close()
+        self.assertEqual(self.broker.stats()['messages_received'], 0)
+
+    async def test_truncated_connect(self):
+        reader, writer = await asyncio.open_connection('127.0.0.1', self.broker.port)
+        writer.write(b'\x10\x06\x00\x04MQTT')
+        self.assertEqual(await asyncio.wait_for(reader.read(), 5), b'')
+        writer.close()
+        self.assertEqual(self.broker.sessions, {})
+
+    async def test_refused(self):
+        cp = ConnectPacket()
+        cp.proto_level = 5
+        reader, writer = await self.raw_connect(cp)
+        connack = ConnackPacket.from_bytes(await asyncio.wait_for(reader.read(), 5))
+        self.assertEqual(connack.return_code, UNACCEPTABLE_PROTOCOL_VERSION)
+        writer.close()
+
+        self.broker.authenticate = lambda client_id, username, password: password == 'secret'
+        cp = ConnectPacket()
+        cp.username = 'moo'
+        cp.password = 'wrong'
+        reader, writer = await self.raw_connect(cp)
+        connack = ConnackPacket.from_bytes(await asyncio.wait_for(reader.read(), 5))
+        self.assertEqual(connack.return_code, NOT_AUTHORIZED)
+        writer.close()
@@ -0,0 +1,856 @@
+import asyncio
+import mmap
+import os
+import random
+import tempfile
+import unittest
+
+from asyncmqtt import MQTTException
+from asyncmqtt.client import MQTTClientProtocol, MQTTBufferedClientProtocol, PACKET_TYPES
+from asyncmqtt.session import MQTTSession
+from asyncmqtt.store import SegmentLog
+from asyncmqtt.packet import MQTTFixedHeader, PUBLISH, PUBACK, PUBREL
+from asyncmqtt.packet_ping import PingRespPacket
+from asyncmqtt.packet_publish import PublishPacket
+from asyncmqtt.packet_suback import SubackPacket
+from asyncmqtt.packet_ack import UnsubackPacket
+from asyncmqtt.packet_template import PINGREQ_BYTES, puback, pubrec, pubrel, pubcomp
+
+
+class FakeTransport:
+    def __init__(self):
+        self.writes = []
+        self.writelines_calls = 0
+        self.closed = False
+        self.reading = True
+        # Set to the client's writer.flush to see coalesced writes without running the loop.
+        self.flush = None
+
+    def write(self, data):
+        self.writes.append(data)
+
+    def writelines(self, buffers):
+        self.writelines_calls += 1
+        self.writes.extend(buffers)
+
+    def is_closing(self):
+        return self.closed
+
+    def pause_reading(self):
+        self.reading = False
+
+    def resume_reading(self):
+        self.reading = True
+
+    def close(self):
+        self.closed = True
+
+    def abort(self):
+        self.closed = True
+
+    def data(self):
+        if self.flush is not None:
+            self.flush()
+        return b''.join(self.writes)
+
+    def packets(self):
+        data = self.data()
+        self.writes.clear()
+        packets = []
+        needle = 0
+        while needle < len(data):
+            fixed, header_length = MQTTFixedHeader.decode(data, needle)
+            end = needle + header_length + fixed.remaining_length
+            packets.append(PACKET_TYPES[fixed.packet_type].from_bytes(data[needle:end]))
+            needle = end
+        return packets
+
+
+class MQTTClientProtocolTests(unittest.TestCase):
+    def setUp(self):
+        self.client = self.make_client()
+
+    def make_client(self, **kwargs):
+        return MQTTClientProtocol(**kwargs)
+
+    def feed(self, data):
+        self.client.data_received(data)
+
+    def unread(self):
+        return bytes(self.client.buffer[self.client.offset:])
+
+    def received(self):
+        messages = []
+        while not self.client.msgq.empty():
+            messages.append(self.client.msgq.get_nowait())
+        return messages
+
+    def build_stream(self, count):
+        packets = [PublishPacket.build('moo/%d' % i, b'cows go moo' * (i % 7), None, False, 0, False)
+                   for i in range(count)]
+        return packets, b''.join(bytes(p.to_bytes()) for p in packets)
+
+    def test_decode_single_frame(self):
+        pp = PublishPacket.build('moo', b'cows go moo', None, False, 0, False)
+        self.feed(bytes(pp.to_bytes()))
+
+        messages = self.received()
+        self.assertEqual(len(messages), 1)
+        self.assertEqual(messages[0].topic_name, 'moo')
+        self.assertEqual(messages[0].data, b'cows go moo')
+        self.assertEqual(self.client.offset, 0)
+        self.assertEqual(self.unread(), b'')
+
+    def test_decode_mixed_frames(self):
+        data = bytes(SubackPacket.build(1, [0, 1]).to_bytes()) + bytes(UnsubackPacket.build(2).to_bytes())
+        self.feed(data)
+
+        messages = self.received()
+        self.assertEqual([type(m) for m in messages], [SubackPacket, UnsubackPacket])
+        self.assertEqual(messages[0].return_codes, [0, 1])
+
+    def test_decode_byte_at_a_time(self):
+        packets, data = self.build_stream(20)
+        for i in range(len(data)):
+            self.feed(data[i:i + 1])
+
+        messages = self.received()
+        self.assertEqual([m.topic_name for m in messages], [p.topic_name for p in packets])
+        self.assertEqual([m.data for m in messages], [p.data for p in packets])
+
+    def test_decode_random_splits(self):
+        packets, data = self.build_stream(500)
+        rng = random.Random(1234)
+        needle = 0
+        while needle < len(data):
+            step = rng.randint(1, 300)
+            self.feed(data[needle:needle + step])
+            needle += step
+
+        messages = self.received()
+        self.assertEqual([m.topic_name for m in messages], [p.topic_name for p in packets])
+        self.assertEqual([m.data for m in messages], [p.data for p in packets])
+
+    def test_pending_header_kept(self):
+        pp = PublishPacket.build('moo', b'x' * 1000, None, False, 0, False)
+        data = bytes(pp.to_bytes())
+        self.feed(data[:10])
+        self.assertIsNotNone(self.client.pending_header)
+        self.assertEqual(self.received(), [])
+
+        self.feed(data[10:])
+        self.assertIsNone(self.client.pending_header)
+        self.assertEqual(self.received()[0].data, b'x' * 1000)
+
+    def test_compaction(self):
+        packets, data = self.build_stream(2000)
+        self.feed(data + data[:3])
+
+        self.assertEqual(len(self.received()), 2000)
+        self.assertEqual(self.unread(), data[:3])
+
+    def test_send_packet_vectored(self):
+        transport = FakeTransport()
+        self.client.connection_made(transport)
+        payload = memoryview(b'x' * 100000)
+        pp = PublishPacket.build('moo', payload, None, False, 0, False)
+        self.client.send_packet(pp)
+
+        self.assertIs(transport.writes[-1], payload)
+        self.assertEqual(PublishPacket.from_bytes(transport.data()).data, payload)
+
+    def test_max_packet_size(self):
+        self.client = self.make_client(max_packet_size=1000)
+        transport = FakeTransport()
+        self.client.connection_made(transport)
+        pp = PublishPacket.build('moo', b'x' * 2000, None, False, 0, False)
+        self.feed(bytes(pp.to_bytes())[:10])
+
+        self.assertTrue(transport.closed)
+        self.assertIsInstance(self.client.exception, MQTTException)
+        self.assertEqual(self.received(), [])
+
+    def test_unknown_packet_type(self):
+        transport = FakeTransport()
+        self.client.connection_made(transport)
+        pp = PublishPacket.build('moo', b'cows', None, False, 0, False)
+        self.feed(b'\xf0\x00' + bytes(pp.to_bytes()))
+
+        self.assertTrue(transport.closed)
+        self.assertIsInstance(self.client.exception, MQTTException)
+        self.assertEqual(self.received(), [])
+
+    def test_invalid_remaining_length(self):
+        transport = FakeTransport()
+        self.client.connection_made(transport)
+        self.feed(b'\x30\xff\xff')
+        self.assertFalse(transport.closed)
+
+        self.feed(b'\xff\xff\x01moo')
+        self.assertTrue(transport.closed)
+        self.assertIsInstance(self.client.exception, MQTTException)
+        self.assertEqual(self.received(), [])
+
+    def test_malformed_publish(self):
+        transport = FakeTransport()
+        self.client.connection_made(transport)
+        self.feed(b'\x30\x05\x00\x09moo')
+
+        self.assertTrue(transport.closed)
+        self.assertIsInstance(self.client.exception, MQTTException)
+        self.assertEqual(self.received(), [])
+
+    def test_queue_backpressure(self):
+        self.client = self.make_client(queue_high_water=3, queue_low_water=1)
+        transport = FakeTransport()
+        self.client.connection_made(transport)
+        data = bytes(PublishPacket.build('moo', b'cows', None, False, 0, False).to_bytes())
+
+        self.feed(data * 2)
+        self.assertTrue(transport.reading)
+        self.feed(data)
+        self.assertFalse(transport.reading)
+
+        self.client.msgq.get_nowait()
+        self.assertFalse(transport.reading)
+        self.client.msgq.get_nowait()
+        self.assertTrue(transport.reading)
+
+        metrics = self.client.metrics()['msgq']
+        self.assertEqual(metrics['depth'], 1)
+        self.assertEqual(metrics['max_depth'], 3)
+        self.assertEqual((metrics['pause_count'], metrics['resume_count']), (1, 1))
+
+    def test_subscription_queue_backpressure(self):
+        # subscribe() creates a future; asynchronous tests run before this leave no loop set.
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        self.addCleanup(loop.close)
+        self.addCleanup(asyncio.set_event_loop, None)
+        transport = FakeTransport()
+        self.client.connection_made(transport)
+        queue = self.client.message_queue(1)
+        self.client.subscribe([('moo', 0)], queue)
+        self.feed(bytes(PublishPacket.build('moo', b'cows', None, False, 0, False).to_bytes()))
+        self.assertFalse(transport.reading)
+        queue.get_nowait()
+        self.assertTrue(transport.reading)
+
+
+class MQTTBufferedClientProtocolTests(MQTTClientProtocolTests):
+    def make_client(self, **kwargs):
+        return MQTTBufferedClientProtocol(arena_size=4096, **kwargs)
+
+    def feed(self, data):
+        # Mimic the event loop: read into whatever get_buffer() hands out.
+        while data:
+            with self.client.get_buffer(-1) as view:
+                nbytes = min(len(view), len(data))
+                view[:nbytes] = data[:nbytes]
+            self.client.buffer_updated(nbytes)
+            data = data[nbytes:]
+
+    def unread(self):
+        return bytes(self.client.buffer[self.client.offset:self.client.end])
+
+    def test_arena_grows_and_shrinks(self):
+        pp = PublishPacket.build('moo', b'x' * 100000, None, False, 0, False)
+        data = bytes(pp.to_bytes())
+        self.feed(data[:5000])
+        self.assertGreaterEqual(len(self.client.buffer), len(data))
+
+        self.feed(data[5000:])
+        self.assertEqual(self.received()[0].data, b'x' * 100000)
+        self.assertEqual(len(self.client.buffer), 4096)
+
+    def test_data_received_fallback(self):
+        packets, data = self.build_stream(50)
+        self.client.data_received(data)
+        self.assertEqual(len(self.received()), 50)
+
+
+class MQTTClientStreamReceiveTests(unittest.IsolatedAsyncioTestCase):
+    PROTOCOL = MQTTClientProtocol
+
+    def setUp(self):
+        self.client = self.PROTOCOL(stream_threshold=1000)
+        self.client.STREAM_BUFFER_LIMIT = 10000
+        self.transport = FakeTransport()
+        self.client.connection_made(self.transport)
+        self.payload = bytes(range(256)) * 200
+
+    async def test_stream_delivered_early(self):
+        data = bytes(PublishPacket.build('moo', self.payload, 7, False, 1, False).to_bytes())
+        self.client.data_received(data[:100])
+
+        packet = self.client.msgq.get_nowait()
+        self.assertEqual(packet.topic_name, 'moo')
+        self.assertEqual(packet.packet_id, 7)
+        self.assertEqual(packet.stream.length, len(self.payload))
+
+        self.client.data_received(data[100:])
+        self.assertEqual(await packet.stream.readall(), self.payload)
+
+    async def test_stream_then_small_packets(self):
+        big = bytes(PublishPacket.build('big', self.payload, None, False, 0, False).to_bytes())
+        small = bytes(PublishPacket.build('small', b'abc', None, False, 0, False).to_bytes())
+        self.client.data_received(big + small)
+
+        packet = self.client.msgq.get_nowait()
+        spooled = await packet.stream.spool()
+        self.assertEqual(spooled.read(), self.payload)
+        self.assertEqual(self.client.msgq.get_nowait().topic_name, 'small')
+
+    async def test_stream_backpressure(self):
+        data = bytes(PublishPacket.build('moo', self.payload, None, False, 0, False).to_bytes())
+        for needle in range(0, len(data), 4096):
+            self.client.data_received(data[needle:needle + 4096])
+        self.assertFalse(self.transport.reading)
+
+        packet = self.client.msgq.get_nowait()
+        self.assertEqual(await packet.stream.readall(), self.payload)
+        self.assertTrue(self.transport.reading)
+
+    async def test_stream_malformed(self):
+        data = bytearray(PublishPacket.build('moo', self.payload, None, False, 0, False).to_bytes())
+        data[4:6] = b'\xff\xff'
+        self.client.data_received(bytes(data))
+
+        self.assertTrue(self.transport.closed)
+        self.assertIsInstance(self.client.exception, MQTTException)
+        self.assertTrue(self.client.msgq.empty())
+
+    async def test_stream_acked_when_complete(self):
+        self.transport.flush = self.client.writer.flush
+        for qos, ack in ((1, puback(7)), (2, pubrec(7))):
+            data = bytes(PublishPacket.build('moo', self.payload, 7, False, qos, False).to_bytes())
+            self.client.data_received(data[:-1])
+            packet = self.client.msgq.get_nowait()
+            self.assertEqual(self.transport.data(), b'')
+            self.assertNotIn(7, self.client.incoming_qos2)
+
+            self.client.data_received(data[-1:])
+            self.assertEqual(self.transport.data(), ack)
+            self.assertEqual(await packet.stream.readall(), self.payload)
+            self.transport.writes.clear()
+
+    async def test_stream_not_acked_on_connection_lost(self):
+        self.transport.flush = self.client.writer.flush
+        data = bytes(PublishPacket.build('moo', self.payload, 7, False, 2, False).to_bytes())
+        self.client.data_received(data[:1000])
+        packet = self.client.msgq.get_nowait()
+        await asyncio.sleep(0)
+        self.assertEqual(self.transport.data(), b'')
+        self.client.connection_lost(None)
+
+        with self.assertRaises(ConnectionResetError):
+            await packet.stream.readall()
+        self.assertEqual(self.transport.data(), b'')
+        self.assertNotIn(7, self.client.incoming_qos2)
+
+    async def test_stream_duplicate_qos2_discarded(self):
+        self.transport.flush = self.client.writer.flush
+        data = bytes(PublishPacket.build('moo', self.payload * 10, 7, False, 2, False).to_bytes())
+        self.client.data_received(data)
+        packet = self.client.msgq.get_nowait()
+        self.assertEqual(await packet.stream.readall(), self.payload * 10)
+        self.assertEqual(self.transport.data(), pubrec(7))
+        self.transport.writes.clear()
+
+        for needle in range(0, len(data), 4096):
+            self.client.data_received(data[needle:needle + 4096])
+        self.assertEqual(self.transport.data(), pubrec(7))
+        self.assertTrue(self.client.msgq.empty())
+        self.assertFalse(self.client.read_holds)
+        self.assertTrue(self.transport.reading)
+        self.assertIsNone(self.client.incoming_stream)
+
+        small = bytes(PublishPacket.build('small', b'abc', None, False, 0, False).to_bytes())
+        self.client.data_received(small)
+        self.assertEqual(self.client.msgq.get_nowait().topic_name, 'small')
+
+    async def test_stream_connection_lost(self):
+        data = bytes(PublishPacket.build('moo', self.payload, None, False, 0, False).to_bytes())
+        self.client.data_received(data[:2000])
+        packet = self.client.msgq.get_nowait()
+        self.client.connection_lost(None)
+
+        with self.assertRaises(ConnectionResetError):
+            await packet.stream.readall()
+
+
+class MQTTBufferedClientStreamReceiveTests(MQTTClientStreamReceiveTests):
+    PROTOCOL = MQTTBufferedClientProtocol
+
+    async def test_arena_stays_small(self):
+        data = bytes(PublishPacket.build('moo', b'x' * 1000000, None, False, 0, False).to_bytes())
+        self.client.data_received(data[:3000])
+        self.client.get_buffer(-1)
+        self.assertEqual(len(self.client.buffer), self.client.arena_size)
+
+
+class MQTTClientStreamTests(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.client = MQTTClientProtocol()
+        self.transport = FakeTransport()
+        self.client.connection_made(self.transport)
+        self.payload = bytes(range(256)) * 1000
+
+    def published(self):
+        return PublishPacket.from_bytes(self.transport.data())
+
+    async def test_stream_buffer(self):
+        await self.client.publish_stream('moo', memoryview(self.payload), len(self.payload), chunk_size=4096)
+        self.assertEqual(self.published().data, self.payload)
+        self.assertGreater(len(self.transport.writes), len(self.payload) // 4096)
+
+    async def test_stream_mmap(self):
+        with tempfile.TemporaryFile() as f:
+            f.write(self.payload)
+            f.flush()
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                await self.client.publish_stream('moo', mm, len(self.payload))
+                self.assertEqual(self.published().data, self.payload)
+                self.transport.writes.clear()
+
+    async def test_stream_file(self):
+        with tempfile.NamedTemporaryFile(delete=False) as f:
+            f.write(self.payload)
+        try:
+            task = asyncio.ensure_future(self.client.publish_stream('moo', f.name, len(self.payload), qos=1,
+                                                                    chunk_size=10000))
+            while not self.transport.writes or len(self.transport.data()) < len(self.payload):
+                await asyncio.sleep(0.001)
+        finally:
+            os.unlink(f.name)
+        packet = self.published()
+        self.assertFalse(task.done())
+        self.client.data_received(puback(packet.packet_id))
+        await task
+        self.assertEqual(packet.data, self.payload)
+        self.assertEqual(packet.qos, 1)
+
+    async def test_stream_async_iterator(self):
+        async def chunks():
+            for needle in range(0, len(self.payload), 3000):
+                yield self.payload[needle:needle + 3000]
+
+        await self.client.publish_stream('moo', chunks(), len(self.payload))
+        self.assertEqual(self.published().data, self.payload)
+
+    async def test_stream_short_source_closes(self):
+        async def chunks():
+            yield b'abc'
+
+        with self.assertRaises(MQTTException):
+            await self.client.publish_stream('moo', chunks(), 10)
+        self.assertTrue(self.transport.closed)
+
+    async def test_stream_defers_other_writes(self):
+        async def chunks():
+            yield b'abc'
+            self.client.ping()
+            await asyncio.sleep(0)
+            yield b'def'
+
+        await self.client.publish_stream('moo', chunks(), 6)
+        data = self.transport.data()
+        self.assertEqual(self.published().data, b'abcdef')
+        self.assertEqual(data[-2:], PINGREQ_BYTES)
+
+    async def test_stream_cancelled_waiting_for_lock(self):
+        async with self.client.stream_lock:
+            task = asyncio.ensure_future(self.client.publish_stream('moo', b'cows', 4, qos=1))
+            await asyncio.sleep(0)
+            task.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await task
+        self.assertEqual(len(self.client.window), 0)
+        self.assertEqual(len(self.client.packet_ids), 0)
+        self.assertFalse(self.transport.closed)
+
+    async def test_stream_waits_for_drain(self):
+        self.client.pause_writing()
+        task = asyncio.ensure_future(self.client.publish_stream('moo', self.payload, len(self.payload), chunk_size=1000))
+        await asyncio.sleep(0.01)
+        self.assertFalse(task.done())
+        written = len(self.transport.data())
+
+        self.client.resume_writing()
+        await task
+        self.assertGreater(len(self.transport.data()), written)
+        self.assertEqual(self.published().data, self.payload)
+
+
+class MQTTClientQoSTests(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.client = MQTTClientProtocol(max_inflight=2)
+        self.transport = FakeTransport()
+        self.transport.flush = self.client.writer.flush
+        self.client.connection_made(self.transport)
+
+    def types(self, packets):
+        return [p.fixed_header.packet_type for p in packets]
+
+    async def test_publish_qos0(self):
+        future = self.client.publish('moo', b'cows', 0)
+        self.assertTrue(future.done())
+        self.assertEqual(self.types(self.transport.packets()), [PUBLISH])
+
+    async def test_publish_qos1(self):
+        future = self.client.publish('moo', b'cows', 1)
+        packet, = self.transport.packets()
+        self.assertEqual(packet.qos, 1)
+        self.assertFalse(future.done())
+
+        self.client.data_received(puback(packet.packet_id))
+        await future
+        self.assertEqual(len(self.client.window), 0)
+
+    async def test_publish_qos2(self):
+        future = self.client.publish('moo', b'cows', 2)
+        packet, = self.transport.packets()
+
+        self.client.data_received(pubrec(packet.packet_id))
+        self.assertEqual(self.transport.data(), pubrel(packet.packet_id))
+        self.assertFalse(future.done())
+
+        self.client.data_received(pubcomp(packet.packet_id))
+        await future
+
+    async def test_publish_window(self):
+        futures = [self.client.publish('moo', b'%d' % i, 1) for i in range(5)]
+        sent = self.transport.packets()
+        self.assertEqual(len(sent), 2)
+        self.assertEqual(len(self.client.window.pending), 3)
+
+        acked = 0
+        while sent:
+            self.client.data_received(b''.join(puback(p.packet_id) for p in sent))
+            acked += len(sent)
+            sent = self.transport.packets()
+        self.assertEqual(acked, 5)
+        await asyncio.gather(*futures)
+
+    async def test_publish_packet_ids_in_use(self):
+        self.client.window.max_inflight = 10
+        futures = [self.client.publish('moo', b'cows', 1) for i in range(3)]
+        first = self.transport.packets()
+        self.client.data_received(puback(first[1].packet_id))
+        await futures[1]
+
+        self.client.publish('moo', b'cows', 1)
+        ids = [p.packet_id for p in first + self.transport.packets()]
+        self.assertNotIn(0, ids)
+        self.assertEqual(len(set(ids)), 4)
+
+    async def test_publish_packet_ids_exhausted(self):
+        self.client.packet_ids.size = 1
+        futures = [self.client.publish('moo', b'cows', 1) for i in range(2)]
+        packet, = self.transport.packets()
+        self.assertEqual(len(self.client.window.pending), 1)
+
+        self.client.data_received(puback(packet.packet_id))
+        packet, = self.transport.packets()
+        self.client.data_received(puback(packet.packet_id))
+        await asyncio.gather(*futures)
+
+    async def test_next_packet_id_deprecated(self):
+        with self.assertWarns(DeprecationWarning):
+            packet_id = self.client.next_packet_id
+        self.assertEqual(len(self.client.packet_ids), 0)
+        future = self.client.publish('moo', b'cows', 1)
+        self.assertNotEqual(self.transport.packets()[0].packet_id, packet_id)
+        future.cancel()
+
+    async def test_subscribe(self):
+        future = self.client.subscribe([('moo/#', 1)])
+        packet, = self.transport.packets()
+        self.assertIn(packet.packet_id, self.client.packet_ids)
+
+        self.client.data_received(SubackPacket.build(packet.packet_id, [1]).to_bytes())
+        self.assertEqual(await future, [1])
+        self.assertNotIn(packet.packet_id, self.client.packet_ids)
+        self.assertEqual(self.client.msgq.get_nowait().return_codes, [1])
+
+    async def test_subscribe_packet_ids_exhausted(self):
+        self.client.packet_ids.size = 1
+        self.client.publish('moo', b'cows', 1)
+        packet, = self.transport.packets()
+        future = self.client.subscribe([('moo/#', 1)])
+        await asyncio.sleep(0)
+        self.assertEqual(self.transport.packets(), [])
+
+        self.client.data_received(puback(packet.packet_id))
+        await asyncio.sleep(0)
+        packet, = self.transport.packets()
+        self.client.data_received(SubackPacket.build(packet.packet_id, [1]).to_bytes())
+        self.assertEqual(await future, [1])
+
+    async def test_subscribe_routing(self):
+        received = []
+        queue = asyncio.Queue()
+        self.client.subscribe([('moo/+', 0)], received.append)
+        self.client.subscribe([('moo/#', 0), ('oink', 0)], queue)
+        self.transport.packets()
+
+        for topic in ('moo/cow', 'moo', 'baa'):
+            self.client.data_received(PublishPacket.build(topic, b'x', None, False, 0, False).to_bytes())
+        self.assertEqual([m.topic_name for m in received], ['moo/cow'])
+        self.assertEqual([queue.get_nowait().topic_name for i in range(2)], ['moo/cow', 'moo'])
+        self.assertEqual(self.client.msgq.get_nowait().topic_name, 'baa')
+
+    async def test_subscribe_overlapping(self):
+        queue = asyncio.Queue()
+        self.client.subscribe([('moo/#', 0)])
+        self.client.subscribe([('moo/cow', 0)], queue)
+        self.client.subscribe([('moo/+', 0)])
+        self.transport.packets()
+
+        self.client.data_received(PublishPacket.build('moo/cow', b'x', None, False, 0, False).to_bytes())
+        self.assertEqual(queue.get_nowait().topic_name, 'moo/cow')
+        self.assertEqual(self.client.msgq.get_nowait().topic_name, 'moo/cow')
+        self.assertTrue(self.client.msgq.empty())
+
+    async def test_subscribe_refused(self):
+        future = self.client.subscribe([('moo', 0), ('oink', 0)], print)
+        packet, = self.transport.packets()
+        self.client.data_received(SubackPacket.build(packet.packet_id, [0, 0x80]).to_bytes())
+        await future
+        await asyncio.sleep(0)
+        self.assertEqual([s.topic_filter for s in self.client.router.match('moo')], ['moo'])
+        self.assertFalse(self.client.router.match('oink'))
+
+    async def test_unsubscribe(self):
+        self.client.subscribe([('moo', 0)], print)
+        future = self.client.unsubscribe(['moo'])
+        self.assertFalse(self.client.router.match('moo'))
+        packet = self.transport.packets()[-1]
+        self.assertEqual(packet.topics, ['moo'])
+
+        self.client.data_received(UnsubackPacket.build(packet.packet_id).to_bytes())
+        await future
+        self.assertNotIn(packet.packet_id, self.client.packet_ids)
+
+    async def test_next_messages(self):
+        data = bytes(PublishPacket.build('moo', b'cows', None, False, 0, False).to_bytes())
+        self.client.data_received(data * 5)
+        batch = await self.client.next_messages(3)
+        self.assertEqual([m.topic_name for m in batch], ['moo'] * 3)
+        self.assertEqual(len(await self.client.next_messages(3)), 2)
+        self.assertEqual(await self.client.next_messages(3, timeout=0.01), [])
+
+    async def test_batches(self):
+        data = bytes(PublishPacket.build('moo', b'cows', None, False, 0, False).to_bytes())
+        self.client.data_received(data * 3)
+        batches = self.client.batches(2, timeout=0.01)
+        self.assertEqual([len(await batches.__anext__()) for i in range(3)], [2, 1, 0])
+        await batches.aclose()
+
+    async def test_publish_coalesced(self):
+        self.transport.flush = None
+        for i in range(10):
+            self.client.publish('moo', b'%d' % i, 0)
+        self.assertEqual(self.transport.writelines_calls, 0)
+        await asyncio.sleep(0)
+        self.assertEqual(self.transport.writelines_calls, 1)
+        self.assertEqual(len(self.transport.packets()), 10)
+
+        self.client.publish('moo', b'cows', 0)
+        self.client.ping()
+        self.assertEqual(self.transport.writelines_calls, 2)
+
+    async def test_acks_ahead_of_publishes(self):
+        self.client.pause_writing()
+        self.client.publish('moo', b'cows', 0)
+        self.client.data_received(PublishPacket.build('oink', b'pigs', 9, False, 1, False).to_bytes())
+        self.assertEqual(self.transport.data(), puback(9))
+        self.assertEqual(self.client.metrics()['writer']['bulk_packets'], 1)
+
+        self.client.resume_writing()
+        self.assertEqual(self.types(self.transport.packets()), [PUBACK, PUBLISH])
+
+    async def test_keepalive(self):
+        client = MQTTClientProtocol(keep_alive=0.02, ping_timeout=0.02)
+        client.connection_made(self.transport)
+        self.transport.flush = client.writer.flush
+        client.connect()
+        self.assertEqual(self.transport.packets()[0].keep_alive, 1)
+
+        await asyncio.sleep(0.03)
+        self.assertEqual(self.transport.data(), PINGREQ_BYTES)
+        client.data_received(PingRespPacket().to_bytes())
+        self.assertTrue(client.msgq.empty())
+        self.assertEqual(client.metrics()['keepalive']['rtt']['count'], 1)
+
+        self.transport.writes.clear()
+        await asyncio.sleep(0.08)
+        self.assertTrue(self.transport.closed)
+        self.assertIsInstance(client.exception, MQTTException)
+        client.connection_lost(None)
+
+    async def test_keepalive_during_stream(self):
+        client = MQTTClientProtocol(keep_alive=0.02, ping_timeout=0.02)
+        client.connection_made(self.transport)
+        client.connect()
+
+        async def chunks():
+            for i in range(10):
+                await asyncio.sleep(0.02)
+                yield b'x'
+        await client.publish_stream('moo', chunks(), 10)
+        self.assertFalse(self.transport.closed)
+        self.assertIsNone(client.exception)
+        self.assertNotIn(PINGREQ_BYTES, self.transport.writes)
+        client.connection_lost(None)
+
+    async def test_persistent_session_replay(self):
+        session = MQTTSession(persistent=True)
+        client = MQTTClientProtocol(session=session)
+        client.connection_made(self.transport)
+        self.transport.flush = client.writer.flush
+        futures = [client.publish('moo', b'%d' % i, 2) for i in range(2)]
+        first, second = self.transport.packets()
+        client.data_received(pubrec(first.packet_id))
+        client.connection_lost(None)
+        self.assertFalse(any(f.done() for f in futures))
+
+        transport = FakeTransport()
+        client = MQTTClientProtocol(session=session)
+        client.connection_made(transport)
+        transport.flush = client.writer.flush
+        client.replay()
+        pubrel_packet, publish = transport.packets()
+        self.assertEqual(pubrel_packet.fixed_header.packet_type, PUBREL)
+        self.assertEqual(pubrel_packet.packet_id, first.packet_id)
+        self.assertTrue(publish.dup_flag)
+        self.assertEqual(publish.packet_id, second.packet_id)
+
+    async def test_store_restore(self):
+        with tempfile.TemporaryDirectory() as directory:
+            client = MQTTClientProtocol(store=SegmentLog(directory))
+            client.connection_made(self.transport)
+            self.transport.flush = client.writer.flush
+            for i in range(3):
+                client.publish('moo', b'%d' % i, 1)
+            first = self.transport.packets()[0]
+            client.data_received(puback(first.packet_id))
+            await asyncio.sleep(0)
+            self.assertEqual(len(client.session.store), 2)
+            client.session.store.close()
+
+            transport = FakeTransport()
+            client = MQTTClientProtocol(store=SegmentLog(directory))
+            client.connection_made(transport)
+            transport.flush = client.writer.flush
+            client.replay()
+            packets = transport.packets()
+            self.assertEqual([p.data for p in packets], [b'1', b'2'])
+            self.assertTrue(all(p.dup_flag for p in packets))
+            for packet in packets:
+                client.data_received(puback(packet.packet_id))
+            await asyncio.sleep(0)
+            self.assertEqual(len(client.session.store), 0)
+            client.session.store.close()
+
+    async def test_store_kept_on_connection_lost(self):
+        with tempfile.TemporaryDirectory() as directory:
+            client = MQTTClientProtocol(store=SegmentLog(directory), max_inflight=1)
+            client.connection_made(self.transport)
+            futures = [client.publish('moo', b'%d' % i, 1) for i in range(2)]
+            client.connection_lost(None)
+            self.assertFalse(any(f.done() for f in futures))
+            self.assertEqual(len(client.session.store), 2)
+            client.session.store.close()
+
+            store = SegmentLog(directory)
+            self.assertEqual(len(store), 2)
+            store.close()
+
+    async def test_store_restores_qos2_state(self):
+        with tempfile.TemporaryDirectory() as directory:
+            client = MQTTClientProtocol(store=SegmentLog(directory), max_inflight=2)
+            client.connection_made(self.transport)
+            self.transport.flush = client.writer.flush
+            for i in range(3):
+                client.publish('moo', b'%d' % i, 2)
+            first, second = self.transport.packets()
+            client.data_received(pubrec(first.packet_id))
+            client.session.store.close()
+
+            transport = FakeTransport()
+            client = MQTTClientProtocol(store=SegmentLog(directory))
+            client.connection_made(transport)
+            transport.flush = client.writer.flush
+            client.replay()
+            pubrel_packet, publish, queued = transport.packets()
+            self.assertEqual(pubrel_packet.fixed_header.packet_type, PUBREL)
+            self.assertEqual(pubrel_packet.packet_id, first.packet_id)
+            self.assertEqual((publish.data, publish.packet_id), (b'1', second.packet_id))
+            self.assertTrue(publish.dup_flag)
+            self.assertEqual(queued.data, b'2')
+            self.assertFalse(queued.dup_flag)
+            self.assertNotIn(queued.packet_id, (first.packet_id, second.packet_id))
+
+            client.data_received(pubcomp(first.packet_id))
+            self.assertEqual(len(client.session.store), 2)
+            client.session.store.close()
+
+    def test_store_requires_persistent_session(self):
+        with tempfile.TemporaryDirectory() as directory:
+            store = SegmentLog(directory)
+            with self.assertRaises(MQTTException):
+                MQTTSession(store=store)
+            store.close()
+
+    async def test_publish_connection_lost(self):
+        futures = [self.client.publish('moo', b'cows', 1) for i in range(3)]
+        self.client.connection_lost(None)
+        for future in futures:
+            with self.assertRaises(ConnectionResetError):
+                await future
+
+    async def test_publish_after_connection_lost(self):
+        self.client.connection_lost(None)
+        self.transport.writes.clear()
+        for future in (self.client.publish('moo', b'cows', 0), self.client.publish('moo', b'cows', 1),
+                       self.client.subscribe([('moo', 0)]), self.client.unsubscribe(['moo'])):
+            with self.assertRaises(ConnectionResetError):
+                await future
+        self.assertEqual(self.transport.data(), b'')
+        self.assertEqual(len(self.client.packet_ids), 0)
+
+    async def test_publish_after_connection_lost_persistent(self):
+        session = MQTTSession(persistent=True)
+        client = MQTTClientProtocol(session=session)
+        client.connection_made(self.transport)
+        client.connection_lost(None)
+        future = client.publish('moo', b'cows', 1)
+        self.assertEqual(len(session.window.pending), 1)
+
+        transport = FakeTransport()
+        client = MQTTClientProtocol(session=session)
+        client.connection_made(transport)
+        transport.flush = client.writer.flush
+        client.replay()
+        packet, = transport.packets()
+        client.data_received(puback(packet.packet_id))
+        await future
+
+    async def test_receive_qos1(self):
+        self.client.data_received(PublishPacket.build('moo', b'cows', 9, False, 1, False).to_bytes())
+        self.assertEqual(self.transport.data(), puback(9))
+        self.assertEqual(self.client.msgq.get_nowait().topic_name, 'moo')
+
+    async def test_receive_qos2(self):
+        data = bytes(PublishPacket.build('moo', b'cows', 9, False, 2, False).to_bytes())
+        self.client.data_received(data)
+        self.client.data_received(data)
+        self.assertEqual(self.transport.data(), pubrec(9) * 2)
+        self.assertEqual(self.client.msgq.qsize(), 1)
+
+        self.transport.writes.clear()
+        self.client.data_received(pubrel(9))
+        self.assertEqual(self.transport.data(), pubcomp(9))
+        self.client.data_received(data)
+        self.assertEqual(self.client.msgq.qsize(), 2)
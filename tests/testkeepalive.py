@@ -0,0 +1,61 @@
+import asyncio
+import unittest
+
+from asyncmqtt.keepalive import KeepAlive, RTTHistogram
+
+
+class RTTHistogramTests(unittest.TestCase):
+    def test_rolling(self):
+        rtt = RTTHistogram(size=3)
+        for sample in (0.5, 0.002, 0.003, 0.004):
+            rtt.add(sample)
+        self.assertEqual(len(rtt), 3)
+        self.assertEqual(rtt.stats()['max'], 0.004)
+        self.assertEqual(rtt.percentile(50), 0.003)
+        histogram = rtt.histogram()
+        self.assertEqual(histogram[0.0025], 1)
+        self.assertEqual(histogram[0.005], 2)
+
+    def test_empty(self):
+        self.assertEqual(RTTHistogram().stats(), {'count': 0})
+        self.assertIsNone(RTTHistogram().last)
+
+
+class KeepAliveTests(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.pings = 0
+        self.dead = False
+        self.keepalive = KeepAlive(0.02, self.ping, self.on_dead, timeout=0.05)
+
+    def tearDown(self):
+        self.keepalive.stop()
+
+    def ping(self):
+        self.pings += 1
+        self.keepalive.ping_sent()
+
+    def on_dead(self):
+        self.dead = True
+
+    async def test_idle_ping(self):
+        self.keepalive.start()
+        await asyncio.sleep(0.03)
+        self.assertEqual(self.pings, 1)
+        self.keepalive.pong()
+        self.assertEqual(len(self.keepalive.rtt), 1)
+        self.assertFalse(self.dead)
+
+    async def test_traffic_skips_ping(self):
+        self.keepalive = KeepAlive(0.1, self.ping, self.on_dead)
+        self.keepalive.start()
+        for i in range(6):
+            await asyncio.sleep(0.02)
+            self.keepalive.sent()
+            self.keepalive.received()
+        self.assertEqual(self.pings, 0)
+
+    async def test_dead(self):
+        self.keepalive.start()
+        await asyncio.sleep(0.1)
+        self.assertEqual(self.pings, 1)
+        self.assertTrue(self.dead)
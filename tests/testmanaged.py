@@ -0,0 +1,146 @@
+import asyncio
+import unittest
+
+from asyncmqtt.client import PACKET_TYPES
+from asyncmqtt.managed import MQTTManagedClient
+from asyncmqtt.packet import MQTTFixedHeader, CONNECT, PUBLISH, SUBSCRIBE, DISCONNECT
+from asyncmqtt.packet_connack import ConnackPacket
+from asyncmqtt.packet_suback import SubackPacket
+from asyncmqtt.packet_template import puback
+
+
+class FakeBroker:
+    def __init__(self):
+        self.session_present = False
+        self.ack = True
+        self.drop_after_connack = False
+        self.packets = []
+        self.writers = []
+
+    async def start(self, port=0):
+        self.server = await asyncio.start_server(self.handle, '127.0.0.1', port)
+        self.port = self.server.sockets[0].getsockname()[1]
+
+    async def close(self):
+        self.server.close()
+        self.drop()
+        await self.server.wait_closed()
+
+    def drop(self):
+        for writer in self.writers:
+            writer.transport.abort()
+        self.writers.clear()
+
+    def received(self, packet_type):
+        return [p for p in self.packets if p.fixed_header.packet_type == packet_type]
+
+    async def handle(self, reader, writer):
+        self.writers.append(writer)
+        try:
+            while True:
+                frame = bytearray(await reader.readexactly(2))
+                while frame[-1] & 0x80:
+                    frame.extend(await reader.readexactly(1))
+                fixed, header_length = MQTTFixedHeader.decode(bytes(frame))
+                frame.extend(await reader.readexactly(fixed.remaining_length))
+                if fixed.packet_type == DISCONNECT:
+                    break
+                packet = PACKET_TYPES[fixed.packet_type].from_bytes(bytes(frame))
+                self.packets.append(packet)
+                if fixed.packet_type == CONNECT:
+                    writer.write(ConnackPacket.build(0, self.session_present).to_bytes())
+                    if self.drop_after_connack:
+                        await writer.drain()
+                        break
+                elif fixed.packet_type == PUBLISH and packet.qos == 1 and self.ack:
+                    writer.write(puback(packet.packet_id))
+                elif fixed.packet_type == SUBSCRIBE:
+                    writer.write(SubackPacket.build(packet.packet_id, [q for t, q in packet.topics]).to_bytes())
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        writer.close()
+
+
+class MQTTManagedClientTests(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.broker = FakeBroker()
+        await self.broker.start()
+        self.client = MQTTManagedClient('127.0.0.1', self.broker.port, min_backoff=0.01, max_backoff=0.05)
+        self.client.start()
+        await asyncio.wait_for(self.client.wait_connected(), 5)
+
+    async def asyncTearDown(self):
+        await self.client.stop()
+        await self.broker.close()
+
+    async def reconnect(self):
+        connects = self.client.connects
+        self.broker.drop()
+        for i in range(500):
+            if self.client.connects > connects:
+                return
+            await asyncio.sleep(0.01)
+        self.fail('client did not reconnect')
+
+    async def test_connect(self):
+        connect, = self.broker.received(CONNECT)
+        self.assertFalse(connect.clean_session_flag)
+        self.assertEqual(connect.client_id, self.client.session.client_id)
+        await asyncio.wait_for(self.client.publish('moo', b'cows', 1), 5)
+
+    async def test_replay(self):
+        self.broker.ack = False
+        self.broker.session_present = True
+        future = self.client.publish('moo', b'cows', 1)
+        await asyncio.sleep(0.05)
+        first, = self.broker.received(PUBLISH)
+        self.assertFalse(first.dup_flag)
+
+        self.broker.ack = True
+        await self.reconnect()
+        await asyncio.wait_for(future, 5)
+        replayed = self.broker.received(PUBLISH)[-1]
+        self.assertTrue(replayed.dup_flag)
+        self.assertEqual(replayed.packet_id, first.packet_id)
+        self.assertEqual(replayed.data_bytes, b'cows')
+        self.assertIsNotNone(self.client.last_recovery_time)
+        self.assertEqual(self.client.metrics()['connects'], 2)
+
+    async def test_resubscribe(self):
+        await asyncio.wait_for(self.client.subscribe([('moo/#', 1)]), 5)
+        self.broker.session_present = True
+        await self.reconnect()
+        await asyncio.sleep(0.05)
+        self.assertEqual(len(self.broker.received(SUBSCRIBE)), 1)
+
+        self.broker.session_present = False
+        await self.reconnect()
+        await asyncio.sleep(0.05)
+        self.assertEqual(self.broker.received(SUBSCRIBE)[-1].topics, [('moo/#', 1)])
+
+    async def test_accept_then_drop_backs_off(self):
+        self.client.min_backoff = 0.05
+        self.client.max_backoff = 0.2
+        self.broker.drop_after_connack = True
+        connects = len(self.broker.received(CONNECT))
+        self.broker.drop()
+        await asyncio.sleep(0.5)
+        self.assertGreater(len(self.broker.received(CONNECT)), connects)
+        self.assertLess(len(self.broker.received(CONNECT)) - connects, 20)
+
+        self.broker.drop_after_connack = False
+        await asyncio.wait_for(self.client.wait_connected(), 5)
+
+    async def test_publish_while_disconnected(self):
+        await self.broker.close()
+        while self.client.connected:
+            await asyncio.sleep(0.005)
+        future = self.client.publish('moo', b'offline', 1)
+        with self.assertRaises(ConnectionError):
+            await self.client.publish('moo', b'lost', 0)
+        await asyncio.sleep(0.05)
+        self.assertGreater(self.client.connect_failures, 0)
+
+        await self.broker.start(self.broker.port)
+        await asyncio.wait_for(future, 5)
+        self.assertEqual(self.broker.received(PUBLISH)[-1].data_bytes, b'offline')
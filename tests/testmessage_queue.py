@@ -0,0 +1,51 @@
+import asyncio
+import unittest
+
+from asyncmqtt.message_queue import MessageQueue
+
+
+class MessageQueueTests(unittest.IsolatedAsyncioTestCase):
+    async def test_water_marks(self):
+        events = []
+        queue = MessageQueue(4, pause=lambda: events.append('pause'), resume=lambda: events.append('resume'))
+        self.assertEqual(queue.low_water, 2)
+        for i in range(5):
+            queue.put_nowait(i)
+        self.assertEqual(events, ['pause'])
+
+        self.assertEqual([await queue.get() for i in range(3)], [0, 1, 2])
+        self.assertEqual(events, ['pause', 'resume'])
+        self.assertEqual(queue.stats(), {'depth': 2, 'max_depth': 5, 'paused': False,
+                                         'pause_count': 1, 'resume_count': 1})
+
+    async def test_unbounded(self):
+        queue = MessageQueue()
+        for i in range(100):
+            queue.put_nowait(i)
+        self.assertFalse(queue.paused)
+
+    async def test_resume_from_waiting_get(self):
+        events = []
+        queue = MessageQueue(1, 0, pause=lambda: events.append('pause'), resume=lambda: events.append('resume'))
+        getter = asyncio.ensure_future(queue.get())
+        await asyncio.sleep(0)
+        queue.put_nowait('a')
+        self.assertEqual(await getter, 'a')
+        self.assertEqual(events, ['pause', 'resume'])
+
+    async def test_get_batch(self):
+        queue = MessageQueue(4)
+        for i in range(5):
+            queue.put_nowait(i)
+        self.assertEqual(await queue.get_batch(3), [0, 1, 2])
+        self.assertFalse(queue.paused)
+        self.assertEqual(await queue.get_batch(3), [3, 4])
+        self.assertEqual(await queue.get_batch(3, 0.01), [])
+
+    async def test_get_batch_waits(self):
+        queue = MessageQueue()
+        getter = asyncio.ensure_future(queue.get_batch(10))
+        await asyncio.sleep(0)
+        queue.put_nowait('a')
+        queue.put_nowait('b')
+        self.assertEqual(await getter, ['a', 'b'])
@@ -0,0 +1,16 @@
+import unittest
+from asyncmqtt.packet_ack import PubackPacket, PubrecPacket, PubrelPacket, PubcompPacket, UnsubackPacket
+
+
+class AckPacketTests(unittest.TestCase):
+    def test_marshal_demarshal(self):
+        for cls in (PubackPacket, PubrecPacket, PubrelPacket, PubcompPacket, UnsubackPacket):
+            p1 = cls.build(0x1234)
+            p1_bytes = p1.to_bytes()
+
+            p2 = cls.from_bytes(p1_bytes)
+            self.assertEqual(p2.packet_id, 0x1234)
+            self.assertEqual(p1_bytes, p2.to_bytes())
+
+    def test_pubrel_flags(self):
+        self.assertEqual(PubrelPacket.build(1).to_bytes()[0], 0x62)
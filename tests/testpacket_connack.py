@@ -10,3 +10,9 @@ class ConnAckPacketTests(unittest.TestCase):
         p2 = ConnackPacket.from_bytes(p1_bytes)
         self.assertEqual(p1.return_code, p2.return_code)
         self.assertEqual(p1_bytes, p2.to_bytes())
+
+    def test_session_present(self):
+        p1_bytes = ConnackPacket.build(0, True).to_bytes()
+        self.assertEqual(bytes(p1_bytes), b'\x20\x02\x01\x00')
+        self.assertTrue(ConnackPacket.from_bytes(p1_bytes).session_present)
+        self.assertFalse(ConnackPacket.from_bytes(ConnackPacket.build(0).to_bytes()).session_present)
@@ -13,3 +13,20 @@ class ConnectPacketTests(unittest.TestCase):
 
         self.assertEqual(cp.username, cp2.username)
         self.assertEqual(cp.password, cp2.password)
+
+    def test_will(self):
+        cp = ConnectPacket()
+        cp.will_flag = True
+        cp.will_qos = 1
+        cp.will_topic = 'moo/status'
+        cp.will_message = b'offline'
+        cp.username = 'abc'
+
+        cp2 = ConnectPacket.from_bytes(cp.to_bytes())
+
+        self.assertTrue(cp2.will_flag)
+        self.assertEqual(cp2.will_qos, 1)
+        self.assertEqual(cp2.will_topic, 'moo/status')
+        self.assertEqual(cp2.will_message, b'offline')
+        self.assertIsInstance(cp2.will_message, bytes)
+        self.assertEqual(cp2.username, 'abc')
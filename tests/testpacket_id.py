@@ -0,0 +1,56 @@
+import asyncio
+import unittest
+
+from asyncmqtt import MQTTException
+from asyncmqtt.packet_id import PacketIDAllocator, MAX_PACKET_ID
+
+
+class PacketIDAllocatorTests(unittest.IsolatedAsyncioTestCase):
+    def test_allocate(self):
+        ids = PacketIDAllocator()
+        self.assertEqual([ids.allocate() for i in range(3)], [1, 2, 3])
+        self.assertIn(2, ids)
+        self.assertEqual(len(ids), 3)
+
+    def test_never_zero_or_duplicate(self):
+        ids = PacketIDAllocator()
+        allocated = [ids.allocate() for i in range(MAX_PACKET_ID)]
+        self.assertEqual(sorted(allocated), list(range(1, MAX_PACKET_ID + 1)))
+        self.assertTrue(ids.exhausted)
+        with self.assertRaises(MQTTException):
+            ids.allocate()
+
+    def test_release(self):
+        ids = PacketIDAllocator(size=3)
+        self.assertEqual(ids.allocate('a'), 1)
+        self.assertEqual(ids.allocate('b'), 2)
+        self.assertEqual(ids.get(2), 'b')
+        self.assertEqual(ids.release(1), 'a')
+        self.assertIsNone(ids.release(1))
+        self.assertNotIn(1, ids)
+        # Fresh identifiers are used before released ones come around again.
+        self.assertEqual(ids.allocate(), 3)
+        self.assertEqual(ids.allocate(), 1)
+
+    async def test_acquire_waits(self):
+        ids = PacketIDAllocator(size=2)
+        ids.allocate()
+        ids.allocate()
+        task = asyncio.ensure_future(ids.acquire('c'))
+        await asyncio.sleep(0)
+        self.assertFalse(task.done())
+
+        ids.release(2)
+        self.assertEqual(await task, 2)
+        self.assertEqual(ids.get(2), 'c')
+
+    async def test_acquire_cancelled(self):
+        ids = PacketIDAllocator(size=1)
+        ids.allocate()
+        first = asyncio.ensure_future(ids.acquire())
+        second = asyncio.ensure_future(ids.acquire())
+        await asyncio.sleep(0)
+
+        ids.release(1)
+        first.cancel()
+        self.assertEqual(await second, 1)
@@ -1,5 +1,6 @@
 import unittest
-from asyncmqtt.packet_publish import PublishPacket
+from asyncmqtt import MQTTException
+from asyncmqtt.packet_publish import PublishPacket, SharedPublish
 
 
 class PublishPacketTests(unittest.TestCase):
@@ -30,3 +31,115 @@ class PublishPacketTests(unittest.TestCase):
         self.assertEqual(pp.topic_name, pp2.topic_name)
         self.assertEqual(pp.data, pp2.data)
         self.assertEqual(pp_bytes, pp2.to_bytes())
+
+    def test_malformed(self):
+        for frame in (b'\x30\x00', b'\x30\x01\x00', b'\x30\x05\x00\x09moo', b'\x32\x05\x00\x03moo',
+                      b'\x30\x05\x00\x03m'):
+            with self.assertRaises(MQTTException):
+                PublishPacket.from_bytes(frame)
+
+    def test_lazy_decode(self):
+        pp = PublishPacket.build('moo/cow', b'cows go moo', 0x1234, False, 1, True)
+        pp2 = PublishPacket.from_bytes(pp.to_bytes())
+
+        self.assertIsNone(pp2._variable_header)
+        self.assertIsNone(pp2._payload)
+        self.assertIsInstance(pp2.data, memoryview)
+        self.assertEqual(pp2.data_bytes, b'cows go moo')
+        self.assertEqual(pp2.topic_name, 'moo/cow')
+        self.assertEqual(pp2.packet_id, 0x1234)
+        self.assertEqual(pp2.qos, 1)
+        self.assertTrue(pp2.retain_flag)
+        self.assertIsNone(pp2._variable_header)
+
+    def test_lazy_headers_materialize(self):
+        pp = PublishPacket.build('moo', b'cows go moo', None, False, 0, False)
+        pp2 = PublishPacket.from_bytes(pp.to_bytes())
+
+        self.assertEqual(pp2.variable_header.topic_name, 'moo')
+        self.assertEqual(pp2.payload.data, b'cows go moo')
+
+        pp2.topic_name = 'cow'
+        pp3 = PublishPacket.from_bytes(pp2.to_bytes())
+        self.assertEqual(pp3.topic_name, 'cow')
+        self.assertEqual(pp3.data, b'cows go moo')
+
+    def test_lazy_flags_reencode(self):
+        pp = PublishPacket.build('moo', b'cows go moo', 1, False, 1, False)
+        pp2 = PublishPacket.from_bytes(pp.to_bytes())
+        pp2.dup_flag = True
+
+        pp3 = PublishPacket.from_bytes(pp2.to_bytes())
+        self.assertTrue(pp3.dup_flag)
+        self.assertEqual(pp3.packet_id, 1)
+        self.assertEqual(pp3.data, b'cows go moo')
+
+    def test_lazy_packet_id_patch(self):
+        pp = PublishPacket.build('moo', b'cows go moo', 0, False, 1, False)
+        pp2 = PublishPacket.from_bytes(pp.to_bytes())
+        pp2.packet_id = 0x1234
+        pp2.dup_flag = True
+
+        self.assertIsNone(pp2._variable_header)
+        header, data = pp2.to_buffers()
+        self.assertIsInstance(data, memoryview)
+        pp3 = PublishPacket.from_bytes(header + data)
+        self.assertEqual(pp3.packet_id, 0x1234)
+        self.assertTrue(pp3.dup_flag)
+        self.assertEqual(pp3.data, b'cows go moo')
+        self.assertEqual(pp2.variable_header.packet_id, 0x1234)
+
+    def test_to_buffers_no_copy(self):
+        data = bytearray(b'x' * 65536)
+        for payload in (bytes(data), data, memoryview(data)):
+            pp = PublishPacket.build('moo', payload, 1, False, 1, False)
+            buffers = pp.to_buffers()
+
+            self.assertEqual(len(buffers), 2)
+            self.assertIs(buffers[1], payload)
+            self.assertEqual(b''.join(buffers), pp.to_bytes())
+
+            pp2 = PublishPacket.from_bytes(b''.join(buffers))
+            self.assertEqual(pp2.data, data)
+
+    def test_to_buffers_empty_payload(self):
+        pp = PublishPacket.build('moo', b'', None, False, 0, False)
+        self.assertEqual(len(pp.to_buffers()), 1)
+        self.assertEqual(PublishPacket.from_bytes(pp.to_bytes()).data, b'')
+
+    def test_lazy_qos_change_reencodes(self):
+        pp = PublishPacket.build('moo', b'cows go moo', 5, False, 1, False)
+        pp2 = PublishPacket.from_bytes(pp.to_bytes())
+        pp2.qos = 0
+        pp2.packet_id = None
+
+        pp3 = PublishPacket.from_bytes(pp2.to_bytes())
+        self.assertEqual(pp3.qos, 0)
+        self.assertIsNone(pp3.packet_id)
+        self.assertEqual(pp3.data, b'cows go moo')
+
+
+class SharedPublishTests(unittest.TestCase):
+    def test_copies(self):
+        payload = b'x' * 200
+        received = PublishPacket.from_bytes(PublishPacket.build('moo/cow', payload, 7, False, 2, True).to_bytes())
+        shared = SharedPublish.from_packet(received)
+
+        for qos, packet_id, retain in ((0, None, False), (1, 1, False), (2, 0xbeef, True)):
+            copy = shared.copy(qos, packet_id, retain)
+            expected = PublishPacket.build('moo/cow', payload, packet_id, False, qos, retain)
+            self.assertEqual(copy.to_bytes(), expected.to_bytes())
+            self.assertIs(copy.to_buffers()[-1], shared.data)
+
+        copy = shared.copy(1, 5)
+        copy.dup_flag = True
+        packet = PublishPacket.from_bytes(copy.to_bytes())
+        self.assertTrue(packet.dup_flag)
+        self.assertEqual(packet.packet_id, 5)
+        self.assertEqual(packet.data, payload)
+
+    def test_headers_shared(self):
+        shared = SharedPublish('moo', b'cows')
+        self.assertIs(shared.copy(1, 1).to_buffers()[0], shared.copy(1, 2).to_buffers()[0])
+        self.assertEqual(b''.join(shared.buffers()), PublishPacket.build('moo', b'cows', None, False, 0, False).to_bytes())
+        self.assertEqual(len(SharedPublish('moo', b'').buffers()), 1)
@@ -0,0 +1,22 @@
+import unittest
+
+from asyncmqtt.packet import MQTTFixedHeader, PUBACK, PUBREC, PUBREL, PUBCOMP, UNSUBACK, DISCONNECT, PacketIDVariableHeader
+from asyncmqtt.packet_ping import PingReqPacket, PingRespPacket
+from asyncmqtt.packet_template import *
+
+
+class PacketTemplateTests(unittest.TestCase):
+    def test_constant_packets(self):
+        self.assertEqual(PINGREQ_BYTES, bytes(MQTTFixedHeader(PINGREQ).to_bytes()))
+        self.assertEqual(PINGRESP_BYTES, bytes(MQTTFixedHeader(PINGRESP).to_bytes()))
+        self.assertEqual(DISCONNECT_BYTES, bytes(MQTTFixedHeader(DISCONNECT).to_bytes()))
+        self.assertIs(PingReqPacket().to_bytes(), PINGREQ_BYTES)
+        self.assertIs(PingRespPacket().to_bytes(), PINGRESP_BYTES)
+
+    def test_packet_id_templates(self):
+        for build, packet_type, flags in ((puback, PUBACK, 0), (pubrec, PUBREC, 0), (pubrel, PUBREL, 2),
+                                          (pubcomp, PUBCOMP, 0), (unsuback, UNSUBACK, 0)):
+            for packet_id in (1, 0x1234, 0xffff):
+                expected = bytes(MQTTFixedHeader(packet_type, flags, 2).to_bytes()) + \
+                    bytes(PacketIDVariableHeader(packet_id).to_bytes())
+                self.assertEqual(build(packet_id), expected)
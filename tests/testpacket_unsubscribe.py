@@ -0,0 +1,19 @@
+import unittest
+from asyncmqtt import MQTTException
+from asyncmqtt.packet_unsubscribe import UnsubscribePacket
+
+
+class UnsubscribePacketTests(unittest.TestCase):
+    def test_marshal_demarshal(self):
+        up = UnsubscribePacket.build(['a/+', 'b/#'], 3)
+        up_bytes = up.to_bytes()
+        self.assertEqual(up_bytes[0], 0xa2)
+
+        up2 = UnsubscribePacket.from_bytes(up_bytes)
+        self.assertEqual(up2.topics, ['a/+', 'b/#'])
+        self.assertEqual(up2.packet_id, 3)
+        self.assertEqual(up_bytes, up2.to_bytes())
+
+    def test_topic_overrun(self):
+        with self.assertRaises(MQTTException):
+            UnsubscribePacket.from_bytes(b'\xa2\x07\x00\x03\x00\x32abc')
@@ -0,0 +1,69 @@
+import os
+import tempfile
+import unittest
+
+from asyncmqtt.packet_publish import PublishPacket, SharedPublish
+from asyncmqtt.retained import RetainedStore
+
+
+class RetainedStoreTests(unittest.TestCase):
+    def retain(self, store, topic, data=b'moo', qos=0):
+        store.set(SharedPublish(topic, data), qos)
+
+    def topics(self, matched):
+        return sorted(shared.topic_name for shared, qos in matched)
+
+    def test_set_get_clear(self):
+        store = RetainedStore()
+        self.retain(store, 'moo/cow', b'first', 1)
+        self.retain(store, 'moo/cow', b'second', 2)
+        shared, qos = store.get('moo/cow')
+        self.assertEqual((shared.data, qos), (b'second', 2))
+        self.assertEqual(len(store), 1)
+
+        self.retain(store, 'moo/cow', b'')
+        self.assertIsNone(store.get('moo/cow'))
+        self.assertEqual(store.root.children, {})
+        self.assertEqual(store.bytes, 0)
+
+    def test_match(self):
+        store = RetainedStore()
+        for topic in ('moo', 'moo/cow', 'moo/cow/calf', 'moo/bull', 'oink/pig', '$SYS/load'):
+            self.retain(store, topic)
+        self.assertEqual(self.topics(store.match('moo/cow')), ['moo/cow'])
+        self.assertEqual(self.topics(store.match('moo/+')), ['moo/bull', 'moo/cow'])
+        self.assertEqual(self.topics(store.match('moo/#')), ['moo', 'moo/bull', 'moo/cow', 'moo/cow/calf'])
+        self.assertEqual(self.topics(store.match('+/+/calf')), ['moo/cow/calf'])
+        self.assertEqual(self.topics(store.match('#')), ['moo', 'moo/bull', 'moo/cow', 'moo/cow/calf', 'oink/pig'])
+        self.assertEqual(self.topics(store.match('+/load')), [])
+        self.assertEqual(self.topics(store.match('$SYS/#')), ['$SYS/load'])
+        self.assertEqual(store.match('neigh/+'), [])
+
+    def test_eviction(self):
+        store = RetainedStore(max_messages=2)
+        for topic in ('a', 'b', 'c'):
+            self.retain(store, topic)
+        self.assertEqual(self.topics(store.match('#')), ['b', 'c'])
+        self.assertEqual(store.stats()['evictions'], 1)
+
+        store = RetainedStore(max_bytes=100)
+        self.retain(store, 'a', b'x' * 60)
+        self.retain(store, 'b', b'x' * 30)
+        self.retain(store, 'c', b'x' * 30)
+        self.assertEqual(self.topics(store.match('#')), ['b', 'c'])
+        self.assertLessEqual(store.bytes, 100)
+
+    def test_snapshot(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'retained')
+            store = RetainedStore(snapshot_path=path)
+            self.retain(store, 'moo/cow', b'x' * 1000, 1)
+            self.retain(store, 'oink', b'pig', 0)
+            store.snapshot()
+
+            store = RetainedStore(snapshot_path=path)
+            shared, qos = store.get('moo/cow')
+            self.assertEqual((bytes(shared.data), qos), (b'x' * 1000, 1))
+            packet = PublishPacket.from_bytes(b''.join(shared.buffers(retain=True)))
+            self.assertTrue(packet.retain_flag)
+            self.assertEqual(self.topics(store.match('#')), ['moo/cow', 'oink'])
@@ -0,0 +1,111 @@
+import asyncio
+import unittest
+
+from asyncmqtt import MQTTException
+from asyncmqtt.router import Subscription, TopicTrie, TopicMatchCache, topic_matches
+
+
+class TopicTrieTests(unittest.TestCase):
+    def setUp(self):
+        self.trie = TopicTrie()
+
+    def add(self, *topic_filters):
+        for topic_filter in topic_filters:
+            self.trie.add(Subscription(topic_filter, 0, print))
+
+    def matches(self, topic):
+        return sorted(s.topic_filter for s in self.trie.match(topic))
+
+    def test_match(self):
+        self.add('a/b/c', 'a/+/c', 'a/#', '+/+/+', '#', 'a/b', 'b/#')
+        self.assertEqual(self.matches('a/b/c'), ['#', '+/+/+', 'a/#', 'a/+/c', 'a/b/c'])
+        self.assertEqual(self.matches('a/b'), ['#', 'a/#', 'a/b'])
+        self.assertEqual(self.matches('a'), ['#', 'a/#'])
+        self.assertEqual(self.matches('c/d/e/f'), ['#'])
+
+    def test_match_empty_levels(self):
+        self.add('+/+', '/#', 'a//b')
+        self.assertEqual(self.matches('/x'), ['+/+', '/#'])
+        self.assertEqual(self.matches('a//b'), ['a//b'])
+
+    def test_match_dollar_topics(self):
+        self.add('#', '+/monitor', '$SYS/#', '$SYS/+')
+        self.assertEqual(self.matches('$SYS/monitor'), ['$SYS/#', '$SYS/+'])
+        self.assertEqual(self.matches('x/monitor'), ['#', '+/monitor'])
+
+    def test_remove(self):
+        self.add('a/+/c', 'a/+/c', 'a/#')
+        self.assertEqual(len(self.trie), 3)
+        self.assertEqual(len(self.trie.remove('a/+/c')), 2)
+        self.assertEqual(self.trie.remove('a/+/c'), [])
+        self.assertEqual(self.matches('a/b/c'), ['a/#'])
+        self.trie.remove('a/#')
+        self.assertEqual(len(self.trie), 0)
+        self.assertEqual(self.trie.root.children, {})
+
+    def test_remove_handler(self):
+        first, second = Subscription('a', 0, print), Subscription('a', 0, repr)
+        self.trie.add(first)
+        self.trie.add(second)
+        self.assertEqual(self.trie.remove('a', repr), [second])
+        self.assertEqual(self.trie.match('a'), [first])
+
+    def test_invalid_filter(self):
+        for topic_filter in ('', 'a/#/b', 'a/b#', 'a+/b'):
+            with self.assertRaises(MQTTException):
+                self.add(topic_filter)
+
+    def test_queue_subscription(self):
+        subscription = Subscription('a')
+        subscription.deliver('message')
+        self.assertEqual(asyncio.run(subscription.next_message()), 'message')
+
+
+class TopicMatchCacheTests(unittest.TestCase):
+    def setUp(self):
+        self.cache = TopicMatchCache(maxsize=2)
+
+    def test_topic_matches(self):
+        trie = TopicTrie()
+        filters = ('a/b', 'a/+', 'a/#', '#', '+', '+/+', '/+', 'a/+/c', '$SYS/#', '+/b')
+        for topic_filter in filters:
+            trie.add(Subscription(topic_filter, 0, print))
+        for topic in ('a', 'a/b', 'a/b/c', '/x', '$SYS/a', 'x/b', ''):
+            expected = sorted(s.topic_filter for s in trie.match(topic))
+            self.assertEqual(sorted(f for f in filters if topic_matches(f, topic)), expected, topic)
+
+    def test_hits(self):
+        self.cache.add(Subscription('a/+', 0, print))
+        self.assertEqual(len(self.cache.match('a/b')), 1)
+        self.assertEqual(len(self.cache.match('a/b')), 1)
+        self.assertEqual(self.cache.stats()['hits'], 1)
+        self.assertEqual(self.cache.stats()['misses'], 1)
+        self.assertEqual(self.cache.stats()['hit_rate'], 0.5)
+
+    def test_invalidation(self):
+        self.cache.add(Subscription('a/+', 0, print))
+        self.cache.match('a/b')
+        self.cache.match('c')
+        self.cache.add(Subscription('a/b', 0, print))
+        self.assertEqual(list(self.cache.entries), ['c'])
+        self.assertEqual(len(self.cache.match('a/b')), 2)
+
+        self.cache.remove('a/+')
+        self.assertNotIn('a/b', self.cache.entries)
+        self.assertEqual(len(self.cache.match('a/b')), 1)
+        self.assertEqual(self.cache.stats()['invalidations'], 2)
+
+    def test_lru(self):
+        for topic in ('a', 'b', 'a', 'c'):
+            self.cache.match(topic)
+        self.assertEqual(list(self.cache.entries), ['a', 'c'])
+
+    def test_fifo(self):
+        cache = TopicMatchCache(maxsize=2, policy='fifo')
+        for topic in ('a', 'b', 'a', 'c'):
+            cache.match(topic)
+        self.assertEqual(list(cache.entries), ['b', 'c'])
+
+    def test_invalid_policy(self):
+        with self.assertRaises(MQTTException):
+            TopicMatchCache(policy='random')
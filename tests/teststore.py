@@ -0,0 +1,121 @@
+import os
+import tempfile
+import unittest
+
+from asyncmqtt.store import SegmentLog
+
+
+class SegmentLogTests(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.directory = self.tmpdir.name
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_append_read_remove(self):
+        log = SegmentLog(self.directory, segment_size=4096)
+        first = log.append([b'moo', memoryview(b'cow')])
+        second = log.append(b'cows go moo')
+        self.assertEqual(log.read(first), b'moocow')
+        self.assertEqual(list(log.records()), [(first, b'moocow'), (second, b'cows go moo')])
+
+        log.remove(first)
+        log.remove(first)
+        self.assertNotIn(first, log)
+        self.assertEqual(len(log), 1)
+        log.close()
+
+    def test_recover(self):
+        log = SegmentLog(self.directory, segment_size=4096)
+        seqs = [log.append(b'message %d' % i) for i in range(10)]
+        for seq in seqs[:7]:
+            log.remove(seq)
+        log.close()
+
+        log = SegmentLog(self.directory, segment_size=4096)
+        self.assertEqual([data for seq, data in log.records()], [b'message %d' % i for i in range(7, 10)])
+        self.assertGreater(log.append(b'more'), seqs[-1])
+        log.close()
+
+    def test_torn_tail(self):
+        log = SegmentLog(self.directory, segment_size=4096)
+        log.append(b'intact')
+        seq = log.append(b'torn')
+        segment, offset, length = log.index[seq]
+        segment.mm[offset] ^= 0xff
+        log.close()
+
+        log = SegmentLog(self.directory, segment_size=4096)
+        self.assertEqual([data for seq, data in log.records()], [b'intact'])
+        seq = log.append(b'after')
+        log.close()
+
+        log = SegmentLog(self.directory, segment_size=4096)
+        self.assertEqual([data for seq, data in log.records()], [b'intact', b'after'])
+        log.close()
+
+    def test_segments_reclaimed(self):
+        log = SegmentLog(self.directory, segment_size=512)
+        seqs = [log.append(b'x' * 200) for i in range(6)]
+        self.assertEqual(len(log.segments), 3)
+        for seq in seqs[:4]:
+            log.remove(seq)
+        self.assertEqual(len(log.segments), 1)
+        self.assertEqual(len(os.listdir(self.directory)), 1)
+        self.assertEqual(log.stats()['segments_reclaimed'], 2)
+        log.close()
+
+    def test_rewind_when_empty(self):
+        log = SegmentLog(self.directory, segment_size=256)
+        for i in range(20):
+            log.remove(log.append(b'x' * 100))
+        self.assertEqual(len(log.segments), 1)
+        self.assertEqual(log.segments[0].end, 0)
+        log.close()
+
+        log = SegmentLog(self.directory, segment_size=256)
+        self.assertEqual(len(log), 0)
+        log.close()
+
+    def test_compact(self):
+        log = SegmentLog(self.directory, segment_size=1024)
+        keep = log.append(b'keep')
+        seqs = [log.append(b'x' * 100) for i in range(12)]
+        for seq in seqs:
+            log.remove(seq)
+        self.assertEqual(len(log.segments), 2)
+        log.compact()
+        self.assertEqual(len(log.segments), 1)
+        self.assertEqual(log.stats()['compactions'], 1)
+        self.assertEqual(log.read(keep), b'keep')
+        log.close()
+
+        log = SegmentLog(self.directory, segment_size=1024)
+        self.assertEqual(list(log.records()), [(keep, b'keep')])
+        log.close()
+
+    def test_state(self):
+        log = SegmentLog(self.directory, segment_size=1024)
+        keep = log.append(b'keep')
+        log.set_state(keep, b'one')
+        log.set_state(keep, b'two')
+        seqs = [log.append(b'x' * 100) for i in range(12)]
+        for seq in seqs:
+            log.remove(seq)
+        log.compact()
+        self.assertEqual(len(log.segments), 1)
+        self.assertEqual(log.get_state(keep), b'two')
+        log.close()
+
+        log = SegmentLog(self.directory, segment_size=1024)
+        self.assertEqual(log.get_state(keep), b'two')
+        log.remove(keep)
+        self.assertIsNone(log.get_state(keep))
+        log.close()
+
+    def test_large_record(self):
+        log = SegmentLog(self.directory, segment_size=256)
+        seq = log.append(b'x' * 1000)
+        self.assertEqual(log.read(seq), b'x' * 1000)
+        log.close()
@@ -1,5 +1,6 @@
 import unittest
 
+from asyncmqtt import MQTTException
 from asyncmqtt.util import *
 
 
@@ -20,6 +21,11 @@ class UtilTests(unittest.TestCase):
 
         self.assertEqual(value, value2)
 
+    def test_data_marshal_demarshal(self):
+        encoded = encode_data_with_length(b'cows go moo')
+        self.assertEqual(encoded[:2], b'\x00\x0b')
+        self.assertEqual(decode_data(memoryview(encoded + b'trailing')), b'cows go moo')
+
     def test_int_marshal_demarshal_large(self):
         value = 1024768
         as_bytes = int_to_bytes(value, 3)
@@ -45,3 +51,40 @@ class UtilTests(unittest.TestCase):
             decstrb = decode_string(encstrb)
 
             self.assertEqual(encstr, decstrb)
+
+    def test_topic_cache_decode(self):
+        cache = TopicCache(maxsize=2)
+        first = cache.decode(b'a/b')
+        second = cache.decode(memoryview(b'xa/b')[1:])
+
+        self.assertEqual(first, 'a/b')
+        self.assertIs(first, second)
+        self.assertEqual((cache.decode_hits, cache.decode_misses), (1, 1))
+
+    def test_topic_cache_encode(self):
+        cache = TopicCache(maxsize=2)
+        encoded = cache.encode('a/b')
+
+        self.assertEqual(encoded, encode_string('a/b'))
+        self.assertIs(cache.encode('a/b'), encoded)
+        self.assertEqual((cache.encode_hits, cache.encode_misses), (1, 1))
+
+    def test_topic_cache_bounded(self):
+        cache = TopicCache(maxsize=2)
+        for topic in ('a', 'b', 'a', 'c'):
+            cache.encode(topic)
+            cache.decode(topic.encode('utf-8'))
+
+        self.assertEqual(list(cache.encoded), ['a', 'c'])
+        self.assertEqual(list(cache.decoded), [b'a', b'c'])
+        self.assertEqual(cache.stats()['encode_misses'], 3)
+
+    def test_decode_topic_at(self):
+        data = b'\xff' + encode_string('café/moo') + b'\x01'
+        topic, needle = decode_topic_at(data, 1)
+
+        self.assertEqual(topic, 'café/moo')
+        self.assertEqual(data[needle], 1)
+
+        with self.assertRaises(MQTTException):
+            decode_topic_at(b'\x00\x32abc', 0)
@@ -0,0 +1,101 @@
+import asyncio
+import unittest
+
+from asyncmqtt.writer import OutboundWriter
+
+
+class RecordingTransport:
+    def __init__(self):
+        self.calls = []
+
+    def write(self, data):
+        self.calls.append([data])
+
+    def writelines(self, buffers):
+        self.calls.append(list(buffers))
+
+
+class OutboundWriterTests(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.transport = RecordingTransport()
+        self.writer = OutboundWriter(self.transport, max_bytes=10)
+
+    async def test_coalesce(self):
+        for i in range(3):
+            self.writer.write([b'%d' % i])
+        self.assertEqual(self.transport.calls, [])
+        await asyncio.sleep(0)
+        self.assertEqual(self.transport.calls, [[b'0', b'1', b'2']])
+        self.assertEqual(self.writer.stats()['flushes'], 1)
+
+    async def test_max_bytes(self):
+        self.writer.write([b'12345'])
+        self.writer.write([memoryview(b'67890')])
+        self.assertEqual(len(self.transport.calls), 1)
+        self.assertEqual(self.writer.stats()['control_bytes'], 0)
+
+    async def test_max_delay(self):
+        writer = OutboundWriter(self.transport, max_delay=0.01)
+        writer.write([b'a'])
+        await asyncio.sleep(0)
+        self.assertEqual(self.transport.calls, [])
+        await asyncio.sleep(0.02)
+        self.assertEqual(self.transport.calls, [[b'a']])
+
+    async def test_urgent(self):
+        self.writer.write([b'a'])
+        self.writer.write([b'b'], urgent=True)
+        self.assertEqual(self.transport.calls, [[b'a', b'b']])
+        await asyncio.sleep(0)
+        self.assertEqual(len(self.transport.calls), 1)
+
+    async def test_hold(self):
+        self.writer.write([b'a'])
+        self.writer.hold()
+        self.writer.write([b'b'], urgent=True)
+        self.writer.write_now(b'stream')
+        self.assertEqual(self.transport.calls, [[b'a'], [b'stream']])
+        self.writer.release()
+        self.assertEqual(self.transport.calls[-1], [b'b'])
+
+    async def test_clear(self):
+        self.writer.write([b'a'])
+        self.writer.clear()
+        await asyncio.sleep(0)
+        self.assertEqual(self.transport.calls, [])
+
+    async def test_control_first(self):
+        writer = OutboundWriter(self.transport)
+        writer.write([b'publish'], bulk=True)
+        writer.write([b'ack'])
+        writer.flush()
+        self.assertEqual(self.transport.calls, [[b'ack', b'publish']])
+
+    async def test_paused(self):
+        writer = OutboundWriter(self.transport, max_control_streak=2)
+        writer.pause()
+        writer.write([b'p1'], bulk=True)
+        writer.write([b'p2'], bulk=True)
+        for ack in (b'a1', b'a2', b'a3'):
+            writer.write([ack], urgent=True)
+        self.assertEqual(self.transport.calls, [[b'a1'], [b'a2'], [b'a3', b'p1']])
+        self.assertEqual(writer.stats()['bulk_packets'], 1)
+
+        writer.resume()
+        self.assertEqual(self.transport.calls[-1], [b'p2'])
+        self.assertEqual(writer.stats()['bulk_bytes'], 0)
+
+    async def test_bulk_budget(self):
+        for i in range(3):
+            self.writer.write([b'123456'], bulk=True)
+        self.assertEqual(self.transport.calls, [[b'123456', b'123456']])
+        self.writer.write([b'ack'])
+        await asyncio.sleep(0)
+        self.assertEqual(self.transport.calls[-1], [b'ack', b'123456'])
+
+    async def test_flush_all(self):
+        self.writer.pause()
+        self.writer.write([b'p'], bulk=True)
+        self.writer.write([b'a'])
+        self.writer.flush_all()
+        self.assertEqual(self.transport.calls, [[b'a', b'p']])